@@ -0,0 +1,199 @@
+import heapq
+import itertools
+import math
+import re
+import threading
+import time
+
+from telemetry import Counter, Gauge
+
+# =========================================================
+# ADAPTIVE CONCURRENCY LIMIT (AIMD)
+# =========================================================
+#
+# Jumlah request /chat yang boleh diproses bersamaan tidak tetap, tapi
+# mengikuti latensi upstream (Claude / OpenAI):
+#   - request selesai di bawah latency_target → limit += 1/limit
+#     (naik ~1 per "putaran" penuh, additive increase)
+#   - request lambat / 502-504 / error → limit *= backoff
+#     (multiplicative decrease, maks 1x per cooldown supaya satu episode
+#     lambat tidak menurunkan limit berkali-kali)
+# Request di atas limit menunggu di antrean prioritas (bukan di
+# CHAT_EXECUTOR), jadi saat provider melambat antrean tidak tumbuh tanpa
+# batas: antrean penuh → request prioritas terendah dibuang (503).
+
+PRIORITY_PAYMENT = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_NAMES = {PRIORITY_PAYMENT: "payment", PRIORITY_DEFAULT: "default"}
+
+PAYMENT_INTENTS = {"kirim_bukti_bayar", "ingin_bayar"}
+
+# intent baru diketahui setelah klasifikasi LLM (di dalam request), jadi
+# admission memakai kata kunci pembayaran + intent turn sebelumnya (query
+# SQLite, hanya saat limiter penuh, lihat AdaptiveLimiter.would_wait)
+PAYMENT_PATTERN = re.compile(
+    r"\b(bukti|transfe?r|tf|trf|bayar|dibayar|pembayaran|lunas|"
+    r"rekening|rek|va|virtual\s+account|qris|struk|kwitansi)\b",
+    flags=re.I,
+)
+
+LIMIT = Gauge("ppj_limiter_limit", "Batas concurrency adaptif saat ini", ("limiter",))
+INFLIGHT = Gauge("ppj_limiter_inflight", "Request yang sedang diproses", ("limiter",))
+WAITING = Gauge("ppj_limiter_waiting", "Request yang menunggu admission", ("limiter",))
+ADMITTED_TOTAL = Counter("ppj_limiter_admitted_total", "Request yang diizinkan", ("limiter", "priority"))
+SHED_TOTAL = Counter(
+    "ppj_limiter_shed_total", "Request yang ditolak admission", ("limiter", "priority", "reason")
+)
+
+
+def request_priority(user_query, last_intent_child=None):
+    if last_intent_child in PAYMENT_INTENTS:
+        return PRIORITY_PAYMENT
+    if user_query and PAYMENT_PATTERN.search(user_query):
+        return PRIORITY_PAYMENT
+    return PRIORITY_DEFAULT
+
+
+class LimiterRejected(RuntimeError):
+    def __init__(self, reason, priority, retry_after):
+        super().__init__(f"request ditolak ({reason}, priority={PRIORITY_NAMES.get(priority, priority)})")
+        self.reason = reason
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "state")
+
+    def __init__(self, priority, seq):
+        self.priority = priority
+        self.seq = seq
+        self.state = "waiting"  # waiting | admitted | shed
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        name,
+        min_limit=2,
+        max_limit=16,
+        initial_limit=8,
+        latency_target=30.0,
+        max_waiting=32,
+        wait_timeout=30.0,
+        backoff=0.75,
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.latency_target = latency_target
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.backoff = backoff
+        self.inflight = 0
+        self.avg_latency = None
+        self._last_decrease = 0.0
+        self._waiters = []  # heap _Waiter: prioritas tertinggi, lalu FIFO
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+        LIMIT.set_function(lambda: self.limit, limiter=name)
+        INFLIGHT.set_function(lambda: self.inflight, limiter=name)
+        WAITING.set_function(lambda: len(self._waiters), limiter=name)
+
+    def retry_after(self):
+        if self.avg_latency is None:
+            return 5
+        return max(1, min(math.ceil(self.avg_latency), 60))
+
+    def _reject(self, reason, priority):
+        SHED_TOTAL.inc(limiter=self.name, priority=PRIORITY_NAMES.get(priority, priority), reason=reason)
+        return LimiterRejected(reason, priority, self.retry_after())
+
+    def _dispatch(self):
+        admitted = False
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = heapq.heappop(self._waiters)
+            waiter.state = "admitted"
+            self.inflight += 1
+            admitted = True
+        if admitted:
+            self._cond.notify_all()
+
+    def would_wait(self):
+        """
+        True jika request baru tidak langsung mendapat slot. Tanpa lock
+        (perkiraan): dipakai supaya klasifikasi prioritas yang mahal hanya
+        dijalankan saat prioritas benar-benar menentukan urutan antre.
+        """
+        return bool(self._waiters) or self.inflight >= int(self.limit)
+
+    def acquire(self, priority=PRIORITY_DEFAULT, timeout=None):
+        """Blok sampai dapat slot; raise LimiterRejected jika dibuang / timeout."""
+        timeout = self.wait_timeout if timeout is None else timeout
+        with self._cond:
+            if self.inflight < int(self.limit) and not self._waiters:
+                self.inflight += 1
+                ADMITTED_TOTAL.inc(limiter=self.name, priority=PRIORITY_NAMES.get(priority, priority))
+                return
+
+            if len(self._waiters) >= self.max_waiting:
+                # buang waiter prioritas terendah (paling baru) jika lebih
+                # rendah dari request ini, kalau tidak request ini yang ditolak
+                worst = max(self._waiters)
+                if worst.priority <= priority:
+                    raise self._reject("queue_full", priority)
+                self._waiters.remove(worst)
+                heapq.heapify(self._waiters)
+                worst.state = "shed"
+                self._cond.notify_all()
+
+            waiter = _Waiter(priority, next(self._seq))
+            heapq.heappush(self._waiters, waiter)
+            deadline = time.monotonic() + timeout
+            while waiter.state == "waiting":
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+                    raise self._reject("timeout", priority)
+                self._cond.wait(remaining)
+
+            if waiter.state == "shed":
+                raise self._reject("shed", priority)
+            ADMITTED_TOTAL.inc(limiter=self.name, priority=PRIORITY_NAMES.get(priority, priority))
+
+    def release(self, latency_seconds, overloaded=False):
+        """
+        Kembalikan slot. overloaded=True untuk sinyal upstream kelebihan
+        beban (timeout, 502-504, error).
+        """
+        with self._cond:
+            self.inflight -= 1
+            if self.avg_latency is None:
+                self.avg_latency = latency_seconds
+            else:
+                self.avg_latency = 0.8 * self.avg_latency + 0.2 * latency_seconds
+
+            if overloaded or latency_seconds > self.latency_target:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.latency_target:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._dispatch()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limiter": self.name,
+                "limit": round(self.limit, 2),
+                "inflight": self.inflight,
+                "waiting": len(self._waiters),
+                "avg_latency": self.avg_latency,
+            }
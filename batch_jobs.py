@@ -0,0 +1,297 @@
+import json
+import os
+import time
+import uuid
+
+# =========================================================
+# OFFLINE BATCH JOBS (OPENAI BATCH API / LOCAL STAND-IN)
+# =========================================================
+#
+# Alur:
+#   1. build request  → {"custom_id", "method", "url", "body"}
+#   2. tulis JSONL    → workdir/<name>_<n>.jsonl (maks MAX_REQUESTS_PER_FILE)
+#   3. submit         → backend.submit(path, endpoint)
+#   4. poll           → sampai status completed / failed / expired
+#   5. merge          → dict custom_id -> body response
+#
+# State batch (id per file) disimpan di workdir/<name>.state.json, jadi
+# job semalam yang terputus cukup dilanjutkan polling tanpa submit ulang.
+# Saat resume, request yang belum tercakup file batch lama ditambahkan
+# sebagai file baru (lihat _merge_requests), tidak diabaikan diam-diam.
+# State baru dihapus lewat finish_batch() setelah caller menyimpan hasil;
+# batch yang berakhir failed / expired / cancelled tetap tercatat di state
+# (id dikosongkan) dan di-submit ulang pada run berikutnya.
+
+MAX_REQUESTS_PER_FILE = 50_000
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def make_request(custom_id, url, body):
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": url,
+        "body": body,
+    }
+
+
+def write_batch_files(requests, workdir, name, max_per_file=MAX_REQUESTS_PER_FILE):
+    os.makedirs(workdir, exist_ok=True)
+
+    paths = []
+    fh = None
+    count = 0
+    for req in requests:
+        if fh is None or count >= max_per_file:
+            if fh:
+                fh.close()
+            path = os.path.join(workdir, f"{name}_{len(paths):03d}.jsonl")
+            paths.append(path)
+            fh = open(path, "w", encoding="utf-8")
+            count = 0
+        fh.write(json.dumps(req, ensure_ascii=False) + "\n")
+        count += 1
+
+    if fh:
+        fh.close()
+
+    print(f"[BATCH] Wrote {len(paths)} request file(s) → {workdir}")
+    return paths
+
+
+def parse_output_lines(lines):
+    """
+    Format output mengikuti OpenAI Batch API:
+    {"custom_id", "response": {"status_code", "body"}, "error"}
+    Return (results, errors) keyed by custom_id.
+    """
+    results = {}
+    errors = {}
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        rec = json.loads(line)
+        cid = rec.get("custom_id")
+        response = rec.get("response") or {}
+        if rec.get("error") or response.get("status_code") != 200:
+            errors[cid] = rec.get("error") or response.get("body")
+            continue
+        results[cid] = response.get("body")
+    return results, errors
+
+# =========================================================
+# BACKENDS
+# =========================================================
+
+class OpenAIBatchBackend:
+    def __init__(self, client, completion_window="24h"):
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, path, endpoint):
+        with open(path, "rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=endpoint,
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        return self.client.batches.retrieve(batch_id).status
+
+    def fetch_results(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                lines.extend(self.client.files.content(file_id).text.splitlines())
+        return parse_output_lines(lines)
+
+
+class LocalBatchBackend:
+    """
+    Stand-in lokal untuk test / dry-run: request dieksekusi langsung
+    lewat handler(url, body) -> response body, output ditulis dengan
+    format yang sama seperti Batch API.
+    """
+
+    def __init__(self, handler, workdir="data/batches/local"):
+        self.handler = handler
+        self.workdir = workdir
+        os.makedirs(workdir, exist_ok=True)
+
+    def _output_path(self, batch_id):
+        return os.path.join(self.workdir, f"{batch_id}_output.jsonl")
+
+    def submit(self, path, endpoint):
+        batch_id = f"local_{uuid.uuid4().hex[:12]}"
+        with open(path, "r", encoding="utf-8") as src, \
+                open(self._output_path(batch_id), "w", encoding="utf-8") as out:
+            for line in src:
+                if not line.strip():
+                    continue
+                req = json.loads(line)
+                try:
+                    body = self.handler(req["url"], req["body"])
+                    rec = {
+                        "custom_id": req["custom_id"],
+                        "response": {"status_code": 200, "body": body},
+                        "error": None,
+                    }
+                except Exception as e:
+                    rec = {
+                        "custom_id": req["custom_id"],
+                        "response": None,
+                        "error": {"message": str(e)},
+                    }
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        return batch_id
+
+    def status(self, batch_id):
+        return "completed" if os.path.exists(self._output_path(batch_id)) else "failed"
+
+    def fetch_results(self, batch_id):
+        with open(self._output_path(batch_id), "r", encoding="utf-8") as f:
+            return parse_output_lines(f)
+
+
+def sync_openai_handler(client):
+    """
+    Handler LocalBatchBackend yang memanggil API sinkron biasa.
+    """
+    def handler(url, body):
+        if url == "/v1/chat/completions":
+            return client.chat.completions.create(**body).model_dump()
+        if url == "/v1/embeddings":
+            return client.embeddings.create(**body).model_dump()
+        raise ValueError(f"endpoint tidak didukung: {url}")
+    return handler
+
+# =========================================================
+# RUNNER
+# =========================================================
+
+def _load_state(path):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def _save_state(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def run_batch(backend, requests, workdir, name, endpoint, poll_interval=60):
+    """
+    Tulis, submit, poll, lalu gabungkan hasil semua file batch.
+    Return (results, errors) keyed by custom_id. State tidak dihapus di
+    sini; panggil finish_batch() setelah hasil disimpan.
+    """
+    state_path = os.path.join(workdir, f"{name}.state.json")
+    state = _load_state(state_path)
+
+    if not state.get("batches"):
+        paths = write_batch_files(requests, workdir, name)
+        state = {"endpoint": endpoint, "batches": {p: None for p in paths}}
+        _save_state(state_path, state)
+    else:
+        print(f"[BATCH] Resuming {len(state['batches'])} batch(es) from {state_path}")
+        _merge_requests(state, requests, workdir, name)
+        _save_state(state_path, state)
+
+    for path, batch_id in state["batches"].items():
+        if batch_id is None:
+            batch_id = backend.submit(path, endpoint)
+            state["batches"][path] = batch_id
+            _save_state(state_path, state)
+            print(f"[BATCH] Submitted {path} → {batch_id}")
+
+    pending = dict(state["batches"])
+    final_status = {}
+    while pending:
+        for path, batch_id in list(pending.items()):
+            status = backend.status(batch_id)
+            if status in TERMINAL_STATUSES:
+                print(f"[BATCH] {batch_id} → {status}")
+                final_status[path] = status
+                del pending[path]
+        if pending:
+            print(f"[BATCH] Waiting for {len(pending)} batch(es)...")
+            time.sleep(poll_interval)
+
+    results = {}
+    errors = {}
+    for path, batch_id in state["batches"].items():
+        status = final_status[path]
+        if status == "completed":
+            res, err = backend.fetch_results(batch_id)
+            results.update(res)
+            errors.update(err)
+            continue
+        # batch gagal seluruhnya: semua request-nya dicatat error dan file
+        # ini di-submit ulang pada run berikutnya
+        for cid in _custom_ids(path):
+            errors[cid] = {"message": f"batch {batch_id} {status}"}
+        state["batches"][path] = None
+
+    _save_state(state_path, state)
+    print(f"[BATCH] Results={len(results)} | errors={len(errors)}")
+    return results, errors
+
+
+def _merge_requests(state, requests, workdir, name):
+    """
+    Samakan state lama dengan request run ini (mis. setelah sebagian batch
+    gagal lalu ada row baru):
+      - request yang custom_id-nya belum ada di file batch manapun ditulis
+        ke file tambahan dan di-submit bersama batch lama
+      - file yang menunggu submit ulang (id None) tapi tidak berisi satu
+        pun request run ini (sudah selesai lewat jalur lain) dibuang
+    """
+    wanted = {req["custom_id"] for req in requests}
+    known = set()
+    for path, batch_id in list(state["batches"].items()):
+        ids = set(_custom_ids(path))
+        if batch_id is None and requests and not ids & wanted:
+            print(f"[BATCH] Dropping {path}: tidak ada request yang masih dibutuhkan")
+            del state["batches"][path]
+            continue
+        known |= ids
+
+    extra = [req for req in requests if req["custom_id"] not in known]
+    if extra:
+        print(f"[BATCH] {len(extra)} request baru tidak ada di state, ditambahkan sebagai batch baru")
+        paths = write_batch_files(extra, workdir, f"{name}_more{len(state['batches']):03d}")
+        state["batches"].update({p: None for p in paths})
+
+
+def _custom_ids(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line)["custom_id"] for line in f if line.strip()]
+
+
+def finish_batch(workdir, name):
+    """
+    Panggil setelah hasil run_batch tersimpan (checkpoint / cache). State
+    dihapus supaya run berikutnya membuat batch baru, kecuali masih ada
+    batch gagal yang perlu di-submit ulang. Return True jika dihapus.
+    """
+    state_path = os.path.join(workdir, f"{name}.state.json")
+    state = _load_state(state_path)
+    if not state:
+        return False
+    retry = [p for p, batch_id in state.get("batches", {}).items() if batch_id is None]
+    if retry:
+        print(f"[BATCH] Keeping {state_path}: {len(retry)} batch(es) akan di-submit ulang")
+        return False
+    os.remove(state_path)
+    return True
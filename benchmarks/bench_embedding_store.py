@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retrieval_store import rank_candidates, retrieve_top_k  # noqa: E402
+from vector_store import DenseStore, PQStore, ProductQuantizer, pick_subspaces  # noqa: E402
+
+# =========================================================
+# BENCHMARK: MEMORY & RECALL EMBEDDING STORE
+# =========================================================
+#
+# Membandingkan jalur exact float32 dengan float16 dan PQ (+ exact re-rank)
+# pada corpus sintetis yang berkelompok (mirip embedding per intent).
+# Recall@k = irisan top-k final_score store vs top-k jalur exact.
+# Recall@k±1 menganggap hit jika final_score exact row tersebut hanya
+# selisih pembulatan (<= 1 poin) dari peringkat ke-k jalur exact.
+
+
+def synthetic_corpus(n, dim, clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    assign = rng.integers(0, clusters, size=n)
+    # jarak ke pusat cluster bervariasi supaya similarity dalam 1 cluster tersebar
+    spread = rng.uniform(0.3, 1.5, size=(n, 1)).astype(np.float32)
+    x = centers[assign] + spread * rng.normal(size=(n, dim)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    priorities = rng.integers(0, 101, size=n).astype(np.float32)
+    return x, priorities, rng
+
+
+def make_queries(x, count, rng):
+    picks = x[rng.choice(len(x), size=count, replace=False)]
+    q = picks + 0.3 * rng.normal(size=picks.shape).astype(np.float32) / np.sqrt(x.shape[1])
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def run_store(name, store, x, priorities, queries, truth, k, rerank):
+    latencies = []
+    hits = 0
+    near_hits = 0
+    for q, (expected, exact_final) in zip(queries, truth):
+        t0 = time.perf_counter()
+        sims = store.scores(None, q)
+        order, *_ = rank_candidates(
+            sims, priorities, k,
+            rerank=0 if store.exact else rerank,
+            exact_sims=lambda top: x[top] @ q,
+        )
+        latencies.append((time.perf_counter() - t0) * 1000)
+        hits += len(set(order.tolist()) & expected)
+        kth = min(exact_final[i] for i in expected)
+        near_hits += sum(1 for i in order if exact_final[i] >= kth - 1)
+
+    return {
+        "store": name,
+        "bytes_per_row": round(store.nbytes / len(x), 1),
+        "total_mb": round(store.nbytes / 2**20, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        f"recall@{k}": round(hits / (k * len(queries)), 4),
+        f"recall@{k}±1": round(near_hits / (k * len(queries)), 4),
+    }
+
+
+def legacy_pandas_ms(x, priorities, queries, k):
+    """Jalur lama: embedding list float64 + cosine_sim per row via pandas apply."""
+    import pandas as pd
+
+    df = pd.DataFrame({"embedding": x.astype(np.float64).tolist(), "priority_score": priorities})
+    latencies = []
+    for q in queries:
+        t0 = time.perf_counter()
+        sims = df["embedding"].apply(
+            lambda e: np.dot(np.array(e), q) / (np.linalg.norm(e) * np.linalg.norm(q))
+        )
+        norm = (sims - sims.min()) / (sims.max() - sims.min() + 1e-6)
+        final = (norm * 100 * 0.7 + df["priority_score"] * 0.3).round()
+        final.sort_values(ascending=False).head(k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(latencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark memory & recall embedding store")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--clusters", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--rerank", type=int, default=50)
+    parser.add_argument("--pq-subspaces", type=int, default=96)
+    parser.add_argument("--legacy", action="store_true", help="ukur juga jalur pandas lama")
+    parser.add_argument("--json", help="simpan hasil ke file JSON")
+    args = parser.parse_args()
+
+    x, priorities, rng = synthetic_corpus(args.rows, args.dim, args.clusters)
+    queries = make_queries(x, args.queries, rng)
+    truth = []
+    for q in queries:
+        order, _, _, final = retrieve_top_k(q, x, priorities, args.k)
+        truth.append((set(order.tolist()), final))
+
+    results = []
+    for dtype in (np.float32, np.float16):
+        store = DenseStore(args.dim, dtype)
+        store.append(x)
+        results.append(run_store(np.dtype(dtype).name, store, x, priorities, queries, truth, args.k, args.rerank))
+
+    m = pick_subspaces(args.dim, args.pq_subspaces)
+    t0 = time.perf_counter()
+    pq = ProductQuantizer(args.dim, m).fit(x)
+    train_s = time.perf_counter() - t0
+    store = PQStore(pq)
+    store.append(x)
+    for rerank in (0, args.rerank):
+        row = run_store(f"pq{m}+rerank{rerank}", store, x, priorities, queries, truth, args.k, rerank)
+        row["train_s"] = round(train_s, 1)
+        results.append(row)
+
+    legacy = {
+        "store": "legacy float64 lists",
+        "bytes_per_row": args.dim * 8,
+        "total_mb": round(args.rows * args.dim * 8 / 2**20, 1),
+    }
+    if args.legacy:
+        legacy["p50_ms"] = round(legacy_pandas_ms(x, priorities, queries[:3], args.k), 3)
+    results.insert(0, legacy)
+
+    print(f"rows={args.rows} dim={args.dim} queries={args.queries} k={args.k}")
+    for row in results:
+        print("  " + " | ".join(f"{key}={value}" for key, value in row.items()))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
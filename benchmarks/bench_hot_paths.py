@@ -0,0 +1,342 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+import db_init  # noqa: E402
+from data_prepare1_cleaning_normalizing import clean_text_for_model, parse_sql_values  # noqa: E402
+from retrieval_store import RetrievalIndex, retrieve_top_k  # noqa: E402
+
+# =========================================================
+# BENCHMARK: HOT PATH RETRIEVAL, DB & DATA PREP
+# =========================================================
+#
+# Corpus sintetis deterministik (seed) per ukuran, 1 SQLite DB per
+# (ukuran, dim, seed) yang di-cache di --workdir supaya run berikutnya
+# tidak membangun ulang.
+#
+#   python benchmarks/bench_hot_paths.py --sizes 1k,10k,100k --json base.json
+#   python benchmarks/bench_hot_paths.py --sizes 1k,10k,100k --baseline base.json
+#
+# 1m bisa dipakai (--sizes 1m) tapi butuh disk besar: embedding disimpan
+# sebagai JSON text (~dim x 20 byte per row). Bench yang kompleksitasnya
+# kuadratik (build_user_admin_pairs) dibatasi --max-pairs-rows.
+
+INTENTS = [
+    ("perpanjang", "tanya_tagihan"),
+    ("perpanjang", "ingin_bayar"),
+    ("perpanjang", "kirim_bukti_bayar"),
+    ("tanya_status", "status_domain"),
+    ("komplain", "website_error"),
+    ("lainnya", "tidak_jelas"),
+]
+WORDS = (
+    "kak website domain perpanjang tagihan bayar transfer invoice masa aktif hosting "
+    "sudah belum kapan berapa mohon dibantu terima kasih admin status bukti rekening "
+    "email revisi halaman error bisa tolong cek jatuh tempo paket tahun bulan"
+).split()
+TURNS_PER_CONVERSATION = 10
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    for suffix, mult in (("k", 1_000), ("m", 1_000_000)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * mult)
+    return int(text)
+
+
+def _sentence(rng, n_words):
+    return " ".join(WORDS[i] for i in rng.integers(0, len(WORDS), size=n_words))
+
+
+def _messy_text(rng):
+    """Teks mentah ala dump chat: HTML, URL, emoji, huruf besar."""
+    s = _sentence(rng, int(rng.integers(5, 30)))
+    if rng.random() < 0.3:
+        s = f"<p>{s}</p><br>"
+    if rng.random() < 0.2:
+        s += " https://contoh.co.id/invoice?id=" + str(int(rng.integers(1e6)))
+    if rng.random() < 0.3:
+        s += " 🙏😊"
+    return s.upper() if rng.random() < 0.1 else s.capitalize()
+
+
+def _unit_rows(x):
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+# =========================================================
+# CORPUS
+# =========================================================
+
+def build_db(path, n, dim, seed, batch_size=5000):
+    db_init.DB_PATH = path
+    db_init.init_db(force=True)
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(len(INTENTS), dim)).astype(np.float32)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    for start in range(0, n, batch_size):
+        count = min(batch_size, n - start)
+        intent_idx = rng.integers(0, len(INTENTS), size=count)
+        emb = _unit_rows(centers[intent_idx] + rng.normal(size=(count, dim)).astype(np.float32))
+        rows = []
+        for j in range(count):
+            i = start + j
+            parent, child = INTENTS[intent_idx[j]]
+            rows.append((
+                i // TURNS_PER_CONVERSATION,
+                i % TURNS_PER_CONVERSATION,
+                _sentence(rng, 12),
+                _sentence(rng, 25),
+                json.dumps([f"USER:{_sentence(rng, 8)}", f"ADMIN:{_sentence(rng, 12)}"]),
+                parent,
+                child,
+                int(rng.integers(0, 101)),
+                json.dumps(emb[j].tolist()),
+            ))
+        conn.executemany(
+            """
+            INSERT INTO chat_pairs (
+                conversation_id, turn_index, user_message, admin_response, context,
+                intent_parent, intent_child, priority_score, embedding
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+        conn.commit()
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.close()
+
+
+def messages_frame(n_pairs, seed):
+    """Baris chat mentah (user/admin bergantian) untuk build_user_admin_pairs."""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    n = 2 * n_pairs
+    return pd.DataFrame({
+        "conversation_id": np.arange(n) // (2 * TURNS_PER_CONVERSATION),
+        "created_at": pd.date_range("2024-01-01", periods=n, freq="min"),
+        "role": np.where(np.arange(n) % 2 == 0, "user", "admin"),
+        "chat": [_sentence(rng, 10) for _ in range(n)],
+    })
+
+
+def sql_dump(n_rows, seed, rows_per_insert=500):
+    rng = np.random.default_rng(seed)
+    parts = []
+    for start in range(0, n_rows, rows_per_insert):
+        tuples = []
+        for i in range(start, min(start + rows_per_insert, n_rows)):
+            chat = _messy_text(rng).replace("'", "")
+            role = "user" if i % 2 == 0 else "admin"
+            tuples.append(
+                f"({i}, '2024-01-01 10:00:00', '2024-01-01 10:00:00', "
+                f"'{i // 20}', '{role}', '{chat}', NULL)"
+            )
+        parts.append("INSERT INTO `chats` VALUES " + ",\n".join(tuples) + ";")
+    return "\n".join(parts)
+
+# =========================================================
+# TIMING
+# =========================================================
+
+def measure(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return {
+        "repeat": repeat,
+        "median_ms": round(statistics.median(times), 4),
+        "min_ms": round(min(times), 4),
+    }
+
+
+def run_size(n, args, workdir):
+    results = []
+
+    def record(bench, stats, items=1):
+        stats = {"bench": bench, "size": n, **stats}
+        stats["per_item_us"] = round(stats["median_ms"] * 1000 / items, 3)
+        results.append(stats)
+        print(f"  {bench:<28} n={n:<8} median={stats['median_ms']:.3f} ms | min={stats['min_ms']:.3f} ms")
+
+    rng = np.random.default_rng(args.seed + 1)
+
+    # --- retrieval ---
+    matrix = _unit_rows(rng.normal(size=(n, args.dim)).astype(np.float32))
+    priorities = rng.integers(0, 101, size=n).astype(np.float32)
+    queries = _unit_rows(rng.normal(size=(args.queries, args.dim)).astype(np.float32))
+    qi = iter(range(10**9))
+    record("retrieve_top_k", measure(
+        lambda: retrieve_top_k(queries[next(qi) % len(queries)], matrix, priorities, 3), args.queries,
+    ))
+    del matrix
+
+    # --- DB ---
+    path = os.path.join(workdir, f"bench_{n}_{args.dim}_{args.seed}.db")
+    if not os.path.exists(path):
+        t0 = time.perf_counter()
+        build_db(path + ".tmp", n, args.dim, args.seed)
+        os.replace(path + ".tmp", path)
+        print(f"  (corpus {n} rows dibangun dalam {time.perf_counter() - t0:.1f}s → {path})")
+    db.DB_PATH = path
+
+    index = RetrievalIndex(path, storage="float32", shared=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = measure(index.load, 1, warmup=0)
+    record("retrieval_index_load", stats, n)
+    record("retrieval_index_search", measure(
+        lambda: index.search(queries[next(qi) % len(queries)], "perpanjang", "tanya_tagihan", k=3),
+        args.queries,
+    ))
+    del index
+
+    record("fetch_dataset_by_intent", measure(
+        lambda: db.fetch_dataset_by_intent("perpanjang"), args.db_repeat,
+    ), n)
+
+    conversations = max(1, n // TURNS_PER_CONVERSATION)
+    record("fetch_context", measure(
+        lambda: db.fetch_context(int(rng.integers(0, conversations))), args.queries,
+    ))
+
+    # insert di salinan supaya corpus cache tetap sama untuk run berikutnya
+    insert_path = path + ".insert"
+    with sqlite3.connect(path) as src, sqlite3.connect(insert_path) as dst:
+        src.backup(dst)
+    db.DB_PATH = insert_path
+    counter = iter(range(10**9))
+
+    def insert_one():
+        i = next(counter)
+        db.insert_chat_pair({
+            "conversation_id": conversations + i,
+            "session_id": f"bench-{i}",
+            "turn_index": 1,
+            "user_message": _sentence(rng, 12),
+            "admin_response": _sentence(rng, 25),
+            "context": [],
+            "intent_parent": "perpanjang",
+            "intent_child": "tanya_tagihan",
+            "priority_score": 50,
+            "reward_count": 0,
+            "punish_count": 0,
+            "embedding": queries[i % len(queries)].tolist(),
+        })
+
+    record("insert_chat_pair", measure(insert_one, args.queries))
+    os.remove(insert_path)
+    db.DB_PATH = path
+
+    # --- data prep ---
+    texts = [_messy_text(rng) for _ in range(n)]
+    record("clean_text_for_model", measure(
+        lambda: [clean_text_for_model(t) for t in texts], args.prep_repeat,
+    ), n)
+
+    dump = sql_dump(n, args.seed)
+    record("parse_sql_values", measure(lambda: parse_sql_values(dump), args.prep_repeat), n)
+
+    if n <= args.max_pairs_rows:
+        from data_prepare2_pairs import build_user_admin_pairs
+
+        frame = messages_frame(n, args.seed)
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = measure(lambda: build_user_admin_pairs(frame), args.prep_repeat, warmup=0)
+        record("build_user_admin_pairs", stats, n)
+    else:
+        print(f"  {'build_user_admin_pairs':<28} n={n:<8} skipped (> --max-pairs-rows)")
+
+    return results
+
+# =========================================================
+# BASELINE COMPARISON
+# =========================================================
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["bench"], r["size"]): r for r in json.load(f)["results"]}
+
+    print(f"\nvs baseline {baseline_path} (regresi jika > +{threshold:.0%}):")
+    regressions = 0
+    for row in results:
+        old = baseline.get((row["bench"], row["size"]))
+        if not old or not old["median_ms"]:
+            continue
+        ratio = row["median_ms"] / old["median_ms"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  ⚠️ REGRESI"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = "  ✅"
+        print(
+            f"  {row['bench']:<28} n={row['size']:<8} "
+            f"{old['median_ms']:.3f} → {row['median_ms']:.3f} ms ({ratio:.2f}x){flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark hot path retrieval, DB & data prep")
+    parser.add_argument("--sizes", default="1k,10k,100k", help="daftar ukuran corpus, mis. 1k,10k,100k,1m")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=50, help="repeat untuk bench per-query")
+    parser.add_argument("--db-repeat", type=int, default=3)
+    parser.add_argument("--prep-repeat", type=int, default=3)
+    parser.add_argument("--max-pairs-rows", type=int, default=10_000)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "ppj-bench"))
+    parser.add_argument("--json", help="simpan hasil ke file JSON")
+    parser.add_argument("--baseline", help="bandingkan dengan file JSON hasil run sebelumnya")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+
+    results = []
+    for n in sizes:
+        print(f"[SIZE] {n}")
+        results.extend(run_size(n, args, args.workdir))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {
+                    "python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "sqlite": sqlite3.sqlite_version,
+                    "machine": platform.machine(),
+                    "params": vars(args),
+                },
+                "results": results,
+            }, f, indent=2)
+
+    if args.baseline and compare(results, args.baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from replay_load import FakeLLM, corpus_dim, start_fake_llm
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# =========================================================
+# BENCHMARK: COLD START
+# =========================================================
+#
+# Tiap run memakai proses Python baru supaya cache modul tidak ikut
+# terhitung:
+#   import_ms        → import modul app (schema check)
+#   first_request_ms → import + POST /chat pertama lewat test client Flask
+#                      (client LLM, numpy, retrieval index: semua yang
+#                      ditunda dari import dibayar di sini)
+# LLM diganti server stub lokal dari replay_load.py (latensi 0 secara
+# default) dan DB disalin ke folder sementara, karena /chat menulis
+# chat_pairs & log. Profil `python -X importtime` dipakai untuk melihat
+# modul top-level paling mahal (cumulative), mis. numpy / openai / anthropic.
+
+_HEAVY_MODULES = ("numpy", "pandas", "openai", "anthropic", "retrieval_store")
+
+_FIRST_REQUEST = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module} as app_module
+t1 = time.perf_counter()
+heavy = [m for m in {heavy!r} if m in sys.modules]
+res = app_module.app.test_client().post("/chat", json={{"query": {query!r}}})
+t2 = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (t1 - t0) * 1000,
+    "first_request_ms": (t2 - t0) * 1000,
+    "status": res.status_code,
+    "heavy_on_import": heavy,
+}}))
+"""
+
+
+def _env(llm_base=None):
+    env = dict(os.environ)
+    # client dibuat lazy, tapi beberapa modul membaca key saat import
+    env.setdefault("OPENAI_API_KEY", "bench")
+    if llm_base:
+        env["OPENAI_BASE_URL"] = llm_base + "/v1"
+        env["ANTHROPIC_BASE_URL"] = llm_base
+        env.setdefault("CLAUDE_API_KEY", "bench")
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def first_request(module, cwd, llm_base, query):
+    script = _FIRST_REQUEST.format(module=module, heavy=_HEAVY_MODULES, query=query)
+    out = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=cwd, env=_env(llm_base), capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def import_profile(module, cwd, top=15, max_depth=1):
+    """Modul dari `-X importtime` sampai max_depth, urut cumulative terbesar."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, env=_env(), capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # 1 spasi + 2 spasi per level: depth 0 = modul app, 1 = import langsungnya
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= max_depth:
+            rows.append({
+                "module": name.strip(),
+                "depth": depth,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            })
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return rows[:top]
+
+
+def compare(result, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"vs baseline {baseline_path}:")
+    for key in ("import_ms", "first_request_ms"):
+        old, new = baseline["summary"][key], result["summary"][key]
+        print(f"  {key}: {old:.0f} → {new:.0f} ms ({(new - old) / old * 100:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold start app Flask (sampai /chat pertama)")
+    parser.add_argument("--module", default="main_flask_claude")
+    parser.add_argument("--cwd", default=ROOT, help="folder berisi chatbot.db / log.db")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--query", default="halo kak, mau perpanjang website")
+    parser.add_argument("--latency-scale", type=float, default=0.0, help="kali latensi stub LLM (0 = tanpa jeda)")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", help="simpan hasil ke file JSON")
+    parser.add_argument("--baseline", help="file JSON hasil run sebelumnya untuk dibandingkan")
+    args = parser.parse_args()
+
+    db_path = os.path.join(args.cwd, "chatbot.db")
+    fake = FakeLLM(corpus_dim(db_path), latency_scale=args.latency_scale)
+    llm_server = start_fake_llm(fake)
+    llm_base = f"http://127.0.0.1:{llm_server.server_address[1]}"
+
+    workdir = tempfile.mkdtemp(prefix="ppj-startup-")
+    try:
+        for name in ("chatbot.db", "log.db"):
+            if os.path.exists(os.path.join(args.cwd, name)):
+                shutil.copy(os.path.join(args.cwd, name), os.path.join(workdir, name))
+        # run pertama juga menjalankan migrasi schema (sekali per deploy), tidak dihitung
+        first_request(args.module, workdir, llm_base, args.query)
+        runs = [first_request(args.module, workdir, llm_base, args.query) for _ in range(args.runs)]
+        profile = import_profile(args.module, workdir, args.top)
+    finally:
+        llm_server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {
+        "import_ms": round(statistics.median(r["import_ms"] for r in runs), 1),
+        "first_request_ms": round(statistics.median(r["first_request_ms"] for r in runs), 1),
+        "status": runs[-1]["status"],
+        "heavy_on_import": runs[-1]["heavy_on_import"],
+    }
+    result = {"params": vars(args), "summary": summary, "import_profile": profile}
+
+    print(f"module={args.module} runs={args.runs}")
+    print("  " + " | ".join(f"{key}={value}" for key, value in summary.items()))
+    print("imports (cumulative):")
+    for row in profile:
+        print(f"  {row['cumulative_ms']:8.1f} ms  {'  ' * row['depth']}{row['module']}")
+
+    if args.baseline:
+        compare(result, args.baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
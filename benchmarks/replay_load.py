@@ -0,0 +1,459 @@
+import argparse
+import base64
+import hashlib
+import json
+import math
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# =========================================================
+# REPLAY / LOAD TEST (OFFLINE)
+# =========================================================
+#
+# Memutar ulang query historis dari chat_logs (log.db) ke app Flask lewat
+# HTTP sungguhan, dengan OpenAI embeddings & Anthropic messages diganti
+# server stub lokal (OPENAI_BASE_URL / ANTHROPIC_BASE_URL) yang latensinya
+# lognormal. Semua DB disalin ke folder sementara, jadi chatbot.db & log.db
+# asli tidak ikut berubah.
+#
+#   python benchmarks/replay_load.py --limit 200 --qps 5 --concurrency 16
+#   python benchmarks/replay_load.py --latency-scale 0.1 --json replay.json
+#
+# Laporan: p50/p95/p99 & throughput HTTP, status per HTTP code, dan
+# p50/p95/p99 per stage dari stage_timings_json request hasil replay.
+
+# (median detik, p95 detik) per jenis call upstream
+DEFAULT_LATENCY = {
+    "embedding": (0.25, 0.8),
+    "intent": (1.0, 2.5),
+    "generation": (3.0, 8.0),
+    "guard": (1.5, 4.0),
+}
+
+INTENT_CHOICES = [
+    ("perpanjang", "tanya_tagihan"),
+    ("perpanjang", "tanya_masa_aktif"),
+    ("perpanjang", "ingin_bayar"),
+    ("perpanjang", "kirim_bukti_bayar"),
+    ("perpanjang", "minta_invoice"),
+    ("tanya_status", "status_perpanjangan"),
+    ("tanya_status", "status_domain"),
+    ("lainnya", "tidak_jelas"),
+]
+
+
+def _seed(text):
+    return int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+
+
+def _percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    arr = np.asarray(values, dtype=np.float64)
+    return {f"p{p}": round(float(np.percentile(arr, p)), 1) for p in (50, 95, 99)}
+
+# =========================================================
+# FAKE LLM SERVER
+# =========================================================
+
+class FakeLLM:
+    def __init__(self, dim, latency=None, latency_scale=1.0, error_rate=0.0, seed=0):
+        self.dim = dim
+        self.latency = latency or DEFAULT_LATENCY
+        self.latency_scale = latency_scale
+        self.error_rate = error_rate
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def sample_latency(self, kind):
+        median, p95 = self.latency[kind]
+        sigma = math.log(p95 / median) / 1.645
+        with self.lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            value = self.rng.lognormal(math.log(median), sigma)
+            fail = self.rng.random() < self.error_rate
+        return value * self.latency_scale, fail
+
+    def embedding(self, text):
+        vec = np.random.default_rng(_seed(text)).normal(size=self.dim).astype(np.float32)
+        return vec / np.linalg.norm(vec)
+
+    def completion(self, kind, prompt):
+        if kind == "intent":
+            parent, child = INTENT_CHOICES[_seed(prompt) % len(INTENT_CHOICES)]
+            return f"inferred_parent: {parent}\ninferred_child: {child}"
+        return "Baik kak, perpanjangan website untuk {{$domain_klien}} dapat dilakukan sebelum {{$jatuh_tempo}}."
+
+
+def _message_kind(body):
+    if body.get("system"):
+        return "generation"
+    text = json.dumps(body.get("messages", []), ensure_ascii=False)
+    return "intent" if "inferred_parent" in text else "guard"
+
+
+def _make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status, obj):
+            raw = json.dumps(obj).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _overloaded(self):
+            self._json(529, {"type": "error", "error": {"type": "overloaded_error", "message": "stub overloaded"}})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if self.path.endswith("/embeddings"):
+                return self._embeddings(body)
+            if self.path.endswith("/messages"):
+                return self._messages(body)
+            self._json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        def _embeddings(self, body):
+            delay, fail = fake.sample_latency("embedding")
+            time.sleep(delay)
+            if fail:
+                return self._json(500, {"error": {"message": "stub error", "type": "server_error"}})
+            texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            data = []
+            for i, text in enumerate(texts):
+                vec = fake.embedding(str(text))
+                if body.get("encoding_format") == "base64":
+                    emb = base64.b64encode(vec.tobytes()).decode("ascii")
+                else:
+                    emb = vec.tolist()
+                data.append({"object": "embedding", "index": i, "embedding": emb})
+            tokens = sum(len(str(t).split()) for t in texts)
+            self._json(200, {
+                "object": "list",
+                "data": data,
+                "model": body.get("model"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+
+        def _messages(self, body):
+            kind = _message_kind(body)
+            delay, fail = fake.sample_latency(kind)
+            if fail:
+                time.sleep(delay * 0.2)
+                return self._overloaded()
+            prompt = json.dumps(body.get("messages", []), ensure_ascii=False)
+            text = fake.completion(kind, prompt)
+            input_tokens = len(prompt.split())
+            output_tokens = len(text.split())
+            message = {
+                "id": "msg_stub",
+                "type": "message",
+                "role": "assistant",
+                "model": body.get("model"),
+                "content": [],
+                "stop_reason": None,
+                "stop_sequence": None,
+                "usage": {"input_tokens": input_tokens, "output_tokens": 0},
+            }
+            if not body.get("stream"):
+                time.sleep(delay)
+                message.update({
+                    "content": [{"type": "text", "text": text}],
+                    "stop_reason": "end_turn",
+                    "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+                })
+                return self._json(200, message)
+            self._stream(message, text, delay, output_tokens)
+
+        def _stream(self, message, text, delay, output_tokens):
+            # ~30% latensi sebelum token pertama, sisanya tersebar per kata
+            words = text.split(" ")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            events = [("message_start", {"type": "message_start", "message": message}),
+                      ("content_block_start", {"type": "content_block_start", "index": 0,
+                                               "content_block": {"type": "text", "text": ""}})]
+            try:
+                time.sleep(delay * 0.3)
+                self._send_events(events)
+                step = delay * 0.7 / max(len(words), 1)
+                for i, word in enumerate(words):
+                    time.sleep(step)
+                    chunk = word if i == 0 else " " + word
+                    self._send_events([("content_block_delta", {
+                        "type": "content_block_delta", "index": 0,
+                        "delta": {"type": "text_delta", "text": chunk},
+                    })])
+                self._send_events([
+                    ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+                    ("message_delta", {"type": "message_delta",
+                                       "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                       "usage": {"output_tokens": output_tokens}}),
+                    ("message_stop", {"type": "message_stop"}),
+                ])
+            except (BrokenPipeError, ConnectionResetError):
+                # client membatalkan stream (lihat cancellation.py)
+                with fake.lock:
+                    fake.calls["aborted"] = fake.calls.get("aborted", 0) + 1
+
+        def _send_events(self, events):
+            for name, data in events:
+                self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+    return Handler
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # koneksi keep-alive yang ditutup client (retry SDK, stream dibatalkan)
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+def start_fake_llm(fake, host="127.0.0.1"):
+    server = _StubServer((host, 0), _make_handler(fake))
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
+
+# =========================================================
+# REPLAY
+# =========================================================
+
+def load_requests(log_db, limit):
+    conn = sqlite3.connect(log_db)
+    # schema log v3 memindahkan payload_json ke chat_log_texts (view chat_logs_full)
+    has_view = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'chat_logs_full'"
+    ).fetchone()
+    rows = conn.execute(
+        f"""
+        SELECT payload_json, user_query, conversation_id
+        FROM {'chat_logs_full' if has_view else 'chat_logs'}
+        WHERE user_query IS NOT NULL AND user_query != ''
+        ORDER BY id
+        LIMIT ?
+        """,
+        (limit,),
+    ).fetchall()
+    conn.close()
+
+    payloads = []
+    for payload_json, user_query, conversation_id in rows:
+        try:
+            payload = json.loads(payload_json) if payload_json else {}
+        except ValueError:
+            payload = {}
+        if not (payload.get("query") or payload.get("q")):
+            payload["query"] = user_query
+        if conversation_id and "conversation_id" not in payload:
+            payload["conversation_id"] = conversation_id
+        payloads.append(payload)
+    return payloads
+
+
+def corpus_dim(db_path):
+    conn = sqlite3.connect(db_path)
+    row = conn.execute(
+        "SELECT embedding FROM chat_pairs WHERE embedding IS NOT NULL AND canonical_id IS NULL LIMIT 1"
+    ).fetchone()
+    conn.close()
+    if not row:
+        raise SystemExit("chatbot.db belum punya embedding, tidak ada yang bisa di-retrieve")
+    dim = len(json.loads(row[0]))
+    embedding_dim = int(os.getenv("EMBEDDING_DIM", "0"))
+    return min(dim, embedding_dim) if embedding_dim else dim
+
+
+def _post(url, payload, timeout):
+    req = urllib.request.Request(
+        url, data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"}, method="POST",
+    )
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as res:
+            res.read()
+            status = res.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0  # koneksi gagal / timeout client
+    return status, (time.perf_counter() - t0) * 1000
+
+
+def run_replay(url, payloads, qps, concurrency, timeout):
+    """qps > 0: open loop (jadwal tetap); qps = 0: closed loop secepatnya."""
+    results = []
+    lock = threading.Lock()
+
+    def send(payload, scheduled):
+        if scheduled:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        status, ms = _post(url, payload, timeout)
+        with lock:
+            results.append((status, ms))
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i, payload in enumerate(payloads):
+            pool.submit(send, payload, t0 + i / qps if qps else None)
+    return results, time.perf_counter() - t0
+
+
+def stage_report(log_db, after_id):
+    conn = sqlite3.connect(log_db)
+    rows = conn.execute(
+        "SELECT status, stage_timings_json, queue_wait_ms FROM chat_logs WHERE id > ?",
+        (after_id,),
+    ).fetchall()
+    conn.close()
+
+    stages, statuses, queue_wait = {}, {}, []
+    for status, timings_json, wait_ms in rows:
+        statuses[status] = statuses.get(status, 0) + 1
+        if wait_ms is not None:
+            queue_wait.append(wait_ms)
+        for stage, ms in json.loads(timings_json or "{}").items():
+            stages.setdefault(stage, []).append(ms)
+
+    total = len(rows) or 1
+    return {
+        "statuses": {k: {"count": v, "rate": round(v / total, 4)} for k, v in sorted(statuses.items())},
+        "queue_wait_ms": _percentiles(queue_wait),
+        "stages_ms": {stage: {"count": len(v), **_percentiles(v)} for stage, v in stages.items()},
+    }
+
+
+def _max_log_id(log_db):
+    conn = sqlite3.connect(log_db)
+    try:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM chat_logs").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay chat_logs ke app dengan LLM stub lokal")
+    parser.add_argument("--module", default="main_flask_claude")
+    parser.add_argument("--db", default=os.path.join(ROOT, "chatbot.db"))
+    parser.add_argument("--log-db", default=os.path.join(ROOT, "log.db"), help="sumber query (chat_logs)")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=1, help="putar ulang daftar query n kali")
+    parser.add_argument("--qps", type=float, default=5.0, help="0 = closed loop")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=180.0, help="timeout HTTP client (detik)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="kali latensi stub (0.1 = 10x lebih cepat)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="peluang stub membalas 500/529")
+    parser.add_argument("--workdir", help="folder kerja (default: temp dir, dihapus setelah selesai)")
+    parser.add_argument("--json", help="simpan hasil ke file JSON")
+    args = parser.parse_args()
+
+    if args.json:
+        args.json = os.path.abspath(args.json)
+    payloads = load_requests(args.log_db, args.limit) * args.repeat
+    if not payloads:
+        raise SystemExit(f"tidak ada query di {args.log_db}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ppj-replay-")
+    os.makedirs(workdir, exist_ok=True)
+    shutil.copy(args.db, os.path.join(workdir, "chatbot.db"))
+    if os.path.exists(args.log_db):
+        shutil.copy(args.log_db, os.path.join(workdir, "log.db"))
+
+    fake = FakeLLM(corpus_dim(args.db), latency_scale=args.latency_scale, error_rate=args.error_rate)
+    llm_server = start_fake_llm(fake)
+    base = f"http://127.0.0.1:{llm_server.server_address[1]}"
+    os.environ["OPENAI_BASE_URL"] = base + "/v1"
+    os.environ["ANTHROPIC_BASE_URL"] = base
+    os.environ.setdefault("OPENAI_API_KEY", "replay")
+    os.environ.setdefault("CLAUDE_API_KEY", "replay")
+    # satu log.db di workdir supaya stage_report bisa membaca hasil replay
+    os.environ["LOG_DB_PARTITION"] = "none"
+
+    # app membaca DB relatif ke cwd → import setelah pindah ke workdir
+    os.chdir(workdir)
+    import importlib
+    from werkzeug.serving import make_server
+
+    module = importlib.import_module(args.module)
+    if hasattr(module, "get_retrieval_index"):
+        module.get_retrieval_index()
+    app_server = make_server("127.0.0.1", 0, module.app, threaded=True)
+    threading.Thread(target=app_server.serve_forever, name="replay-app", daemon=True).start()
+    url = f"http://127.0.0.1:{app_server.server_port}/chat"
+
+    after_id = _max_log_id("log.db")
+    print(f"replay {len(payloads)} request | qps={args.qps or 'max'} | concurrency={args.concurrency} | workdir={workdir}")
+    results, wall = run_replay(url, payloads, args.qps, args.concurrency, args.timeout)
+    app_server.shutdown()
+    llm_server.shutdown()
+    # chat_logs ditulis thread writer log_db; tunggu sebelum stage_report
+    from log_db import flush_request_logs
+    flush_request_logs()
+
+    latencies = [ms for _, ms in results]
+    by_code = {}
+    for status, _ in results:
+        by_code[str(status)] = by_code.get(str(status), 0) + 1
+    ok = by_code.get("200", 0)
+    summary = {
+        "requests": len(results),
+        "wall_s": round(wall, 2),
+        "throughput_rps": round(len(results) / wall, 2),
+        "success_rps": round(ok / wall, 2),
+        "error_rate": round(1 - ok / len(results), 4),
+        "latency_ms": _percentiles(latencies),
+        "http_status": by_code,
+    }
+    report = stage_report("log.db", after_id)
+
+    print("  " + " | ".join(f"{k}={v}" for k, v in summary.items()))
+    print(f"  queue_wait_ms={report['queue_wait_ms']}")
+    print("  status: " + ", ".join(f"{k}={v['count']} ({v['rate']:.1%})" for k, v in report["statuses"].items()))
+    for stage, row in report["stages_ms"].items():
+        print(f"  stage {stage:<18} n={row['count']:<5} p50={row['p50']} p95={row['p95']} p99={row['p99']} ms")
+    print(f"  upstream calls: {fake.calls}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "params": vars(args),
+                "summary": summary,
+                "stages": report,
+                "upstream_calls": fake.calls,
+            }, f, indent=2)
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
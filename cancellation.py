@@ -0,0 +1,90 @@
+import threading
+import time
+
+from telemetry import current_trace
+
+# =========================================================
+# COOPERATIVE CANCELLATION
+# =========================================================
+#
+# Satu CancelToken per request /chat (disimpan di RequestTrace, jadi ikut
+# aktif di thread mana pun span request itu berjalan, termasuk EXECUTOR).
+#   - chat() memanggil cancel() saat menyerah (504) → callback on_cancel
+#     menutup stream Claude yang sedang jalan & membatalkan future yang
+#     belum mulai, sehingga slot worker langsung kembali
+#   - deadline: setelah lewat, token dianggap batal walaupun cancel()
+#     belum dipanggil; remaining() dipakai sebagai timeout HTTP
+#   - process_chat_request mengecek token di antara stage dan tidak
+#     menulis ke chat_pairs untuk request yang sudah batal
+
+
+class RequestCancelled(Exception):
+    def __init__(self, reason):
+        super().__init__(f"request dibatalkan ({reason})")
+        self.reason = reason
+
+
+class CancelToken:
+    def __init__(self, timeout_seconds=None):
+        self.deadline = time.monotonic() + timeout_seconds if timeout_seconds else None
+        self.reason = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+            return True
+        return False
+
+    def cancel(self, reason="cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+        return True
+
+    def on_cancel(self, callback):
+        """
+        Daftarkan callback (dipanggil sekali, dari thread yang membatalkan).
+        Return fungsi untuk melepas callback setelah pekerjaannya selesai.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+
+                def unregister():
+                    with self._lock:
+                        if callback in self._callbacks:
+                            self._callbacks.remove(callback)
+
+                return unregister
+        callback()
+        return lambda: None
+
+    def remaining(self, minimum=0.1):
+        """Sisa waktu sampai deadline (detik), None jika tanpa deadline."""
+        if self.deadline is None:
+            return None
+        return max(minimum, self.deadline - time.monotonic())
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise RequestCancelled(self.reason)
+
+
+def current_cancel_token():
+    """Token request yang span-nya sedang aktif di thread ini (atau None)."""
+    trace = current_trace()
+    return getattr(trace, "cancel_token", None)
@@ -0,0 +1,258 @@
+import argparse
+import os
+import sqlite3
+import time
+
+from db_init import init_db
+
+DB_PATH = "chatbot.db"
+ARCHIVE_DB_PATH = os.getenv("ARCHIVE_DB_PATH", "chatbot_archive.db")
+
+# =========================================================
+# RETENTION POLICY (0 = policy dimatikan)
+# =========================================================
+#
+# Semua policy hanya berlaku untuk row hasil bot (session_id NOT NULL)
+# yang umurnya sudah lewat COMPACT_MIN_AGE_HOURS, supaya riwayat
+# percakapan yang masih aktif (fetch_context) tidak ikut terpotong.
+# Row yang menjadi canonical_id row lain juga tidak dipindahkan, dan
+# MIN_CONVERSATION_CAP turn terbaru tiap percakapan selalu tetap di
+# chat_pairs (untuk policy apa pun), sehingga fetch_context masih punya
+# riwayat dan fetch_next_turn_index tidak mengulang turn_index.
+
+COMPACT_MAX_AGE_DAYS = int(os.getenv("COMPACT_MAX_AGE_DAYS", "180"))
+COMPACT_UNREWARDED_DAYS = int(os.getenv("COMPACT_UNREWARDED_DAYS", "30"))
+COMPACT_PUNISHED_BELOW = int(os.getenv("COMPACT_PUNISHED_BELOW", "20"))
+COMPACT_PER_CONVERSATION_CAP = int(os.getenv("COMPACT_PER_CONVERSATION_CAP", "50"))
+COMPACT_MIN_AGE_HOURS = int(os.getenv("COMPACT_MIN_AGE_HOURS", "24"))
+COMPACT_BATCH_SIZE = int(os.getenv("COMPACT_BATCH_SIZE", "5000"))
+# jumlah page yang dibebaskan per run incremental_vacuum
+COMPACT_VACUUM_PAGES = int(os.getenv("COMPACT_VACUUM_PAGES", "20000"))
+
+# fetch_context membaca 6 turn terakhir, cap tidak boleh lebih kecil dari ini
+MIN_CONVERSATION_CAP = 6
+
+_BASE_FILTER = """
+    session_id IS NOT NULL
+    AND created_at < datetime('now', :min_age)
+    AND id NOT IN (
+        SELECT canonical_id FROM chat_pairs WHERE canonical_id IS NOT NULL
+    )
+    AND id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY conversation_id
+                ORDER BY turn_index DESC
+            ) AS rn
+            FROM chat_pairs
+        )
+        WHERE rn > :keep_recent
+    )
+"""
+
+POLICIES = {
+    "max_age": "created_at < datetime('now', :max_age)",
+    "never_rewarded": "reward_count = 0 AND created_at < datetime('now', :unrewarded_age)",
+    "punished_low_score": "punish_count > 0 AND priority_score < :punished_below",
+    "conversation_cap": """
+        id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY conversation_id
+                    ORDER BY turn_index DESC
+                ) AS rn
+                FROM chat_pairs
+                WHERE session_id IS NOT NULL
+            )
+            WHERE rn > :conversation_cap
+        )
+    """,
+}
+
+
+def _policy_params(max_age_days, unrewarded_days, punished_below, conversation_cap, min_age_hours):
+    return {
+        "min_age": f"-{min_age_hours} hours",
+        "max_age": f"-{max_age_days} days",
+        "unrewarded_age": f"-{unrewarded_days} days",
+        "punished_below": punished_below,
+        "conversation_cap": max(conversation_cap, MIN_CONVERSATION_CAP),
+        "keep_recent": MIN_CONVERSATION_CAP,
+    }
+
+# =========================================================
+# ARCHIVE
+# =========================================================
+
+def _columns(cur, table, schema="main"):
+    cur.execute(f"PRAGMA {schema}.table_info({table})")
+    return [(r[1], r[2]) for r in cur.fetchall()]
+
+
+def _ensure_archive_table(cur):
+    cur.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DB_PATH,))
+    cols = _columns(cur, "chat_pairs")
+    col_defs = ", ".join(f"{name} {col_type}" for name, col_type in cols)
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS archive.chat_pairs_archive (
+            {col_defs},
+            archive_reason TEXT,
+            archived_at TEXT
+        )
+        """
+    )
+    # kolom baru di chat_pairs ikut ditambahkan ke archive
+    existing = {name for name, _ in _columns(cur, "chat_pairs_archive", "archive")}
+    for name, col_type in cols:
+        if name not in existing:
+            cur.execute(f"ALTER TABLE archive.chat_pairs_archive ADD COLUMN {name} {col_type}")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS archive.idx_archive_conversation "
+        "ON chat_pairs_archive (conversation_id, turn_index)"
+    )
+    return [name for name, _ in cols]
+
+# =========================================================
+# COMPACTION
+# =========================================================
+
+def compact(
+    max_age_days=COMPACT_MAX_AGE_DAYS,
+    unrewarded_days=COMPACT_UNREWARDED_DAYS,
+    punished_below=COMPACT_PUNISHED_BELOW,
+    conversation_cap=COMPACT_PER_CONVERSATION_CAP,
+    min_age_hours=COMPACT_MIN_AGE_HOURS,
+    batch_size=COMPACT_BATCH_SIZE,
+    dry_run=False,
+):
+    """
+    Pindahkan row dingin dari chat_pairs (hot retrieval set) ke
+    archive.chat_pairs_archive secara bertahap per batch.
+    Return dict jumlah row per policy.
+    """
+    init_db()
+    t0 = time.perf_counter()
+
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    cur = conn.cursor()
+    cols = _ensure_archive_table(cur)
+    col_list = ", ".join(cols)
+
+    enabled = {
+        "max_age": max_age_days,
+        "never_rewarded": unrewarded_days,
+        "punished_low_score": punished_below,
+        "conversation_cap": conversation_cap,
+    }
+    params = _policy_params(max_age_days, unrewarded_days, punished_below, conversation_cap, min_age_hours)
+
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS compact_ids (id INTEGER PRIMARY KEY, reason TEXT)")
+    cur.execute("DELETE FROM compact_ids")
+
+    counts = {}
+    for reason, condition in POLICIES.items():
+        if not enabled[reason]:
+            continue
+        cur.execute(
+            f"""
+            INSERT OR IGNORE INTO compact_ids (id, reason)
+            SELECT id, :reason FROM chat_pairs
+            WHERE {_BASE_FILTER} AND {condition}
+            """,
+            {**params, "reason": reason},
+        )
+        counts[reason] = cur.rowcount
+
+    total = sum(counts.values())
+    hot_before = cur.execute("SELECT COUNT(*) FROM chat_pairs").fetchone()[0]
+    print(f"[COMPACT] hot rows={hot_before} | to archive={total} | by policy={counts}")
+
+    if dry_run or not total:
+        conn.close()
+        return counts
+
+    moved = 0
+    while True:
+        # transaksi pendek per batch supaya /chat tidak lama terkunci
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("SELECT id FROM compact_ids LIMIT ?", (batch_size,))
+        ids = [r[0] for r in cur.fetchall()]
+        if not ids:
+            cur.execute("COMMIT")
+            break
+
+        cur.execute("CREATE TEMP TABLE IF NOT EXISTS compact_batch (id INTEGER PRIMARY KEY)")
+        cur.execute("DELETE FROM compact_batch")
+        cur.executemany("INSERT INTO compact_batch (id) VALUES (?)", [(i,) for i in ids])
+
+        cur.execute(
+            f"""
+            INSERT INTO archive.chat_pairs_archive ({col_list}, archive_reason, archived_at)
+            SELECT {", ".join("p." + c for c in cols)}, c.reason, datetime('now')
+            FROM chat_pairs p
+            JOIN compact_ids c ON c.id = p.id
+            WHERE p.id IN (SELECT id FROM compact_batch)
+            """
+        )
+        cur.execute("DELETE FROM chat_pairs WHERE id IN (SELECT id FROM compact_batch)")
+        cur.execute("DELETE FROM compact_ids WHERE id IN (SELECT id FROM compact_batch)")
+        cur.execute("COMMIT")
+
+        moved += len(ids)
+        print(f"[COMPACT] archived {moved}/{total}")
+
+    _vacuum_incremental(cur)
+    cur.execute("PRAGMA optimize")
+    conn.close()
+
+    print(
+        f"[COMPACT] done | hot rows {hot_before} → {hot_before - moved} | "
+        f"archive={ARCHIVE_DB_PATH} | {time.perf_counter() - t0:.1f}s"
+    )
+    return counts
+
+
+def _vacuum_incremental(cur):
+    """
+    incremental_vacuum hanya efektif jika auto_vacuum = INCREMENTAL (2).
+    Mengaktifkannya di DB lama butuh 1x VACUUM penuh (lihat --enable-incremental-vacuum).
+    """
+    mode = cur.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if mode != 2:
+        print("[COMPACT] auto_vacuum bukan INCREMENTAL, skip incremental_vacuum")
+        return
+    cur.execute(f"PRAGMA incremental_vacuum({COMPACT_VACUUM_PAGES})")
+    cur.fetchall()
+
+
+def enable_incremental_vacuum():
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    print("[COMPACT] Running one-time full VACUUM to enable incremental vacuum...")
+    conn.execute("VACUUM")
+    conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compaction & retention chat_pairs")
+    parser.add_argument("--max-age-days", type=int, default=COMPACT_MAX_AGE_DAYS)
+    parser.add_argument("--unrewarded-days", type=int, default=COMPACT_UNREWARDED_DAYS)
+    parser.add_argument("--punished-below", type=int, default=COMPACT_PUNISHED_BELOW)
+    parser.add_argument("--conversation-cap", type=int, default=COMPACT_PER_CONVERSATION_CAP)
+    parser.add_argument("--min-age-hours", type=int, default=COMPACT_MIN_AGE_HOURS)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true")
+    args = parser.parse_args()
+
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum()
+
+    compact(
+        max_age_days=args.max_age_days,
+        unrewarded_days=args.unrewarded_days,
+        punished_below=args.punished_below,
+        conversation_cap=args.conversation_cap,
+        min_age_hours=args.min_age_hours,
+        dry_run=args.dry_run,
+    )
@@ -1,10 +1,7 @@
 import pandas as pd
 
-# Load hasil cleaning
-clean_path = "data/cleaned_dataset.json"
-df_cleaned = pd.read_json(clean_path)
-
-print("[LOAD] cleaned_dataset.json loaded:", len(df_cleaned), "rows")
+CLEAN_PATH = "data/cleaned_dataset.json"
+PAIRS_PATH = "data/pairs_dataset.json"
 
 # ------------------------
 # BUAT PAIRS
@@ -68,18 +65,27 @@ def build_user_admin_pairs(df, context_window=5):
     print(f"[PAIRS] Total pairs built: {len(df_pairs)}")
     return df_pairs
 
-df_pairs = build_user_admin_pairs(df_cleaned, context_window=5)
-
 # ------------------------
-# SAVE PAIRS
+# MAIN
 # ------------------------
-pairs_path = "data/pairs_dataset.json"
-
-df_pairs.to_json(
-    pairs_path,
-    orient="records",
-    indent=2,
-    force_ascii=False
-)
-
-print("Saved pairs to:", pairs_path)
\ No newline at end of file
+def main():
+    # Load hasil cleaning
+    df_cleaned = pd.read_json(CLEAN_PATH)
+    print("[LOAD] cleaned_dataset.json loaded:", len(df_cleaned), "rows")
+
+    df_pairs = build_user_admin_pairs(df_cleaned, context_window=5)
+
+    # ------------------------
+    # SAVE PAIRS
+    # ------------------------
+    df_pairs.to_json(
+        PAIRS_PATH,
+        orient="records",
+        indent=2,
+        force_ascii=False
+    )
+
+    print("Saved pairs to:", PAIRS_PATH)
+
+if __name__ == "__main__":
+    main()
@@ -3,19 +3,78 @@ import json
 import re
 import os
 from openai import OpenAI
-from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from batch_jobs import (
+    LocalBatchBackend,
+    OpenAIBatchBackend,
+    finish_batch,
+    make_request,
+    run_batch,
+    sync_openai_handler,
+)
+from llm_jobs import CheckpointStore, row_hash, run_checkpointed_jobs
 
 # =========================================================
-# LOAD FILTERED PAIRS (HASIL CLEANING + GROUPING)
+# CONFIG
 # =========================================================
 
 PAIR_FILTERED_PATH = "data/pairs_perpanjangan.json"
 OUTPUT_PATH = "data/pairs_perpanjangan_with_intent_and_score.json"
-MAX_WORKERS = 6 
+CHECKPOINT_PATH = os.getenv("SCORING_CHECKPOINT_PATH", "data/checkpoints/scoring.jsonl")
+SCORING_MODEL = "gpt-4.1-mini"
+MAX_WORKERS = int(os.getenv("SCORING_MAX_WORKERS", "6"))
+RATE_PER_SEC = float(os.getenv("SCORING_RATE_PER_SEC", "5"))
+MAX_ATTEMPTS = int(os.getenv("SCORING_MAX_ATTEMPTS", "5"))
+# "combined" = 1 call JSON per row, "separate" = 3 prompt lama per row
+SCORING_MODE = os.getenv("SCORING_MODE", "combined")
+# "off" = request sinkron, "openai" = Batch API, "local" = stand-in lokal
+SCORING_BATCH_MODE = os.getenv("SCORING_BATCH_MODE", "off")
+BATCH_WORKDIR = "data/batches"
+BATCH_POLL_SECONDS = int(os.getenv("BATCH_POLL_SECONDS", "60"))
+
+# =========================================================
+# INTENT TAXONOMY
+# =========================================================
 
-print("[LOAD] Loading filtered pairs...")
-df_filtered = pd.read_json(PAIR_FILTERED_PATH)
-print("[LOAD] Loaded:", len(df_filtered), "rows")
+INTENT_TAXONOMY = {
+    "perpanjang": [
+        "tanya_tagihan",
+        "tanya_masa_aktif",
+        "ingin_bayar",
+        "minta_invoice",
+        "konfirmasi_akan_perpanjang",
+        "kirim_bukti_bayar",
+        "atas_nama_bayar",
+        "tidak_perpanjang",
+        "konfirmasi_sukses_perpanjang",
+    ],
+    "tanya_status": [
+        "status_pengerjaan",
+        "status_domain",
+        "status_update",
+        "status_perpanjangan",
+        "tanya_fasilitas",
+    ],
+    "minta_revisi": [
+        "revisi_konten",
+        "revisi_artikel",
+        "revisi_gambar",
+        "status_revisi",
+        "minta_akses_email",
+    ],
+    "komplain": [
+        "komplain_harga",
+        "komplain_layanan",
+        "komplain_respon_lama",
+        "komplain_performa",
+        "komplain_hasil_revisi",
+    ],
+    "lainnya": [
+        "salam",
+        "basa_basi",
+        "tidak_jelas",
+    ],
+}
 
 # =========================================================
 # SETUP OPENAI CLIENT
@@ -118,7 +177,7 @@ def classify_intent_gpt(user_text, context_text=""):
     """
 
     res = client.chat.completions.create(
-        model="gpt-4.1-mini",
+        model=SCORING_MODEL,
         messages=[{"role": "user", "content": prompt}]
     ).choices[0].message.content.strip()
 
@@ -188,7 +247,7 @@ def analyze_sentiment(text, context):
     """
 
     response = client.responses.create(
-        model="gpt-4.1-mini",
+        model=SCORING_MODEL,
         input=prompt,
     )
 
@@ -237,7 +296,7 @@ def compute_priority(intent_parent, intent_child, sentiment_score, text, context
     ---
     """
     response = client.responses.create(
-        model="gpt-4.1-mini",
+        model=SCORING_MODEL,
         input=prompt,
     )
 
@@ -245,92 +304,291 @@ def compute_priority(intent_parent, intent_child, sentiment_score, text, context
     return extract_int(raw)
 
 # =========================================================
-# THREADED WORKER
+# COMBINED SCORING (INTENT + SENTIMENT + PRIORITY, 1 CALL)
 # =========================================================
 
-def process_row(idx, row):
+def _taxonomy_text():
+    lines = []
+    for parent, children in INTENT_TAXONOMY.items():
+        lines.append(f"    - {parent}: {', '.join(children)}")
+    return "\n".join(lines)
+
+def parse_combined_scoring(raw):
     """
-    This function processes one row completely. 
-    It will be executed inside a thread.
+    Parse + validasi output JSON combined scoring.
+    Raise ValueError jika format / taxonomy tidak valid.
+    """
+    data = json.loads(raw)
+    if not isinstance(data, dict):
+        raise ValueError("combined scoring bukan JSON object")
+
+    parent = str(data.get("intent_parent", "")).strip().lower()
+    child = str(data.get("intent_child", "")).strip().lower()
+    if parent not in INTENT_TAXONOMY:
+        raise ValueError(f"intent_parent tidak dikenal: {parent!r}")
+    if child not in INTENT_TAXONOMY[parent]:
+        raise ValueError(f"intent_child {child!r} bukan sub intent dari {parent!r}")
+
+    scores = {}
+    for field in ("sentiment", "priority_score"):
+        value = data.get(field)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{field} harus angka")
+        if not 0 <= value <= 100:
+            raise ValueError(f"{field} di luar rentang 0-100: {value}")
+        scores[field] = int(round(value))
+
+    return {
+        "intent_parent": parent,
+        "intent_child": child,
+        "sentiment": scores["sentiment"],
+        "priority_score": scores["priority_score"]
+    }
+
+def build_combined_scoring_prompt(user_text, context_text=""):
+    """
+    Satu prompt untuk intent, sentiment, dan priority sekaligus.
+    Konteks dan pesan user hanya dikirim sekali.
     """
-    try:
-        context = build_gpt_context(row)
 
-        intent_parent, intent_child = classify_intent_gpt(
-            user_text=row["user_message"],
-            context_text=context
-        )
+    return f"""
+    Anda adalah sistem penilai chat pelanggan jasa perpanjangan website.
 
-        sentiment = analyze_sentiment(
-            row["user_message"],
-            context
-        )
+    --- CONTEXT CHAT SEBELUMNYA ---
+    {context_text}
 
-        priority = compute_priority(
-            intent_parent,
-            intent_child,
-            sentiment,
-            row["user_message"],
-            context
-        )
+    --- PESAN TERBARU ---
+    USER: \"\"\"{user_text}\"\"\"
 
-        return {
-            "index": idx,
-            "intent_parent": intent_parent,
-            "intent_child": intent_child,
-            "sentiment": sentiment,
-            "priority_score": priority
-        }
-
-    except Exception as e:
-        print(f"[ERROR] Row {idx}: {e}")
-        return {
-            "index": idx,
-            "intent_parent": "error",
-            "intent_child": "error",
-            "sentiment": 0,
-            "priority_score": 0
-        }
+    Tugas:
+    1. Klasifikasikan intent user (intent_parent + intent_child) berdasarkan pesan terbaru,
+       context chat sebelumnya, dan tujuan yang tersirat.
+       Pilihan yang valid (intent_parent: intent_child yang diizinkan):
+{_taxonomy_text()}
+
+    2. sentiment (0-100):
+    - 0-20   : Sangat Negatif (kemarahan, kekecewaan berat, ancaman, hinaan)
+    - 21-40  : Negatif (keluhan, frustrasi, tidak puas)
+    - 41-60  : Netral (informasi, pertanyaan, penjelasan tanpa emosi)
+    - 61-80  : Positif (terima kasih, puas, senang)
+    - 81-100 : Sangat Positif (antusiasme tinggi)
+
+    3. priority_score (0-100):
+    - Pembayaran, tagihan, invoice, konfirmasi pembayaran: 80-100
+    - Revisi website setelah perpanjangan: 70-79
+    - Ingin perpanjang, tanya masa aktif, janji tanggal perpanjang: 40-69
+    - Komplain: 30-39
+    - Tidak berminat / menolak lanjut: 0-29
+    Pertimbangkan urgensi, nilai bisnis, potensi kehilangan pelanggan, dan sentiment.
+
+    Jawab HANYA dengan JSON valid tanpa teks tambahan:
+    {{"intent_parent": "...", "intent_child": "...", "sentiment": 0, "priority_score": 0}}
+    """
+
+def combined_scoring_body(user_text, context_text=""):
+    return {
+        "model": SCORING_MODEL,
+        "messages": [{
+            "role": "user",
+            "content": build_combined_scoring_prompt(user_text, context_text)
+        }],
+        "response_format": {"type": "json_object"},
+        "temperature": 0
+    }
+
+def score_row_combined(user_text, context_text=""):
+    res = client.chat.completions.create(
+        **combined_scoring_body(user_text, context_text)
+    )
+    return parse_combined_scoring(res.choices[0].message.content.strip())
 
 # =========================================================
-# MAIN EXECUTION WITH THREAD POOL
+# ROW WORKER
 # =========================================================
 
-print("[LOAD] Loading filtered pairs...")
-df = pd.read_json(PAIR_FILTERED_PATH)
-print("[LOAD] Rows:", len(df))
+def scoring_key(row):
+    """
+    Key checkpoint = hash isi row + model, bukan index DataFrame.
+    """
+    return row_hash(
+        SCORING_MODEL,
+        row.get("conversation_id"),
+        row.get("user_message"),
+        row.get("context") if isinstance(row.get("context"), list) else [],
+    )
 
-results = []
+def process_row(row):
+    """
+    Proses satu row secara lengkap (dijalankan di thread).
+    Error TIDAK ditelan di sini, supaya runner bisa retry / mencatatnya
+    sebagai gagal di checkpoint.
 
-print(f"[THREAD] Processing with max_workers={MAX_WORKERS}")
+    Mode combined: 1 call JSON, fallback ke 3 prompt terpisah hanya
+    jika output JSON gagal di-parse / tidak sesuai taxonomy.
+    """
+    if SCORING_MODE == "combined":
+        try:
+            return score_row_combined(
+                user_text=row["user_message"],
+                context_text=build_gpt_context(row)
+            )
+        except ValueError as e:
+            # json.JSONDecodeError juga turunan ValueError
+            print(f"[COMBINED FALLBACK] {str(row['user_message'])[:40]!r}: {e}")
+
+    return process_row_separate(row)
+
+def process_row_separate(row):
+    context = build_gpt_context(row)
+
+    intent_parent, intent_child = classify_intent_gpt(
+        user_text=row["user_message"],
+        context_text=context
+    )
 
-with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+    sentiment = analyze_sentiment(
+        row["user_message"],
+        context
+    )
 
-    futures = [
-        executor.submit(process_row, idx, row)
-        for idx, row in df.iterrows()
-    ]
+    priority = compute_priority(
+        intent_parent,
+        intent_child,
+        sentiment,
+        row["user_message"],
+        context
+    )
 
-    for future in as_completed(futures):
-        results.append(future.result())
+    return {
+        "intent_parent": intent_parent,
+        "intent_child": intent_child,
+        "sentiment": sentiment,
+        "priority_score": priority
+    }
 
 # =========================================================
-# MERGE RESULTS BACK TO DATAFRAME
+# OFFLINE BATCH MODE
 # =========================================================
 
-result_df = pd.DataFrame(results).set_index("index")
-result_df = result_df.sort_index()
+def run_scoring_batch(jobs, store):
+    """
+    Kirim semua row yang belum selesai sebagai 1 batch job (combined prompt),
+    lalu tulis hasilnya ke checkpoint store yang sama. Row yang gagal
+    di-parse dicatat "error" dan akan di-retry secara sinkron setelahnya.
+    """
+    if SCORING_BATCH_MODE == "openai":
+        backend = OpenAIBatchBackend(client)
+    elif SCORING_BATCH_MODE == "local":
+        backend = LocalBatchBackend(sync_openai_handler(client))
+    else:
+        raise ValueError(f"SCORING_BATCH_MODE tidak dikenal: {SCORING_BATCH_MODE}")
+
+    requests = [
+        make_request(
+            key,
+            "/v1/chat/completions",
+            combined_scoring_body(row["user_message"], build_gpt_context(row))
+        )
+        for key, row in jobs.items()
+        if not store.is_done(key)
+    ]
+    if not requests:
+        print("[BATCH] Nothing to submit, semua row sudah ada di checkpoint")
+        return
+
+    results, errors = run_batch(
+        backend,
+        requests,
+        workdir=BATCH_WORKDIR,
+        name="scoring",
+        endpoint="/v1/chat/completions",
+        poll_interval=BATCH_POLL_SECONDS,
+    )
 
-df["intent_parent"] = result_df["intent_parent"]
-df["intent_child"] = result_df["intent_child"]
-df["sentiment"] = result_df["sentiment"]
-df["priority_score"] = result_df["priority_score"]
+    for req in requests:
+        key = req["custom_id"]
+        body = results.get(key)
+        if body is None:
+            store.append(key, "error", error=str(errors.get(key, "missing from batch output")))
+            continue
+        try:
+            raw = body["choices"][0]["message"]["content"].strip()
+            store.append(key, "ok", result=parse_combined_scoring(raw))
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            store.append(key, "error", error=f"batch parse failed: {e}")
+
+    # hasil sudah di checkpoint → state batch boleh dihapus
+    finish_batch(BATCH_WORKDIR, "scoring")
 
 # =========================================================
-# SAVE FINAL RESULT
+# MAIN EXECUTION (CHECKPOINTED, RESUMABLE)
 # =========================================================
 
-with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
-    json.dump(df.to_dict(orient="records"), f, ensure_ascii=False, indent=2)
+def main():
+    print("[LOAD] Loading filtered pairs...")
+    df = pd.read_json(PAIR_FILTERED_PATH)
+    print("[LOAD] Rows:", len(df))
+
+    records = df.to_dict(orient="records")
+    keys = [scoring_key(r) for r in records]
+
+    store = CheckpointStore(CHECKPOINT_PATH)
+    print(f"[CHECKPOINT] {CHECKPOINT_PATH} | existing records={len(store)}")
+
+    # row duplikat (isi sama) cukup diproses sekali
+    jobs = {}
+    for key, row in zip(keys, records):
+        jobs.setdefault(key, row)
+
+    try:
+        if SCORING_BATCH_MODE != "off":
+            run_scoring_batch(jobs, store)
+
+        # mode sinkron, atau sisa row yang gagal di batch
+        print(f"[THREAD] Processing with max_workers={MAX_WORKERS} | rate={RATE_PER_SEC}/s")
+        run_checkpointed_jobs(
+            jobs.items(),
+            process_row,
+            store,
+            max_workers=MAX_WORKERS,
+            rate_per_sec=RATE_PER_SEC,
+            max_attempts=MAX_ATTEMPTS,
+        )
+    finally:
+        store.close()
+
+    # =========================================================
+    # MERGE RESULTS BACK TO DATAFRAME
+    # =========================================================
+
+    ok_mask = []
+    for col in ("intent_parent", "intent_child", "sentiment", "priority_score"):
+        df[col] = None
+
+    for idx, key in zip(df.index, keys):
+        rec = store.get(key)
+        ok = bool(rec) and rec["status"] == "ok"
+        ok_mask.append(ok)
+        if ok:
+            for col, value in rec["result"].items():
+                df.at[idx, col] = value
+
+    df_ok = df[ok_mask]
+    failed = len(df) - len(df_ok)
+    if failed:
+        print(
+            f"[WARNING] {failed} rows gagal diproses dan TIDAK ikut disimpan. "
+            f"Jalankan ulang script untuk retry row yang gagal saja."
+        )
+
+    # =========================================================
+    # SAVE FINAL RESULT
+    # =========================================================
+
+    with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
+        json.dump(df_ok.to_dict(orient="records"), f, ensure_ascii=False, indent=2)
+
+    print("[DONE] Saved:", OUTPUT_PATH)
 
-print("[DONE] Saved:", OUTPUT_PATH)
+if __name__ == "__main__":
+    main()
@@ -3,21 +3,40 @@ import json
 import time
 from tqdm import tqdm
 from typing import List, Dict, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
 import pandas as pd
 from openai import OpenAI
 
+from batch_jobs import (
+    LocalBatchBackend,
+    OpenAIBatchBackend,
+    finish_batch,
+    make_request,
+    run_batch,
+    sync_openai_handler,
+)
+from embedding_cache import EMBEDDING_DIM, EmbeddingCache, embedding_key, embedding_params, truncate_embedding
+from llm_jobs import is_rate_limit_error, retry_after_seconds
+
+PAIR_PATH = "data/pairs_perpanjangan_with_intent_and_score.json"
+SAVE_PATH = "model/pairs_perpanjangan_with_intent_embedding.json"
+EMBEDDING_MODEL = "text-embedding-3-large"
+# "off" = request sinkron, "openai" = Batch API, "local" = stand-in lokal
+EMBEDDING_BATCH_MODE = os.getenv("EMBEDDING_BATCH_MODE", "off")
+BATCH_WORKDIR = "data/batches"
+BATCH_POLL_SECONDS = int(os.getenv("BATCH_POLL_SECONDS", "60"))
+# jumlah input per request embeddings & jumlah request paralel
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_MAX_WORKERS = int(os.getenv("EMBEDDING_MAX_WORKERS", "4"))
+EMBEDDING_MAX_ATTEMPTS = int(os.getenv("EMBEDDING_MAX_ATTEMPTS", "6"))
+
 # =========================================================
 # LOAD PAIRS
 # =========================================================
 def load_pairs(path):
     return pd.read_json(path)
 
-PAIR_PATH = "data/pairs_perpanjangan_with_intent_and_score.json"
-df_pairs = load_pairs(PAIR_PATH)
-
-print("Rows loaded:", len(df_pairs))
-
 # =========================================================
 # MASUK API
 # =========================================================
@@ -31,36 +50,162 @@ def build_text_for_embedding(user_message: str):
 
 def generate_embedding(text):
     res = CLIENT.embeddings.create(
-        model="text-embedding-3-large",
+        **embedding_params(EMBEDDING_MODEL),
         input=text
     )
     return res.data[0].embedding
 
-# Build text_for_embedding
-df_pairs["text_for_embedding"] = df_pairs.apply(
-    lambda r: build_text_for_embedding(
-        r["user_message"]
-    ),
-    axis=1
-)
+def embed_chunk(texts):
+    """
+    1 request berisi banyak input, retry + backoff saat kena 429.
+    """
+    for attempt in range(1, EMBEDDING_MAX_ATTEMPTS + 1):
+        try:
+            res = CLIENT.embeddings.create(
+                **embedding_params(EMBEDDING_MODEL),
+                input=texts
+            )
+            # urutan output mengikuti field index, bukan urutan list
+            return [d.embedding for d in sorted(res.data, key=lambda d: d.index)]
+        except Exception as e:
+            if not is_rate_limit_error(e) or attempt == EMBEDDING_MAX_ATTEMPTS:
+                raise
+            delay = retry_after_seconds(e, 2 ** attempt)
+            print(f"[EMBED] 429, retry {attempt}/{EMBEDDING_MAX_ATTEMPTS} in {delay:.1f}s")
+            time.sleep(delay)
+
+def generate_embeddings(texts, cache):
+    """
+    Dedup text → ambil dari cache → sisanya di-embed per chunk
+    (EMBEDDING_BATCH_SIZE input per request) secara paralel.
+    Hasil langsung masuk cache, jadi run yang terputus bisa dilanjutkan.
+    Return dict text -> embedding.
+    """
+    unique = list(dict.fromkeys(texts))
+    keys = {t: embedding_key(EMBEDDING_MODEL, t, EMBEDDING_DIM) for t in unique}
+    cached = cache.get_many(keys.values())
+
+    embeddings = {t: cached[k] for t, k in keys.items() if k in cached}
+    missing = [t for t in unique if t not in embeddings]
+
+    if EMBEDDING_DIM and missing:
+        # embedding dimensi penuh yang sudah di-cache cukup dipotong
+        full_keys = {t: embedding_key(EMBEDDING_MODEL, t) for t in missing}
+        full = cache.get_many(full_keys.values())
+        truncated = {
+            t: truncate_embedding(full[k], EMBEDDING_DIM)
+            for t, k in full_keys.items()
+            if k in full and len(full[k]) >= EMBEDDING_DIM
+        }
+        if truncated:
+            cache.put_many((keys[t], v) for t, v in truncated.items())
+            embeddings.update(truncated)
+            missing = [t for t in missing if t not in truncated]
+    print(
+        f"[EMBED] texts={len(texts)} | unique={len(unique)} | "
+        f"cached={len(embeddings)} | to_embed={len(missing)}"
+    )
+    if not missing:
+        return embeddings
+
+    if EMBEDDING_BATCH_MODE != "off":
+        new = generate_embeddings_batch(missing)
+        cache.put_many((keys[t], v) for t, v in new.items())
+        # hasil sudah di cache → state batch boleh dihapus
+        finish_batch(BATCH_WORKDIR, "embedding")
+        embeddings.update(new)
+        return embeddings
 
-# Generate embeddings
-tqdm.pandas()
-df_pairs["embedding"] = df_pairs["text_for_embedding"].progress_apply(generate_embedding)
+    chunks = [
+        missing[i:i + EMBEDDING_BATCH_SIZE]
+        for i in range(0, len(missing), EMBEDDING_BATCH_SIZE)
+    ]
+    with ThreadPoolExecutor(max_workers=EMBEDDING_MAX_WORKERS) as executor:
+        futures = {executor.submit(embed_chunk, c): c for c in chunks}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="embedding"):
+            chunk = futures[future]
+            vectors = future.result()
+            cache.put_many((keys[t], v) for t, v in zip(chunk, vectors))
+            embeddings.update(zip(chunk, vectors))
 
-print("Embedding complete:", len(df_pairs))
+    return embeddings
 
 # =========================================================
-# SAVE EMBEDDING
+# OFFLINE BATCH MODE
 # =========================================================
-SAVE_PATH = "model/pairs_perpanjangan_with_intent_embedding.json"
+def generate_embeddings_batch(texts):
+    """
+    Embed semua text unik lewat batch job, merge balik by custom_id.
+    Text yang gagal di batch di-embed ulang secara sinkron.
+    Return dict text -> embedding.
+    """
+    if EMBEDDING_BATCH_MODE == "openai":
+        backend = OpenAIBatchBackend(CLIENT)
+    elif EMBEDDING_BATCH_MODE == "local":
+        backend = LocalBatchBackend(sync_openai_handler(CLIENT))
+    else:
+        raise ValueError(f"EMBEDDING_BATCH_MODE tidak dikenal: {EMBEDDING_BATCH_MODE}")
 
-df_pairs.to_json(
-    SAVE_PATH,
-    orient="records",
-    lines=True,
-    force_ascii=False
-)
+    by_id = {embedding_key(EMBEDDING_MODEL, t, EMBEDDING_DIM): t for t in set(texts)}
+    requests = [
+        make_request(cid, "/v1/embeddings", {**embedding_params(EMBEDDING_MODEL), "input": text})
+        for cid, text in by_id.items()
+    ]
+
+    results, _ = run_batch(
+        backend,
+        requests,
+        workdir=BATCH_WORKDIR,
+        name="embedding",
+        endpoint="/v1/embeddings",
+        poll_interval=BATCH_POLL_SECONDS,
+    )
+
+    embeddings = {}
+    for cid, text in by_id.items():
+        body = results.get(cid)
+        if body is not None:
+            embeddings[text] = body["data"][0]["embedding"]
+        else:
+            embeddings[text] = generate_embedding(text)
+    return embeddings
+
+# =========================================================
+# MAIN
+# =========================================================
+def main():
+    df_pairs = load_pairs(PAIR_PATH)
+    print("Rows loaded:", len(df_pairs))
+
+    # Build text_for_embedding
+    df_pairs["text_for_embedding"] = df_pairs.apply(
+        lambda r: build_text_for_embedding(
+            r["user_message"]
+        ),
+        axis=1
+    )
+
+    # Generate embeddings (dedup + cache + batched)
+    cache = EmbeddingCache()
+    try:
+        embeddings = generate_embeddings(df_pairs["text_for_embedding"].tolist(), cache)
+    finally:
+        cache.close()
+    df_pairs["embedding"] = df_pairs["text_for_embedding"].map(embeddings)
+
+    print("Embedding complete:", len(df_pairs))
+
+    # =========================================================
+    # SAVE EMBEDDING
+    # =========================================================
+    df_pairs.to_json(
+        SAVE_PATH,
+        orient="records",
+        lines=True,
+        force_ascii=False
+    )
 
-print("Saved:", SAVE_PATH)
+    print("Saved:", SAVE_PATH)
 
+if __name__ == "__main__":
+    main()
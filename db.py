@@ -13,6 +13,14 @@ def insert_chat_pair(data: dict):
     conn = get_conn()
     cur = conn.cursor()
 
+    # near-duplicate dari pair yang sudah ada → tetap disimpan sebagai riwayat,
+    # tapi ditandai canonical_id supaya tidak ikut retrieval.
+    # dedup memuat numpy, jadi baru di-import saat insert pertama
+    from dedup import find_canonical_id, response_key
+
+    key = response_key(data["admin_response"])
+    canonical_id = find_canonical_id(cur, key, data["intent_parent"], data["embedding"])
+
     cur.execute("""
         INSERT INTO chat_pairs (
             conversation_id,
@@ -26,8 +34,10 @@ def insert_chat_pair(data: dict):
             priority_score,
             reward_count,
             punish_count,
-            embedding
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            embedding,
+            response_key,
+            canonical_id
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """, (
         data["conversation_id"],
         data["session_id"],
@@ -40,7 +50,9 @@ def insert_chat_pair(data: dict):
         data["priority_score"],
         data["reward_count"],
         data["punish_count"],
-        json.dumps(data["embedding"])
+        json.dumps(data["embedding"]),
+        key,
+        canonical_id
     ))
 
     conn.commit()
@@ -83,9 +95,10 @@ def fetch_dataset_by_intent(intent_parent=None):
             SELECT *
             FROM chat_pairs
             WHERE intent_parent = ?
+              AND canonical_id IS NULL
         """, (intent_parent,))
     else:
-        cur.execute("SELECT * FROM chat_pairs")
+        cur.execute("SELECT * FROM chat_pairs WHERE canonical_id IS NULL")
 
     rows = cur.fetchall()
     cols = [desc[0] for desc in cur.description]
@@ -112,6 +125,21 @@ def fetch_next_turn_index(conversation_id):
     conn.close()
     return val
 
+def fetch_last_intent_child(conversation_id):
+    """intent_child turn terakhir percakapan (None jika belum ada)."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT intent_child
+        FROM chat_pairs
+        WHERE conversation_id = ?
+        ORDER BY turn_index DESC
+        LIMIT 1
+    """, (conversation_id,))
+    row = cur.fetchone()
+    conn.close()
+    return row[0] if row else None
+
 # def insert_payment_event(data):
 #     conn = get_conn()
 #     c = conn.cursor()
@@ -137,6 +165,15 @@ def fetch_next_turn_index(conversation_id):
 #     conn.commit()
 #     conn.close()
 
+# feedback untuk pair duplikat diarahkan ke pair kanoniknya
+_FEEDBACK_TARGET = """
+    WHERE id IN (
+        SELECT COALESCE(canonical_id, id)
+        FROM chat_pairs
+        WHERE session_id = ?
+    )
+"""
+
 def apply_feedback_db(session_id, rating):
     conn = get_conn()
     cur = conn.cursor()
@@ -146,16 +183,14 @@ def apply_feedback_db(session_id, rating):
             UPDATE chat_pairs
             SET priority_score = MIN(priority_score + 5, 100),
                 reward_count = reward_count + 1
-            WHERE session_id = ?
-        """, (session_id,))
+        """ + _FEEDBACK_TARGET, (session_id,))
 
     elif rating == -1:
         cur.execute("""
             UPDATE chat_pairs
             SET priority_score = MAX(priority_score - 10, 0),
                 punish_count = punish_count + 1
-            WHERE session_id = ?
-        """, (session_id,))
+        """ + _FEEDBACK_TARGET, (session_id,))
 
     conn.commit()
 
@@ -164,3 +199,59 @@ def apply_feedback_db(session_id, rating):
 
     return updated > 0
 
+def session_exists(session_id):
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT 1 FROM chat_pairs WHERE session_id = ? LIMIT 1",
+        (session_id,),
+    )
+    row = cur.fetchone()
+    conn.close()
+    return row is not None
+
+def apply_feedback_batch(counts):
+    """
+    Terapkan banyak feedback {session_id: (jumlah reward, jumlah punish)}
+    dalam satu transaksi, aturan sama dengan apply_feedback_db (+5 per
+    reward maks 100, -10 per punish min 0). Reward diterapkan sebelum
+    punish. Return {id pair: priority_score baru} untuk pair yang terkena,
+    supaya index retrieval bisa di-update.
+    """
+    updates = [
+        (rewards, punishes, rewards, punishes, s)
+        for s, (rewards, punishes) in counts.items()
+        if rewards or punishes
+    ]
+    sessions = [u[-1] for u in updates]
+    if not sessions:
+        return {}
+
+    conn = get_conn()
+    cur = conn.cursor()
+
+    cur.executemany("""
+        UPDATE chat_pairs
+        SET priority_score = MAX(MIN(priority_score + 5 * ?, 100) - 10 * ?, 0),
+            reward_count = reward_count + ?,
+            punish_count = punish_count + ?
+    """ + _FEEDBACK_TARGET, updates)
+
+    priorities = {}
+    for i in range(0, len(sessions), 500):
+        chunk = sessions[i:i + 500]
+        cur.execute(f"""
+            SELECT id, priority_score
+            FROM chat_pairs
+            WHERE id IN (
+                SELECT COALESCE(canonical_id, id)
+                FROM chat_pairs
+                WHERE session_id IN ({','.join('?' for _ in chunk)})
+            )
+        """, chunk)
+        priorities.update(cur.fetchall())
+
+    conn.commit()
+    conn.close()
+    return priorities
+
@@ -2,10 +2,67 @@ import sqlite3
 
 DB_PATH = "chatbot.db"
 
-def init_db():
+# Naikkan setiap kali schema di bawah berubah (kolom / index baru).
+# Disimpan di PRAGMA user_version → init_db() pada DB yang sudah sesuai
+# cukup 1 query, bukan CREATE/ALTER/PRAGMA table_info tiap import.
+SCHEMA_VERSION = 2
+
+def _col_exists(cur, table, col):
+    cur.execute(f"PRAGMA table_info({table})")
+    return any(r[1] == col for r in cur.fetchall())
+
+def _index_exists(cur, name):
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,))
+    return cur.fetchone() is not None
+
+def _dedup_import_turns(cur):
+    """
+    DB lama bisa berisi import ganda (migrate dijalankan berulang sebelum
+    ada upsert). Sisakan row terbaru (MAX(id)) per (conversation_id,
+    turn_index); canonical_id yang menunjuk row terhapus dialihkan ke row
+    yang disisakan. Return jumlah row yang dihapus.
+    """
+    cur.execute("""
+    CREATE TEMP TABLE import_turn_dupes AS
+    SELECT p.id AS old_id, k.keep_id
+    FROM chat_pairs p
+    JOIN (
+        SELECT conversation_id, turn_index, MAX(id) AS keep_id
+        FROM chat_pairs
+        WHERE session_id IS NULL
+        GROUP BY conversation_id, turn_index
+        HAVING COUNT(*) > 1
+    ) k
+      ON p.conversation_id = k.conversation_id
+     AND p.turn_index = k.turn_index
+    WHERE p.session_id IS NULL
+      AND p.id != k.keep_id
+    """)
+    removed = cur.execute("SELECT COUNT(*) FROM import_turn_dupes").fetchone()[0]
+    if removed:
+        cur.execute("""
+        UPDATE chat_pairs
+        SET canonical_id = (
+            SELECT keep_id FROM import_turn_dupes WHERE old_id = chat_pairs.canonical_id
+        )
+        WHERE canonical_id IN (SELECT old_id FROM import_turn_dupes)
+        """)
+        cur.execute("UPDATE chat_pairs SET canonical_id = NULL WHERE canonical_id = id")
+        cur.execute("DELETE FROM chat_pairs WHERE id IN (SELECT old_id FROM import_turn_dupes)")
+    cur.execute("DROP TABLE import_turn_dupes")
+    return removed
+
+def init_db(force=False):
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
 
+    if not force and cur.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        conn.close()
+        return False
+
+    # hanya berlaku untuk DB baru; DB lama perlu `python compaction.py --enable-incremental-vacuum`
+    cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
     # =======================
     # CHAT PAIRS
     # =======================
@@ -31,25 +88,65 @@ def init_db():
 
         embedding TEXT,
 
+        content_hash TEXT,
+
+        response_key TEXT,
+        canonical_id INTEGER,
+
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
     """)
 
+    # Backward compatibility untuk DB lama
+    required_cols = {
+        "content_hash": "TEXT",
+        "response_key": "TEXT",
+        "canonical_id": "INTEGER",
+    }
+    for col, col_type in required_cols.items():
+        if not _col_exists(cur, "chat_pairs", col):
+            cur.execute(f"ALTER TABLE chat_pairs ADD COLUMN {col} {col_type}")
+
     cur.execute("""
     CREATE INDEX IF NOT EXISTS idx_conversation
     ON chat_pairs (conversation_id, turn_index)
     """)
 
+    # Row hasil import (session_id NULL) unik per (conversation_id, turn_index),
+    # dipakai sebagai target upsert migrate_json_to_sqlite.
+    # Row live dari /chat punya session_id sehingga tidak ikut dibatasi.
+    if not _index_exists(cur, "ux_import_turn"):
+        removed = _dedup_import_turns(cur)
+        if removed:
+            print(f"⚠️ Removed {removed} duplicate imported turns before creating ux_import_turn")
+    cur.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_import_turn
+    ON chat_pairs (conversation_id, turn_index)
+    WHERE session_id IS NULL
+    """)
+
     cur.execute("""
     CREATE INDEX IF NOT EXISTS idx_intent_parent
     ON chat_pairs (intent_parent)
     """)
 
+    # kandidat near-duplicate (lihat dedup.py)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_response_key
+    ON chat_pairs (response_key, intent_parent)
+    """)
+
     cur.execute("""
     CREATE INDEX IF NOT EXISTS idx_priority
     ON chat_pairs (priority_score DESC)
     """)
 
+    # lookup /feedback per session_id (lihat feedback_queue.py)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_session
+    ON chat_pairs (session_id)
+    """)
+
     # # =======================
     # # PAYMENT EVENTS (LOG)
     # # =======================
@@ -87,9 +184,11 @@ def init_db():
     # )
     # """)
 
+    cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
     conn.close()
     print("✅ SQLite DB initialized")
+    return True
 
 if __name__ == "__main__":
-    init_db()
+    init_db(force=True)
@@ -0,0 +1,297 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from itertools import groupby
+
+import numpy as np
+
+from db_init import init_db
+
+DB_PATH = "chatbot.db"
+
+# cosine minimum supaya 2 pair dianggap duplikat
+DEDUP_SIMILARITY_THRESHOLD = float(os.getenv("DEDUP_SIMILARITY_THRESHOLD", "0.97"))
+# maksimal kandidat yang dicek saat insert online
+DEDUP_ONLINE_CANDIDATES = int(os.getenv("DEDUP_ONLINE_CANDIDATES", "50"))
+DEDUP_ONLINE = os.getenv("DEDUP_ONLINE", "1") == "1"
+
+# =========================================================
+# NORMALISASI RESPONSE
+# =========================================================
+#
+# Pair dianggap duplikat jika:
+#   - admin_response sama setelah dinormalisasi (response_key sama)
+#   - intent_parent sama (retrieval difilter per intent)
+#   - cosine embedding user_message >= threshold
+#
+# Duplikat TIDAK dihapus karena chat_pairs juga dipakai sebagai riwayat
+# percakapan (fetch_context). Duplikat ditandai canonical_id = id pair
+# kanonik, dan retrieval hanya membaca row dengan canonical_id NULL.
+
+def normalize_response_text(text):
+    if not text:
+        return ""
+    s = str(text).lower()
+    s = re.sub(r"http\S+|www\.\S+", " ", s)
+    s = re.sub(r"[^a-z0-9\s{}$_]", " ", s)
+    return re.sub(r"\s+", " ", s).strip()
+
+
+def response_key(text):
+    norm = normalize_response_text(text)
+    return hashlib.sha1(norm.encode("utf-8")).hexdigest()
+
+
+def _unit(vec):
+    v = np.asarray(vec, dtype=np.float32)
+    n = np.linalg.norm(v)
+    return v / n if n else v
+
+# =========================================================
+# ONLINE DEDUP (DIPANGGIL SAAT INSERT)
+# =========================================================
+
+def find_canonical_id(cur, key, intent_parent, embedding, threshold=DEDUP_SIMILARITY_THRESHOLD):
+    """
+    Cari pair kanonik yang hampir identik dengan pair baru.
+    Return id pair kanonik, atau None jika tidak ada.
+    """
+    if not DEDUP_ONLINE or not embedding:
+        return None
+
+    cur.execute(
+        """
+        SELECT id, embedding
+        FROM chat_pairs
+        WHERE response_key = ?
+          AND intent_parent IS ?
+          AND canonical_id IS NULL
+          AND embedding IS NOT NULL
+        ORDER BY id
+        LIMIT ?
+        """,
+        (key, intent_parent, DEDUP_ONLINE_CANDIDATES),
+    )
+    rows = cur.fetchall()
+    if not rows:
+        return None
+
+    q = _unit(embedding)
+    for row_id, emb_json in rows:
+        emb = json.loads(emb_json)
+        if len(emb) == len(q) and float(np.dot(_unit(emb), q)) >= threshold:
+            return row_id
+    return None
+
+# =========================================================
+# OFFLINE DEDUP
+# =========================================================
+
+def _fill_response_keys(cur):
+    cur.execute("SELECT id, admin_response FROM chat_pairs WHERE response_key IS NULL")
+    updates = [(response_key(text), row_id) for row_id, text in cur.fetchall()]
+    cur.executemany("UPDATE chat_pairs SET response_key = ? WHERE id = ?", updates)
+    return len(updates)
+
+
+def _canonical_order(row):
+    # prioritas kanonik: data historis (session_id NULL) → feedback terbaik → id tertua
+    row_id, _, _, session_id, _, reward, punish, _ = row
+    return (session_id is not None, -(reward - punish), row_id)
+
+
+def cluster_group(rows, threshold):
+    """
+    Leader clustering dalam 1 grup (response_key, intent_parent).
+    Return list cluster, tiap cluster = list row (row pertama = kanonik).
+    """
+    rows = sorted(rows, key=_canonical_order)
+    leaders = []
+    leader_vecs = []
+    clusters = []
+
+    for row in rows:
+        vec = _unit(json.loads(row[7])) if row[7] else None
+        if vec is not None and leader_vecs:
+            same_dim = [i for i, lv in enumerate(leader_vecs) if len(lv) == len(vec)]
+            if same_dim:
+                sims = np.stack([leader_vecs[i] for i in same_dim]) @ vec
+                best = int(np.argmax(sims))
+                if sims[best] >= threshold:
+                    clusters[same_dim[best]].append(row)
+                    continue
+        leaders.append(row)
+        leader_vecs.append(vec if vec is not None else np.zeros(0, dtype=np.float32))
+        clusters.append([row])
+
+    return clusters
+
+
+def merge_signals(canonical, duplicates):
+    """
+    Feedback duplikat "diputar ulang" ke pair kanonik dengan aturan
+    yang sama seperti apply_feedback_db (+5 per reward, -10 per punish).
+    Counter di row duplikat kemudian dinolkan oleh dedup_corpus.
+    """
+    _, _, _, _, priority, reward, punish, _ = canonical
+    extra_reward = sum(d[5] for d in duplicates)
+    extra_punish = sum(d[6] for d in duplicates)
+    priority = (priority if priority is not None else 50) + 5 * extra_reward - 10 * extra_punish
+    return (
+        int(min(max(priority, 0), 100)),
+        reward + extra_reward,
+        punish + extra_punish,
+    )
+
+
+def _collect_vector(out, emb_json):
+    emb = json.loads(emb_json) if emb_json else []
+    if emb:
+        out.append(np.asarray(emb, dtype=np.float32))
+
+
+def measure_scan_latency_ms(matrix, queries, k=3):
+    """
+    Latency full-scan cosine + top-k (setara retrieve_top_k tanpa pandas).
+    """
+    if len(matrix) == 0 or len(queries) == 0:
+        return 0.0
+    norms = np.linalg.norm(matrix, axis=1) + 1e-12
+    t0 = time.perf_counter()
+    for q in queries:
+        sims = (matrix @ q) / norms
+        np.argpartition(-sims, min(k, len(sims) - 1))[:k]
+    return (time.perf_counter() - t0) * 1000 / len(queries)
+
+
+def dedup_corpus(threshold=DEDUP_SIMILARITY_THRESHOLD, dry_run=False, measure_latency=True):
+    init_db()
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+
+    filled = _fill_response_keys(cur)
+    if filled:
+        print(f"[DEDUP] Filled response_key for {filled} rows")
+
+    cur.execute("""
+        SELECT id, response_key, intent_parent, session_id,
+               priority_score, reward_count, punish_count, embedding
+        FROM chat_pairs
+        WHERE canonical_id IS NULL
+        ORDER BY response_key, intent_parent
+    """)
+
+    before = 0
+    canonical_updates = []
+    duplicate_updates = []
+    kept_vectors = []
+    dropped_vectors = []
+
+    for _, group in groupby(cur, key=lambda r: (r[1], r[2])):
+        group = list(group)
+        before += len(group)
+
+        for cluster in cluster_group(group, threshold):
+            canonical, dups = cluster[0], cluster[1:]
+            if measure_latency:
+                _collect_vector(kept_vectors, canonical[7])
+            if not dups:
+                continue
+            canonical_updates.append(merge_signals(canonical, dups) + (canonical[0],))
+            for d in dups:
+                duplicate_updates.append((canonical[0], d[0]))
+                if measure_latency:
+                    _collect_vector(dropped_vectors, d[7])
+
+    after = before - len(duplicate_updates)
+    reduction = (1 - after / before) * 100 if before else 0.0
+    print(
+        f"[DEDUP] retrieval corpus: {before} → {after} rows "
+        f"({len(duplicate_updates)} duplicates, -{reduction:.1f}%) | "
+        f"clusters merged={len(canonical_updates)} | threshold={threshold}"
+    )
+
+    report = {
+        "rows_before": before,
+        "rows_after": after,
+        "duplicates": len(duplicate_updates),
+        "reduction_pct": round(reduction, 2),
+    }
+
+    if measure_latency and kept_vectors:
+        dims = {len(v) for v in kept_vectors}
+        if len(dims) == 1:
+            kept = np.stack(kept_vectors)
+            full = np.vstack([kept] + ([np.stack(dropped_vectors)] if dropped_vectors else []))
+            rng = np.random.default_rng(0)
+            queries = full[rng.choice(len(full), size=min(20, len(full)), replace=False)]
+            report["scan_ms_before"] = round(measure_scan_latency_ms(full, queries), 3)
+            report["scan_ms_after"] = round(measure_scan_latency_ms(kept, queries), 3)
+            print(
+                f"[DEDUP] full-scan retrieval latency: "
+                f"{report['scan_ms_before']:.2f}ms → {report['scan_ms_after']:.2f}ms per query"
+            )
+
+    if dry_run:
+        print("[DEDUP] Dry run, tidak ada perubahan yang disimpan")
+        conn.rollback()
+    else:
+        cur.executemany(
+            """
+            UPDATE chat_pairs
+            SET priority_score = ?, reward_count = ?, punish_count = ?
+            WHERE id = ?
+            """,
+            canonical_updates,
+        )
+        # pair yang sebelumnya sudah kanonik bisa ikut tergabung: duplikat
+        # lamanya dialihkan ke kanonik baru, supaya feedback lewat
+        # COALESCE(canonical_id, id) tidak berhenti di row non-retrieval.
+        # Counter mereka sudah terakumulasi di kanonik lama (merge_signals
+        # run sebelumnya / feedback yang diarahkan) dan sudah nol di row
+        # duplikatnya, jadi cukup ikut dipindah lewat canonical_updates
+        cur.execute("SELECT DISTINCT canonical_id FROM chat_pairs WHERE canonical_id IS NOT NULL")
+        has_duplicates = {row[0] for row in cur.fetchall()}
+        repointed = 0
+        for new_id, old_id in duplicate_updates:
+            if old_id not in has_duplicates:
+                continue
+            cur.execute(
+                "UPDATE chat_pairs SET canonical_id = ? WHERE canonical_id = ?",
+                (new_id, old_id),
+            )
+            repointed += cur.rowcount
+        # counter duplikat sudah dipindah ke kanonik (merge_signals); dinolkan
+        # supaya tidak terhitung dua kali jika nanti dialihkan / dilepas lagi
+        cur.executemany(
+            """
+            UPDATE chat_pairs
+            SET canonical_id = ?, reward_count = 0, punish_count = 0
+            WHERE id = ?
+            """,
+            duplicate_updates,
+        )
+        conn.commit()
+        report["repointed"] = repointed
+        if repointed:
+            print(f"[DEDUP] {repointed} duplikat lama dialihkan ke kanonik baru")
+
+    conn.close()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Near-duplicate dedup untuk chat_pairs")
+    parser.add_argument("--threshold", type=float, default=DEDUP_SIMILARITY_THRESHOLD)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--no-latency", action="store_true")
+    args = parser.parse_args()
+    dedup_corpus(
+        threshold=args.threshold,
+        dry_run=args.dry_run,
+        measure_latency=not args.no_latency,
+    )
@@ -0,0 +1,109 @@
+import os
+import sqlite3
+import threading
+
+from llm_jobs import row_hash
+
+EMBEDDING_CACHE_PATH = "model/embedding_cache.db"
+
+# numpy di-import di dalam fungsi: embedding_params ikut dimuat app Flask
+# saat import, sedangkan sisanya hanya dipakai script offline & index
+
+# dimensi output text-embedding-3-* (Matryoshka), 0/kosong = dimensi penuh model
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "0")) or None
+
+# =========================================================
+# EMBEDDING DIMENSION
+# =========================================================
+
+def embedding_params(model, dimensions=EMBEDDING_DIM):
+    """Argumen embeddings.create; `dimensions` hanya dikirim jika diset."""
+    params = {"model": model}
+    if dimensions:
+        params["dimensions"] = dimensions
+    return params
+
+
+def truncate_embedding(vec, dim):
+    """
+    Potong ke `dim` dimensi pertama lalu normalisasi ulang. Untuk model
+    text-embedding-3 hasilnya setara dengan request `dimensions=dim`.
+    """
+    import numpy as np
+
+    v = np.asarray(vec, dtype=np.float32)[:dim]
+    n = np.linalg.norm(v)
+    return (v / n if n else v).tolist()
+
+# =========================================================
+# PERSISTENT TEXT-HASH EMBEDDING CACHE
+# =========================================================
+
+def embedding_key(model, text, dimensions=None):
+    return row_hash(model, dimensions, text)
+
+
+class EmbeddingCache:
+    """
+    Cache embedding persisten (SQLite) dengan key = hash(model, dim, text).
+    Vektor disimpan sebagai blob float32 supaya ringkas.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                key TEXT PRIMARY KEY,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get_many(self, keys):
+        import numpy as np
+
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            # batasi jumlah parameter per query (limit SQLite)
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embedding_cache WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, items):
+        import numpy as np
+
+        rows = [
+            (key, len(vec), np.asarray(vec, dtype=np.float32).tobytes())
+            for key, vec in items
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (key, dim, vector) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
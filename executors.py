@@ -0,0 +1,115 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telemetry import Counter, Gauge, Histogram
+
+# =========================================================
+# INSTRUMENTED THREAD POOL
+# =========================================================
+#
+# ThreadPoolExecutor biasa menampung task tanpa batas dan tanpa sinyal:
+# saat semua worker sibuk, request /chat diam-diam antre sampai kena 504.
+# InstrumentedExecutor mencatat:
+#   queued   → task sudah di-submit tapi belum mulai
+#   active   → task yang sedang jalan
+#   wait     → jeda submit → mulai (histogram)
+#   rejected → submit yang ditolak karena antrean penuh
+# dan bisa dibatasi (max_queue > 0) supaya submit gagal cepat dengan
+# ExecutorSaturated, bukan menahan thread Flask sampai timeout.
+
+DEFAULT_RETRY_AFTER_SECONDS = 5
+MAX_RETRY_AFTER_SECONDS = 60
+
+QUEUE_DEPTH = Gauge("ppj_executor_queue_depth", "Task yang menunggu worker", ("executor",))
+ACTIVE_WORKERS = Gauge("ppj_executor_active_workers", "Worker yang sedang menjalankan task", ("executor",))
+MAX_WORKERS = Gauge("ppj_executor_max_workers", "Ukuran thread pool", ("executor",))
+WAIT_SECONDS = Histogram(
+    "ppj_executor_wait_seconds", "Waktu tunggu task sebelum mulai dijalankan (detik)", ("executor",)
+)
+TASKS_TOTAL = Counter("ppj_executor_tasks_total", "Task yang selesai dijalankan", ("executor",))
+REJECTED_TOTAL = Counter("ppj_executor_rejected_total", "Submit yang ditolak karena antrean penuh", ("executor",))
+
+
+class ExecutorSaturated(RuntimeError):
+    def __init__(self, name, queue_depth, retry_after):
+        super().__init__(f"executor {name} penuh (queue={queue_depth})")
+        self.name = name
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+
+
+class InstrumentedExecutor(ThreadPoolExecutor):
+    def __init__(self, max_workers, thread_name_prefix="", name=None, max_queue=0):
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.name = name or thread_name_prefix.rstrip("-") or "executor"
+        self.max_queue = max_queue
+        self.queued = 0
+        self.active = 0
+        # rata-rata durasi task (EWMA), untuk estimasi Retry-After
+        self.avg_run_seconds = None
+        self._stats_lock = threading.Lock()
+
+        QUEUE_DEPTH.set_function(lambda: self.queued, executor=self.name)
+        ACTIVE_WORKERS.set_function(lambda: self.active, executor=self.name)
+        MAX_WORKERS.set(self._max_workers, executor=self.name)
+
+    def retry_after(self):
+        """Perkiraan detik sampai antrean saat ini habis diproses."""
+        if self.avg_run_seconds is None:
+            return DEFAULT_RETRY_AFTER_SECONDS
+        seconds = math.ceil((self.queued + 1) * self.avg_run_seconds / self._max_workers)
+        return max(1, min(seconds, MAX_RETRY_AFTER_SECONDS))
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self._stats_lock:
+            if self.max_queue and self.queued >= self.max_queue:
+                REJECTED_TOTAL.inc(executor=self.name)
+                raise ExecutorSaturated(self.name, self.queued, self.retry_after())
+            self.queued += 1
+
+        try:
+            future = super().submit(self._run, time.perf_counter(), fn, args, kwargs)
+        except Exception:
+            # mis. executor sudah shutdown
+            with self._stats_lock:
+                self.queued -= 1
+            raise
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future):
+        # task yang dibatalkan sebelum mulai tidak pernah masuk _run
+        if future.cancelled():
+            with self._stats_lock:
+                self.queued -= 1
+
+    def _run(self, submitted_at, fn, args, kwargs):
+        started_at = time.perf_counter()
+        with self._stats_lock:
+            self.queued -= 1
+            self.active += 1
+        WAIT_SECONDS.observe(started_at - submitted_at, executor=self.name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            with self._stats_lock:
+                self.active -= 1
+                if self.avg_run_seconds is None:
+                    self.avg_run_seconds = elapsed
+                else:
+                    self.avg_run_seconds = 0.8 * self.avg_run_seconds + 0.2 * elapsed
+            TASKS_TOTAL.inc(executor=self.name)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "executor": self.name,
+                "max_workers": self._max_workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "active": self.active,
+                "avg_run_seconds": self.avg_run_seconds,
+            }
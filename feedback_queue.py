@@ -0,0 +1,124 @@
+import threading
+import time
+
+from telemetry import Counter, Gauge, Histogram
+
+# =========================================================
+# FEEDBACK QUEUE (BATCH + CONFLATION)
+# =========================================================
+#
+# /feedback tidak lagi menulis ke SQLite per request. Rating masuk ke
+# dict pending {session_id: [jumlah reward, jumlah punish]}; rating
+# berikutnya untuk session yang sama dijumlahkan, bukan menimpa, jadi
+# hasil akhirnya sama dengan menerapkan tiap rating satu per satu, tidak
+# bergantung rating jatuh di jendela flush yang mana (mis. 👍 lalu 👎 →
+# +5 lalu -10, seperti apply_feedback_db). Satu thread menerapkan
+# semuanya dalam satu transaksi:
+#   - tiap flush_interval detik, atau segera saat pending >= max_batch
+#   - apply_batch(counts) → db.apply_feedback_batch + update priority
+#     di RetrievalIndex (tanpa reload corpus)
+# Batch yang gagal dijumlahkan kembali ke pending & dicoba ulang.
+# shutdown() menerapkan sisa pending sebelum proses berhenti.
+
+RECEIVED_TOTAL = Counter("ppj_feedback_received_total", "Feedback yang diterima", ("rating",))
+CONFLATED_TOTAL = Counter(
+    "ppj_feedback_conflated_total", "Feedback yang digabung dengan rating lain di session yang sama"
+)
+BATCHES_TOTAL = Counter("ppj_feedback_batches_total", "Batch feedback yang diterapkan", ("status",))
+BATCH_SECONDS = Histogram("ppj_feedback_batch_seconds", "Durasi penerapan satu batch feedback (detik)")
+PENDING = Gauge("ppj_feedback_pending", "Session dengan feedback yang belum diterapkan")
+
+
+class FeedbackQueue:
+    def __init__(self, apply_batch, flush_interval=1.0, max_batch=500, logger=None):
+        self.apply_batch = apply_batch
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.logger = logger
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = None
+
+        PENDING.set_function(lambda: len(self._pending))
+
+    def submit(self, session_id, rating):
+        """rating 1 (reward) / -1 (punish)."""
+        if rating not in (1, -1):
+            raise ValueError(f"rating tidak valid: {rating!r}")
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("feedback queue sudah ditutup")
+            counts = self._pending.get(session_id)
+            if counts is None:
+                counts = self._pending[session_id] = [0, 0]
+            else:
+                CONFLATED_TOTAL.inc()
+            counts[0 if rating == 1 else 1] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="feedback-batcher", daemon=True)
+                self._thread.start()
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+        RECEIVED_TOTAL.inc(rating=rating)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.max_batch:
+                    self._cond.wait(self.flush_interval)
+                if self._closed and not self._pending:
+                    return
+            self.flush()
+
+    def flush(self):
+        """Terapkan semua pending sekarang. Return jumlah session."""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            t0 = time.perf_counter()
+            try:
+                self.apply_batch(batch)
+            except Exception as e:
+                BATCHES_TOTAL.inc(status="error")
+                # kembalikan ke pending (kecuali saat shutdown), dijumlahkan
+                # dengan rating yang masuk selama batch ini berjalan
+                with self._cond:
+                    if not self._closed:
+                        for session_id, (rewards, punishes) in batch.items():
+                            counts = self._pending.setdefault(session_id, [0, 0])
+                            counts[0] += rewards
+                            counts[1] += punishes
+                if self.logger:
+                    self.logger.error(f"[FEEDBACK BATCH ERROR] sessions={len(batch)} | {e}", exc_info=True)
+                time.sleep(self.flush_interval)
+                return 0
+
+            BATCH_SECONDS.observe(time.perf_counter() - t0)
+            BATCHES_TOTAL.inc(status="success")
+            if self.logger:
+                self.logger.info(
+                    f"[FEEDBACK BATCH] sessions={len(batch)} | {time.perf_counter() - t0:.3f}s"
+                )
+            return len(batch)
+
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if wait and thread is not None:
+            thread.join()
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "flush_interval": self.flush_interval,
+                "max_batch": self.max_batch,
+            }
@@ -0,0 +1,43 @@
+import os
+
+# =========================================================
+# GUNICORN CONFIG
+# =========================================================
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+
+bind = os.getenv("BIND", "127.0.0.1:8080")
+workers = int(os.getenv("WEB_WORKERS", "2"))
+# thread HTTP > batas CHAT_LIMITER supaya request berlebih antre di antrean
+# prioritas limiter (pembayaran didahulukan), bukan di socket backlog
+threads = int(os.getenv("WEB_THREADS", "24"))
+worker_class = "gthread"
+
+# import app + load retrieval index sekali di master sebelum fork
+preload_app = os.getenv("WEB_PRELOAD", "1") == "1"
+
+# harus > CHAT_TIMEOUT_SECONDS supaya /chat sempat membalas 504 sendiri
+timeout = int(os.getenv("WEB_TIMEOUT", "150"))
+# waktu untuk request yang sedang berjalan selesai setelah SIGTERM
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "130"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+
+# restart worker berkala untuk membatasi fragmentasi memori
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("WEB_MAX_REQUESTS_JITTER", "0"))
+
+# warmup di thread terpisah supaya worker baru tidak menunggu round-trip API
+warmup_background = os.getenv("WEB_WARMUP_BACKGROUND", "1") == "1"
+
+accesslog = os.getenv("WEB_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def post_worker_init(worker):
+    import wsgi
+    wsgi.warmup(background=warmup_background)
+
+
+def worker_exit(server, worker):
+    import wsgi
+    wsgi.shutdown()
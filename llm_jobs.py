@@ -0,0 +1,288 @@
+import hashlib
+import heapq
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+# =========================================================
+# ROW HASH
+# =========================================================
+
+def row_hash(*parts):
+    """
+    Hash stabil dari isi row (bukan index DataFrame),
+    supaya checkpoint tetap valid walau urutan data berubah.
+    """
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+# =========================================================
+# CHECKPOINT STORE (APPEND-ONLY JSONL)
+# =========================================================
+
+class CheckpointStore:
+    """
+    Store append-only berbasis JSON-lines.
+    Setiap baris = {"key", "status", "result", "error", "attempts", "ts"}.
+    Record terakhir untuk sebuah key yang berlaku, jadi retry cukup
+    menambah baris baru tanpa menulis ulang file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._records = {}
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        rec = json.loads(line)
+                    except json.JSONDecodeError:
+                        # baris terakhir bisa terpotong kalau proses mati saat menulis
+                        continue
+                    self._records[rec["key"]] = rec
+
+        self._fh = open(path, "a", encoding="utf-8")
+
+    def get(self, key):
+        return self._records.get(key)
+
+    def is_done(self, key):
+        rec = self._records.get(key)
+        return bool(rec) and rec["status"] == "ok"
+
+    def failed_keys(self):
+        return [k for k, r in self._records.items() if r["status"] != "ok"]
+
+    def append(self, key, status, result=None, error=None, attempts=1):
+        rec = {
+            "key": key,
+            "status": status,
+            "result": result,
+            "error": error,
+            "attempts": attempts,
+            "ts": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        }
+        line = json.dumps(rec, ensure_ascii=False, default=str)
+        with self._lock:
+            self._fh.write(line + "\n")
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._records[key] = rec
+
+    def close(self):
+        with self._lock:
+            self._fh.close()
+
+    def __len__(self):
+        return len(self._records)
+
+# =========================================================
+# TOKEN BUCKET RATE LIMITER
+# =========================================================
+
+# batas bawah rate (request/detik) setelah backoff 429 berulang
+TOKEN_BUCKET_MIN_RATE = 0.05
+
+class TokenBucket:
+    """
+    Token bucket thread-safe. rate = request per detik.
+    rate bisa diubah saat berjalan (dipakai saat kena 429), tapi tidak
+    pernah di bawah min_rate supaya waktu tunggu tetap terhingga.
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=TOKEN_BUCKET_MIN_RATE):
+        self.min_rate = float(min_rate)
+        self.rate = max(float(rate), self.min_rate)
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = max(float(rate), self.min_rate)
+
+    def acquire(self, tokens=1.0):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_s = (tokens - self._tokens) / self.rate
+            time.sleep(wait_s)
+
+# =========================================================
+# ADAPTIVE CONCURRENCY (AIMD)
+# =========================================================
+
+class AdaptiveConcurrency:
+    """
+    Additive-increase / multiplicative-decrease:
+    - tiap `limit` request sukses berturut-turut → limit + 1
+    - tiap 429 → limit dibagi 2 (minimal `min_limit`)
+    """
+
+    def __init__(self, initial, min_limit=1, max_limit=None):
+        self.min_limit = min_limit
+        self.max_limit = max_limit or initial
+        self.limit = max(min_limit, min(initial, self.max_limit))
+        self._streak = 0
+        self._lock = threading.Lock()
+
+    def on_success(self):
+        with self._lock:
+            self._streak += 1
+            if self._streak >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self._streak = 0
+
+    def on_rate_limit(self):
+        with self._lock:
+            self.limit = max(self.min_limit, self.limit // 2)
+            self._streak = 0
+
+# =========================================================
+# ERROR HELPERS
+# =========================================================
+
+def is_rate_limit_error(exc):
+    if getattr(exc, "status_code", None) == 429:
+        return True
+    return type(exc).__name__ in ("RateLimitError", "RateLimitExceeded")
+
+def retry_after_seconds(exc, default):
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return max(float(headers.get("retry-after")), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+# =========================================================
+# JOB RUNNER
+# =========================================================
+
+def run_checkpointed_jobs(
+    jobs,
+    fn,
+    store,
+    max_workers=6,
+    rate_per_sec=5.0,
+    max_attempts=5,
+    backoff_seconds=2.0,
+    retry_failed=True,
+):
+    """
+    Jalankan fn(payload) untuk setiap (key, payload) di `jobs`
+    dengan checkpoint ke `store`.
+
+    - key yang sudah status "ok" di store dilewati (resume)
+    - key yang sebelumnya gagal dicoba lagi jika retry_failed=True
+    - 429 → concurrency & rate diturunkan, row dijadwalkan ulang
+    - error lain → dicatat sebagai "error" setelah max_attempts
+
+    Return dict: {"done", "skipped", "failed"}
+    """
+    pending = []
+    skipped = 0
+    for key, payload in jobs:
+        rec = store.get(key)
+        if rec and (rec["status"] == "ok" or not retry_failed):
+            skipped += 1
+            continue
+        pending.append((key, payload))
+
+    print(f"[JOBS] total={len(pending) + skipped} | skipped={skipped} | pending={len(pending)}")
+
+    limiter = AdaptiveConcurrency(initial=max_workers, max_limit=max_workers)
+    bucket = TokenBucket(rate_per_sec)
+    base_rate = float(rate_per_sec)
+
+    # heap berisi (ready_at, seq, key, payload, attempts)
+    queue = []
+    for seq, (key, payload) in enumerate(pending):
+        heapq.heappush(queue, (0.0, seq, key, payload, 1))
+    seq = len(pending)
+
+    def _call(payload):
+        bucket.acquire()
+        return fn(payload)
+
+    stats = {"done": 0, "skipped": skipped, "failed": 0}
+    in_flight = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-job-") as executor:
+        while queue or in_flight:
+            now = time.monotonic()
+            while queue and len(in_flight) < limiter.limit and queue[0][0] <= now:
+                _, _, key, payload, attempts = heapq.heappop(queue)
+                future = executor.submit(_call, payload)
+                in_flight[future] = (key, payload, attempts)
+
+            if not in_flight:
+                # semua row sedang menunggu backoff
+                time.sleep(max(0.0, queue[0][0] - time.monotonic()))
+                continue
+
+            done, _ = wait(list(in_flight), timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, payload, attempts = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if is_rate_limit_error(e) and attempts < max_attempts:
+                        limiter.on_rate_limit()
+                        bucket.set_rate(max(base_rate / 8, bucket.rate / 2))
+                        delay = retry_after_seconds(e, backoff_seconds * (2 ** (attempts - 1)))
+                        print(
+                            f"[JOBS] 429 on {key[:12]} | limit={limiter.limit} | "
+                            f"rate={bucket.rate:.2f}/s | retry in {delay:.1f}s"
+                        )
+                        heapq.heappush(queue, (time.monotonic() + delay, seq, key, payload, attempts + 1))
+                        seq += 1
+                        continue
+
+                    if attempts < max_attempts:
+                        heapq.heappush(
+                            queue,
+                            (time.monotonic() + backoff_seconds, seq, key, payload, attempts + 1)
+                        )
+                        seq += 1
+                        continue
+
+                    print(f"[ERROR] {key[:12]} failed after {attempts} attempts: {e}")
+                    store.append(key, "error", error=str(e), attempts=attempts)
+                    stats["failed"] += 1
+                    continue
+
+                store.append(key, "ok", result=result, attempts=attempts)
+                limiter.on_success()
+                if bucket.rate < base_rate:
+                    bucket.set_rate(min(base_rate, bucket.rate * 1.1))
+                stats["done"] += 1
+
+                finished = stats["done"] + stats["failed"]
+                if finished % 100 == 0:
+                    print(f"[JOBS] progress {finished}/{len(pending)} | limit={limiter.limit}")
+
+    print(f"[JOBS] done={stats['done']} | skipped={stats['skipped']} | failed={stats['failed']}")
+    return stats
@@ -1,26 +1,245 @@
+import atexit
+import glob
 import json
+import logging
+import os
+import queue
+import shutil
 import sqlite3
-from datetime import datetime
+import threading
+from datetime import date, datetime, timedelta
 
+# file tunggal (LOG_DB_PARTITION=none) / log lama sebelum partisi
 LOG_DB_PATH = "log.db"
 
+# =========================================================
+# PARTISI WAKTU
+# =========================================================
+#
+# chat_logs ditulis ke satu file SQLite per hari / minggu (UTC):
+#   logs/db/log-2025-01-31.db   (day)
+#   logs/db/log-2025-W05.db     (week)
+# Request tetap di partisi tempat start_request_log menulisnya walaupun
+# finalize lewat tengah malam. Baca lintas partisi lewat query_logs() /
+# fetch_hourly_rollups(); partisi yang lewat LOG_DB_RETENTION_DAYS
+# dipindah ke LOG_DB_ARCHIVE_DIR (atau dihapus jika tidak diset) saat
+# partisi baru dibuka. Retention 0 = simpan selamanya.
 
-def _get_conn():
-    return sqlite3.connect(LOG_DB_PATH)
+LOG_DB_PARTITION = os.getenv("LOG_DB_PARTITION", "day")  # none | day | week
+LOG_DB_DIR = os.getenv("LOG_DB_DIR", os.path.join("logs", "db"))
+LOG_DB_RETENTION_DAYS = int(os.getenv("LOG_DB_RETENTION_DAYS", "0"))
+LOG_DB_ARCHIVE_DIR = os.getenv("LOG_DB_ARCHIVE_DIR", "")
+
+# Naikkan setiap kali schema chat_logs berubah; lihat init_log_db().
+LOG_SCHEMA_VERSION = 3
+
+# field yang disimpan sebagai JSON text
+_JSON_FIELDS = ("matches", "payload", "stage_timings", "token_usage")
+
+# Kolom teks besar (prompt / jawaban / payload) disimpan di chat_log_texts,
+# supaya row chat_logs tetap kecil dan query dashboard (status, intent,
+# rentang waktu) tidak ikut membaca halaman berisi teks panjang.
+# Baca gabungannya lewat view chat_logs_full.
+TEXT_COLUMNS = (
+    "context_text",
+    "matches_json",
+    "layer1_draft",
+    "layer2_final",
+    "admin_response",
+    "payload_json",
+)
+
+# batas atas bucket histogram rollup (ms / similarity); percentil dihitung
+# dari bucket (interpolasi linear), jadi rollup bisa ditambah per request
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2000, 3000, 5000, 7500, 10000, 15000, 20000, 30000, 60000, 120000)
+SIMILARITY_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+
+# =========================================================
+# WRITER THREAD
+# =========================================================
+#
+# start / update / finalize_request_log dipanggil di thread request, tapi
+# hanya menyiapkan nilai kolom lalu memasukkannya ke queue. Satu thread
+# writer menjalankan operasi berurutan (FIFO, jadi start selalu sebelum
+# finalize request yang sama) dan commit per batch: sampai
+# LOG_DB_BATCH_SIZE operasi atau queue kosong, satu transaksi per file
+# partisi. Operasi yang gagal di-rollback sendiri (savepoint) & di-log,
+# tanpa membatalkan operasi lain di batch.
+# LOG_DB_ASYNC=0 → tulis langsung di thread pemanggil (script / debug).
+
+LOG_DB_ASYNC = os.getenv("LOG_DB_ASYNC", "1") == "1"
+LOG_DB_BATCH_SIZE = int(os.getenv("LOG_DB_BATCH_SIZE", "200"))
+
+logger = logging.getLogger("perpanjangan-chatbot")
+
+_writer = None
+_write_queue = None
+_writer_lock = threading.Lock()
+
+# path partisi yang schema-nya sudah dicek di proses ini
+_READY_PATHS = set()
+_READY_LOCK = threading.Lock()
+# request_id → path partisi, dari start sampai finalize
+_REQUEST_PATHS = {}
+# batas entri jika ada request yang tidak pernah di-finalize
+_REQUEST_PATHS_MAX = 10000
 
 
 def _utc_now():
     return datetime.utcnow().isoformat(timespec="seconds") + "Z"
 
 
+def partition_key(day=None):
+    day = day or datetime.utcnow().date()
+    if LOG_DB_PARTITION == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return day.isoformat()
+
+
+def partition_path(key=None):
+    if LOG_DB_PARTITION not in ("day", "week"):
+        return LOG_DB_PATH
+    return os.path.join(LOG_DB_DIR, f"log-{key or partition_key()}.db")
+
+
+def _partition_range(path):
+    """(tanggal awal, tanggal akhir eksklusif) partisi, None untuk LOG_DB_PATH."""
+    key = os.path.basename(path)[len("log-"):-len(".db")]
+    try:
+        if "-W" in key:
+            year, week = key.split("-W")
+            start = date.fromisocalendar(int(year), int(week), 1)
+            return start, start + timedelta(days=7)
+        start = date.fromisoformat(key)
+        return start, start + timedelta(days=1)
+    except ValueError:
+        return None
+
+
+def list_partitions(since=None, until=None):
+    """
+    Path file log (lama → baru) yang mungkin berisi row dengan started_at
+    di [since, until]; since/until string ISO (tanggal atau datetime).
+    """
+    paths = sorted(glob.glob(os.path.join(LOG_DB_DIR, "log-*.db")))
+    since_day = date.fromisoformat(since[:10]) if since else None
+    until_day = date.fromisoformat(until[:10]) if until else None
+
+    result = [LOG_DB_PATH] if os.path.exists(LOG_DB_PATH) else []
+    for path in paths:
+        bounds = _partition_range(path)
+        if bounds is None:
+            continue
+        start, end = bounds
+        if since_day and end <= since_day:
+            continue
+        if until_day and start > until_day:
+            continue
+        result.append(path)
+    return result
+
+
+def prune_partitions(retention_days=None, archive_dir=None, today=None):
+    """
+    Pindahkan (atau hapus) partisi yang seluruh isinya lebih tua dari
+    retention_days. Return daftar path yang diproses.
+    """
+    retention_days = LOG_DB_RETENTION_DAYS if retention_days is None else retention_days
+    archive_dir = LOG_DB_ARCHIVE_DIR if archive_dir is None else archive_dir
+    if retention_days <= 0:
+        return []
+
+    cutoff = (today or datetime.utcnow().date()) - timedelta(days=retention_days)
+    pruned = []
+    for path in sorted(glob.glob(os.path.join(LOG_DB_DIR, "log-*.db"))):
+        bounds = _partition_range(path)
+        if bounds is None or bounds[1] > cutoff or path == partition_path():
+            continue
+        for suffix in ("", "-wal", "-shm"):
+            if not os.path.exists(path + suffix):
+                continue
+            if archive_dir:
+                os.makedirs(archive_dir, exist_ok=True)
+                shutil.move(path + suffix, os.path.join(archive_dir, os.path.basename(path + suffix)))
+            else:
+                os.remove(path + suffix)
+        with _READY_LOCK:
+            _READY_PATHS.discard(path)
+        pruned.append(path)
+    return pruned
+
+
+def _get_conn(path=None):
+    path = path or partition_path()
+    new_partition = False
+    if path not in _READY_PATHS:
+        with _READY_LOCK:
+            if path not in _READY_PATHS:
+                new_partition = path != LOG_DB_PATH and not os.path.exists(path)
+                init_log_db(path=path)
+                _READY_PATHS.add(path)
+        if new_partition:
+            prune_partitions()
+    return sqlite3.connect(path)
+
+
+def _request_path(request_id):
+    path = _REQUEST_PATHS.get(request_id)
+    if path is not None:
+        return path
+    # start ditulis proses lain / sebelum restart: cek partisi kemarin juga
+    current = partition_path()
+    if current == LOG_DB_PATH:
+        return current
+    previous = partition_path(partition_key(datetime.utcnow().date() - timedelta(days=1)))
+    if previous != current and os.path.exists(previous):
+        conn = sqlite3.connect(previous)
+        try:
+            if conn.execute("SELECT 1 FROM chat_logs WHERE request_id = ?", (request_id,)).fetchone():
+                return previous
+        except sqlite3.OperationalError:
+            pass
+        finally:
+            conn.close()
+    return current
+
+
+def query_logs(sql, params=(), since=None, until=None):
+    """
+    Jalankan SELECT yang sama di setiap partisi dalam rentang dan gabungkan
+    hasilnya (ORDER BY / LIMIT berlaku per partisi).
+    """
+    rows = []
+    for path in list_partitions(since, until):
+        conn = _get_conn(path)
+        try:
+            rows.extend(conn.execute(sql, params).fetchall())
+        finally:
+            conn.close()
+    return rows
+
+
 def _col_exists(cur, table, col):
     cur.execute(f"PRAGMA table_info({table})")
     return any(r[1] == col for r in cur.fetchall())
 
 
-def init_log_db():
-    conn = _get_conn()
+def init_log_db(force=False, path=None):
+    """
+    Buat / migrasi schema chat_logs (default: partisi saat ini). Versi schema
+    disimpan di PRAGMA user_version, jadi migrasi hanya jalan sekali per file.
+    """
+    path = path or partition_path()
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
     cur = conn.cursor()
+    if not force and cur.execute("PRAGMA user_version").fetchone()[0] >= LOG_SCHEMA_VERSION:
+        conn.close()
+        return False
+
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS chat_logs (
@@ -44,13 +263,13 @@ def init_log_db():
             top_similarity REAL,
             top_priority_score REAL,
             top_final_score REAL,
-            matches_json TEXT,
-            layer1_draft TEXT,
-            layer2_final TEXT,
             placeholder_guard_applied INTEGER,
-            admin_response TEXT,
-            payload_json TEXT,
-            thread_name TEXT
+            thread_name TEXT,
+            queue_wait_ms INTEGER,
+            stage_timings_json TEXT,
+            input_tokens INTEGER,
+            output_tokens INTEGER,
+            token_usage_json TEXT
         )
         """
     )
@@ -63,6 +282,12 @@ def init_log_db():
         "duration_ms": "INTEGER",
         "http_status": "INTEGER",
         "placeholder_guard_applied": "INTEGER",
+        # telemetry per stage (lihat telemetry.RequestTrace)
+        "queue_wait_ms": "INTEGER",
+        "stage_timings_json": "TEXT",
+        "input_tokens": "INTEGER",
+        "output_tokens": "INTEGER",
+        "token_usage_json": "TEXT",
     }
     for col, col_type in required_cols.items():
         if not _col_exists(cur, "chat_logs", col):
@@ -78,13 +303,356 @@ def init_log_db():
             """
         )
 
+    _init_text_table(cur)
+    _init_rollup_tables(cur)
+
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chat_logs_started_at ON chat_logs(started_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chat_logs_status ON chat_logs(status, started_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chat_logs_intent ON chat_logs(intent_parent, started_at)")
+
+    # rollup dari nol hanya saat tabel rollup baru dibuat (migrasi schema lama)
+    if cur.execute("SELECT COUNT(*) FROM chat_log_rollup_hourly").fetchone()[0] == 0:
+        rebuild_rollups(cur)
+
+    cur.execute(f"PRAGMA user_version = {LOG_SCHEMA_VERSION}")
     conn.commit()
     conn.close()
+    return True
+
+
+def _init_text_table(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chat_log_texts (
+            request_id TEXT PRIMARY KEY,
+            context_text TEXT,
+            matches_json TEXT,
+            layer1_draft TEXT,
+            layer2_final TEXT,
+            admin_response TEXT,
+            payload_json TEXT
+        )
+        """
+    )
+
+    # schema lama: pindahkan kolom teks dari chat_logs ke chat_log_texts
+    inline = [col for col in TEXT_COLUMNS if _col_exists(cur, "chat_logs", col)]
+    if inline:
+        cur.execute("DROP VIEW IF EXISTS chat_logs_full")
+        cur.execute(
+            f"""
+            INSERT OR IGNORE INTO chat_log_texts (request_id, {', '.join(inline)})
+            SELECT request_id, {', '.join(inline)}
+            FROM chat_logs
+            WHERE request_id IS NOT NULL
+            """
+        )
+        for col in inline:
+            try:
+                cur.execute(f"ALTER TABLE chat_logs DROP COLUMN {col}")
+            except sqlite3.OperationalError:
+                # SQLite < 3.35: kolom tetap ada tapi dikosongkan
+                cur.execute(f"UPDATE chat_logs SET {col} = NULL")
+
+    text_cols = ", ".join(f"t.{col}" for col in TEXT_COLUMNS)
+    cur.execute(
+        f"""
+        CREATE VIEW IF NOT EXISTS chat_logs_full AS
+        SELECT l.*, {text_cols}
+        FROM chat_logs l
+        LEFT JOIN chat_log_texts t ON t.request_id = l.request_id
+        """
+    )
+
+
+def _init_rollup_tables(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chat_log_rollup_hourly (
+            hour TEXT NOT NULL,
+            intent_parent TEXT NOT NULL,
+            status TEXT NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            duration_sum_ms INTEGER NOT NULL DEFAULT 0,
+            duration_max_ms INTEGER NOT NULL DEFAULT 0,
+            similarity_sum REAL NOT NULL DEFAULT 0,
+            similarity_count INTEGER NOT NULL DEFAULT 0,
+            input_tokens INTEGER NOT NULL DEFAULT 0,
+            output_tokens INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, intent_parent, status)
+        )
+        """
+    )
+    # histogram per rollup: metric = 'latency_ms' | 'top_similarity',
+    # bucket = batas atas (lihat LATENCY_BUCKETS_MS / SIMILARITY_BUCKETS)
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chat_log_rollup_buckets (
+            hour TEXT NOT NULL,
+            intent_parent TEXT NOT NULL,
+            status TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            bucket REAL NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, intent_parent, status, metric, bucket)
+        )
+        """
+    )
+
+# =========================================================
+# HOURLY ROLLUP
+# =========================================================
+#
+# Diperbarui di transaksi yang sama dengan finalize_request_log (sekali
+# per request, karena finalize hanya berlaku untuk row dengan ended_at
+# NULL), jadi dashboard cukup membaca tabel rollup yang kecil:
+#   chat_log_rollup_hourly  → count, durasi sum/max, similarity avg, token
+#   chat_log_rollup_buckets → histogram latensi & top similarity
+
+def _bucket_for(value, bounds):
+    for bound in bounds:
+        if value <= bound:
+            return float(bound)
+    return float("inf")
+
+
+def _add_to_rollup(cur, started_at, intent_parent, status, duration_ms, top_similarity, input_tokens, output_tokens):
+    if not started_at:
+        return
+    key = (started_at[:13], intent_parent or "", status or "unknown")
+    duration_ms = duration_ms or 0
+    has_similarity = top_similarity is not None
+    cur.execute(
+        """
+        INSERT INTO chat_log_rollup_hourly (
+            hour, intent_parent, status, requests, duration_sum_ms, duration_max_ms,
+            similarity_sum, similarity_count, input_tokens, output_tokens
+        ) VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (hour, intent_parent, status) DO UPDATE SET
+            requests = requests + 1,
+            duration_sum_ms = duration_sum_ms + excluded.duration_sum_ms,
+            duration_max_ms = MAX(duration_max_ms, excluded.duration_max_ms),
+            similarity_sum = similarity_sum + excluded.similarity_sum,
+            similarity_count = similarity_count + excluded.similarity_count,
+            input_tokens = input_tokens + excluded.input_tokens,
+            output_tokens = output_tokens + excluded.output_tokens
+        """,
+        (
+            *key,
+            duration_ms,
+            duration_ms,
+            top_similarity if has_similarity else 0,
+            1 if has_similarity else 0,
+            input_tokens or 0,
+            output_tokens or 0,
+        ),
+    )
+
+    buckets = [("latency_ms", _bucket_for(duration_ms, LATENCY_BUCKETS_MS))]
+    if has_similarity:
+        buckets.append(("top_similarity", _bucket_for(top_similarity, SIMILARITY_BUCKETS)))
+    cur.executemany(
+        """
+        INSERT INTO chat_log_rollup_buckets (hour, intent_parent, status, metric, bucket, count)
+        VALUES (?, ?, ?, ?, ?, 1)
+        ON CONFLICT (hour, intent_parent, status, metric, bucket) DO UPDATE SET
+            count = count + 1
+        """,
+        [(*key, metric, bucket) for metric, bucket in buckets],
+    )
+
+
+def rebuild_rollups(cur=None, since_hour=None):
+    """
+    Hitung ulang rollup dari chat_logs (migrasi / perbaikan data); tanpa
+    cur → semua partisi. since_hour mis. "2025-01-31T00" → hanya jam itu
+    ke atas.
+    """
+    if cur is None:
+        total = 0
+        for path in list_partitions(since_hour):
+            conn = _get_conn(path)
+            total += rebuild_rollups(conn.cursor(), since_hour)
+            conn.commit()
+            conn.close()
+        return total
+
+    where = "ended_at IS NOT NULL"
+    params = []
+    if since_hour:
+        where += " AND started_at >= ?"
+        params.append(since_hour)
+        cur.execute("DELETE FROM chat_log_rollup_hourly WHERE hour >= ?", (since_hour,))
+        cur.execute("DELETE FROM chat_log_rollup_buckets WHERE hour >= ?", (since_hour,))
+    else:
+        cur.execute("DELETE FROM chat_log_rollup_hourly")
+        cur.execute("DELETE FROM chat_log_rollup_buckets")
+
+    rows = cur.execute(
+        f"""
+        SELECT started_at, intent_parent, status, duration_ms, top_similarity, input_tokens, output_tokens
+        FROM chat_logs
+        WHERE {where}
+        """,
+        params,
+    ).fetchall()
+    for row in rows:
+        _add_to_rollup(cur, *row)
+    return len(rows)
+
+
+def _percentile(buckets, q, maximum=None):
+    """
+    Estimasi percentil dari histogram [(batas_atas, count)] terurut,
+    dibatasi nilai maksimum yang benar-benar teramati.
+    """
+    total = sum(count for _, count in buckets)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    lower = 0.0
+    for bound, count in buckets:
+        if seen + count >= rank:
+            if bound == float("inf"):
+                value = lower if maximum is None else max(lower, maximum)
+            else:
+                value = lower + (bound - lower) * ((rank - seen) / count)
+            if maximum is not None:
+                value = min(value, maximum)
+            return round(value, 1)
+        seen += count
+        lower = bound
+    return lower
+
+
+def fetch_hourly_rollups(since_hour=None, until_hour=None, intent_parent=None, status=None):
+    """
+    Rollup per (jam, intent_parent, status) untuk dashboard, dengan
+    estimasi p50/p95/p99 latensi dan distribusi top similarity. Jam yang
+    sama dari beberapa file (mis. log.db lama + partisi) dijumlahkan.
+    """
+    where = []
+    params = []
+    for clause, value in (
+        ("hour >= ?", since_hour),
+        ("hour <= ?", until_hour),
+        ("intent_parent = ?", intent_parent),
+        ("status = ?", status),
+    ):
+        if value is not None:
+            where.append(clause)
+            params.append(value)
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+    totals = {}
+    hist = {}
+    for path in list_partitions(since_hour, until_hour):
+        conn = _get_conn(path)
+        cur = conn.cursor()
+        for hour, parent, st, *values in cur.execute(
+            f"""
+            SELECT hour, intent_parent, status, requests, duration_sum_ms, duration_max_ms,
+                   similarity_sum, similarity_count, input_tokens, output_tokens
+            FROM chat_log_rollup_hourly
+            {where_sql}
+            """,
+            params,
+        ):
+            current = totals.get((hour, parent, st))
+            if current is None:
+                totals[(hour, parent, st)] = values
+            else:
+                totals[(hour, parent, st)] = [
+                    max(a, b) if i == 2 else a + b for i, (a, b) in enumerate(zip(current, values))
+                ]
+        for hour, parent, st, metric, bucket, count in cur.execute(
+            f"""
+            SELECT hour, intent_parent, status, metric, bucket, count
+            FROM chat_log_rollup_buckets
+            {where_sql}
+            """,
+            params,
+        ):
+            buckets = hist.setdefault((hour, parent, st, metric), {})
+            buckets[bucket] = buckets.get(bucket, 0) + count
+        conn.close()
+
+    result = []
+    for (hour, parent, st), values in sorted(totals.items()):
+        requests, dur_sum, dur_max, sim_sum, sim_count, tok_in, tok_out = values
+        latency = sorted(hist.get((hour, parent, st, "latency_ms"), {}).items())
+        similarity = sorted(hist.get((hour, parent, st, "top_similarity"), {}).items())
+        result.append({
+            "hour": hour,
+            "intent_parent": parent or None,
+            "status": st,
+            "requests": requests,
+            "avg_ms": round(dur_sum / requests, 1) if requests else None,
+            "max_ms": dur_max,
+            "p50_ms": _percentile(latency, 0.50, dur_max),
+            "p95_ms": _percentile(latency, 0.95, dur_max),
+            "p99_ms": _percentile(latency, 0.99, dur_max),
+            "avg_top_similarity": round(sim_sum / sim_count, 4) if sim_count else None,
+            "top_similarity_hist": {bound: count for bound, count in similarity},
+            "input_tokens": tok_in,
+            "output_tokens": tok_out,
+        })
+    return result
+
+
+def _split_text_fields(sets, values):
+    """Pisahkan pasangan "col = ?" milik chat_log_texts dari chat_logs."""
+    main, main_values, text, text_values = [], [], [], []
+    for clause, value in zip(sets, values):
+        col = clause.split(" = ", 1)[0]
+        if col in TEXT_COLUMNS:
+            text.append(col)
+            text_values.append(value)
+        else:
+            main.append(clause)
+            main_values.append(value)
+    return main, main_values, text, text_values
+
+
+def _upsert_texts(cur, request_id, cols, values):
+    if not cols:
+        return
+    cur.execute(
+        f"""
+        INSERT INTO chat_log_texts (request_id, {', '.join(cols)})
+        VALUES (?, {', '.join('?' for _ in cols)})
+        ON CONFLICT (request_id) DO UPDATE SET
+            {', '.join(f'{col} = excluded.{col}' for col in cols)}
+        """,
+        [request_id, *values],
+    )
 
 
 def start_request_log(request_id, payload=None, thread_name=None, conversation_id=None, user_query=None):
-    conn = _get_conn()
-    cur = conn.cursor()
+    path = partition_path()
+    if path != LOG_DB_PATH:
+        if len(_REQUEST_PATHS) >= _REQUEST_PATHS_MAX:
+            try:
+                _REQUEST_PATHS.pop(next(iter(_REQUEST_PATHS)), None)
+            except (StopIteration, RuntimeError):
+                pass
+        _REQUEST_PATHS[request_id] = path
+    _enqueue(
+        _write_start,
+        request_id,
+        path,
+        (
+            _utc_now(),
+            conversation_id,
+            user_query,
+            thread_name,
+            json.dumps(payload or {}, ensure_ascii=False),
+        ),
+    )
+
+
+def _write_start(cur, request_id, started_at, conversation_id, user_query, thread_name, payload_json):
     cur.execute(
         """
         INSERT OR IGNORE INTO chat_logs (
@@ -93,22 +661,20 @@ def start_request_log(request_id, payload=None, thread_name=None, conversation_i
             status,
             conversation_id,
             user_query,
-            payload_json,
             thread_name
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        ) VALUES (?, ?, ?, ?, ?, ?)
         """,
         (
             request_id,
-            _utc_now(),
+            started_at,
             "started",
             conversation_id,
             user_query,
-            json.dumps(payload or {}, ensure_ascii=False),
             thread_name,
         ),
     )
-    conn.commit()
-    conn.close()
+    if cur.rowcount:
+        _upsert_texts(cur, request_id, ["payload_json"], [payload_json])
 
 def update_request_log(request_id, **fields):
     if not fields:
@@ -139,6 +705,11 @@ def update_request_log(request_id, **fields):
         "ended_at": "ended_at",
         "matches": "matches_json",
         "payload": "payload_json",
+        "queue_wait_ms": "queue_wait_ms",
+        "stage_timings": "stage_timings_json",
+        "input_tokens": "input_tokens",
+        "output_tokens": "output_tokens",
+        "token_usage": "token_usage_json",
     }
 
     sets = []
@@ -147,7 +718,7 @@ def update_request_log(request_id, **fields):
         col = col_map.get(key)
         if not col:
             continue
-        if key in ("matches", "payload"):
+        if key in _JSON_FIELDS:
             value = json.dumps(value or ([] if key == "matches" else {}), ensure_ascii=False)
         sets.append(f"{col} = ?")
         values.append(value)
@@ -155,15 +726,16 @@ def update_request_log(request_id, **fields):
     if not sets:
         return
 
-    values.append(request_id)
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        f"UPDATE chat_logs SET {', '.join(sets)} WHERE request_id = ?",
-        values,
-    )
-    conn.commit()
-    conn.close()
+    _enqueue(_write_update, request_id, None, _split_text_fields(sets, values))
+
+
+def _write_update(cur, request_id, sets, values, text_cols, text_values):
+    if sets:
+        cur.execute(
+            f"UPDATE chat_logs SET {', '.join(sets)} WHERE request_id = ?",
+            [*values, request_id],
+        )
+    _upsert_texts(cur, request_id, text_cols, text_values)
 
 def finalize_request_log(request_id, status, http_status, **fields):
     fields["status"] = status
@@ -195,6 +767,11 @@ def finalize_request_log(request_id, status, http_status, **fields):
         "thread_name": "thread_name",
         "duration_ms": "duration_ms",
         "ended_at": "ended_at",
+        "queue_wait_ms": "queue_wait_ms",
+        "stage_timings": "stage_timings_json",
+        "input_tokens": "input_tokens",
+        "output_tokens": "output_tokens",
+        "token_usage": "token_usage_json",
     }
 
     sets = []
@@ -203,7 +780,7 @@ def finalize_request_log(request_id, status, http_status, **fields):
         col = col_map.get(key)
         if not col:
             continue
-        if key in ("matches", "payload"):
+        if key in _JSON_FIELDS:
             value = json.dumps(value or ([] if key == "matches" else {}), ensure_ascii=False)
         sets.append(f"{col} = ?")
         values.append(value)
@@ -211,16 +788,140 @@ def finalize_request_log(request_id, status, http_status, **fields):
     if not sets:
         return
 
-    values.extend([request_id])
-    conn = _get_conn()
-    cur = conn.cursor()
+    _enqueue(_write_finalize, request_id, None, _split_text_fields(sets, values))
+
+
+def _write_finalize(cur, request_id, sets, values, text_cols, text_values):
+    _REQUEST_PATHS.pop(request_id, None)
     cur.execute(
         f"""
         UPDATE chat_logs
         SET {', '.join(sets)}
         WHERE request_id = ? AND ended_at IS NULL
         """,
-        values,
+        [*values, request_id],
     )
-    conn.commit()
-    conn.close()
+    # hanya finalize pertama yang dicatat (teks & rollup)
+    if cur.rowcount:
+        _upsert_texts(cur, request_id, text_cols, text_values)
+        row = cur.execute(
+            """
+            SELECT started_at, intent_parent, status, duration_ms, top_similarity, input_tokens, output_tokens
+            FROM chat_logs
+            WHERE request_id = ?
+            """,
+            (request_id,),
+        ).fetchone()
+        if row:
+            _add_to_rollup(cur, *row)
+
+
+def _enqueue(op, request_id, path, args):
+    """path None → dicari writer lewat _request_path (partisi saat start)."""
+    item = (op, request_id, path, args)
+    if not LOG_DB_ASYNC:
+        _apply_batch([item])
+        return
+    global _writer, _write_queue
+    q = _write_queue
+    if q is None:
+        with _writer_lock:
+            if _write_queue is None:
+                _write_queue = queue.SimpleQueue()
+                _writer = threading.Thread(
+                    target=_writer_loop, args=(_write_queue,), name="log-db-writer", daemon=True
+                )
+                _writer.start()
+            q = _write_queue
+    q.put(item)
+
+
+def _apply_batch(batch):
+    conns = {}
+    try:
+        for op, request_id, path, args in batch:
+            try:
+                path = path or _request_path(request_id)
+                conn = conns.get(path)
+                if conn is None:
+                    conn = conns[path] = _get_conn(path)
+                    # 1 transaksi per partisi per batch; savepoint di dalamnya
+                    # (RELEASE savepoint terluar akan langsung commit)
+                    conn.execute("BEGIN")
+                conn.execute("SAVEPOINT log_op")
+                try:
+                    op(conn.cursor(), request_id, *args)
+                except Exception:
+                    conn.execute("ROLLBACK TO log_op")
+                    raise
+                finally:
+                    conn.execute("RELEASE log_op")
+            except Exception:
+                logger.exception(f"[LOG_DB ERROR] {op.__name__} request_id={request_id}")
+        for conn in conns.values():
+            conn.commit()
+    finally:
+        for conn in conns.values():
+            conn.close()
+
+
+def _writer_loop(q):
+    while True:
+        batch = []
+        marker = None
+        item = q.get()
+        while True:
+            if not callable(item[0]):
+                marker = item
+                break
+            batch.append(item)
+            if len(batch) >= LOG_DB_BATCH_SIZE:
+                break
+            try:
+                item = q.get_nowait()
+            except queue.Empty:
+                break
+        if batch:
+            try:
+                _apply_batch(batch)
+            except Exception:
+                logger.exception(f"[LOG_DB ERROR] batch of {len(batch)} dropped")
+        if marker is not None:
+            kind, event = marker
+            event.set()
+            if kind == "stop":
+                return
+
+
+def flush_request_logs(timeout=None):
+    """Tunggu semua operasi yang sudah masuk queue ditulis & di-commit."""
+    q = _write_queue
+    if q is None:
+        return True
+    event = threading.Event()
+    q.put(("flush", event))
+    return event.wait(timeout)
+
+
+def stop_request_log_writer(timeout=None):
+    """Tulis sisa queue lalu hentikan thread writer (shutdown / atexit)."""
+    global _writer, _write_queue
+    with _writer_lock:
+        writer, q = _writer, _write_queue
+        _writer = _write_queue = None
+    if writer is None:
+        return
+    event = threading.Event()
+    q.put(("stop", event))
+    writer.join(timeout)
+
+
+def _reset_writer_after_fork():
+    # thread writer tidak ikut ter-fork; queue milik parent ditulis parent
+    global _writer, _write_queue, _writer_lock
+    _writer = _write_queue = None
+    _writer_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_writer_after_fork)
+atexit.register(stop_request_log_writer)
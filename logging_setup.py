@@ -0,0 +1,116 @@
+import atexit
+import glob
+import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# =========================================================
+# NON-BLOCKING ROTATING LOG FILE
+# =========================================================
+#
+# Thread request hanya memasukkan record ke queue (QueueHandler); satu
+# thread QueueListener yang menulis ke file & console, jadi I/O log tidak
+# lagi bersaing dengan thread request.
+#
+# File dirotasi per hari dengan nama bertanggal (logs/chatbot-2025-01-31.log)
+# tanpa rename, sehingga aman ditulis beberapa worker gunicorn sekaligus.
+# File yang lebih tua dari LOG_FILE_RETENTION_DAYS dihapus saat rotasi
+# (0 = simpan selamanya).
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE_RETENTION_DAYS = int(os.getenv("LOG_FILE_RETENTION_DAYS", "14"))
+LOG_FORMAT = "%(asctime)s | %(levelname)s | %(message)s"
+
+_listener = None
+_queue_handler = None
+_handlers = []
+
+
+class DailyFileHandler(logging.Handler):
+    def __init__(self, log_dir, prefix="chatbot", retention_days=LOG_FILE_RETENTION_DAYS):
+        super().__init__()
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.retention_days = retention_days
+        self._day = None
+        self._stream = None
+
+    def _path(self, day):
+        return os.path.join(self.log_dir, f"{self.prefix}-{day}.log")
+
+    def _rollover(self, day):
+        if self._stream is not None:
+            self._stream.close()
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._stream = open(self._path(day), "a", encoding="utf-8")
+        self._day = day
+        self.prune()
+
+    def prune(self):
+        if self.retention_days <= 0:
+            return
+        cutoff = time.strftime("%Y-%m-%d", time.localtime(time.time() - self.retention_days * 86400))
+        for path in glob.glob(os.path.join(self.log_dir, f"{self.prefix}-*.log")):
+            day = os.path.basename(path)[len(self.prefix) + 1:-len(".log")]
+            if day < cutoff:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def emit(self, record):
+        try:
+            day = time.strftime("%Y-%m-%d", time.localtime(record.created))
+            if day != self._day:
+                self._rollover(day)
+            self._stream.write(self.format(record) + "\n")
+            self._stream.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        super().close()
+
+
+def _start_listener():
+    global _listener
+    # queue baru: lock queue lama bisa saja terkunci saat fork
+    log_queue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = QueueListener(log_queue, *_handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def setup_logging(log_dir="logs", prefix="chatbot"):
+    """Pasang QueueHandler di root logger (sekali per proses)."""
+    global _queue_handler
+    if _queue_handler is not None:
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in (DailyFileHandler(log_dir, prefix), logging.StreamHandler()):
+        handler.setFormatter(formatter)
+        _handlers.append(handler)
+
+    _queue_handler = QueueHandler(queue.SimpleQueue())
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(_queue_handler)
+    _start_listener()
+
+    # thread listener tidak ikut ter-fork (gunicorn preload_app)
+    os.register_at_fork(after_in_child=_start_listener)
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Tulis sisa record di queue, lalu hentikan thread listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -4,59 +4,67 @@ from dotenv import load_dotenv
 load_dotenv()
 import uuid
 import re
+import time
 from datetime import datetime
+import threading
 from concurrent.futures import ThreadPoolExecutor
 
-import pandas as pd
-import numpy as np
-from openai import OpenAI
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 
 from db import (
     insert_chat_pair,
     fetch_context,
-    fetch_dataset_by_intent
 )
 from db import insert_chat_pair, fetch_next_turn_index
-from db import apply_feedback_db
+from db import apply_feedback_batch
+from db import session_exists
+from db_init import init_db
+from embedding_cache import embedding_params
+from feedback_queue import FeedbackQueue
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY belum diset.")
 
-_client_warmup = OpenAI(api_key=OPENAI_API_KEY)
-_client_warmup.chat
-_client_warmup.embeddings
-
 import logging
+from logging_setup import setup_logging
 
 # ============================================================
 # LOGGING SETUP
 # ============================================================
 
 LOG_DIR = "logs"
-os.makedirs(LOG_DIR, exist_ok=True)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(message)s",
-    handlers=[
-        logging.FileHandler(f"{LOG_DIR}/chatbot.log", encoding="utf-8"),
-        logging.StreamHandler()
-    ]
-)
+
+# file harian logs/chatbot-YYYY-MM-DD.log lewat QueueHandler (non-blocking)
+setup_logging(LOG_DIR)
 
 logger = logging.getLogger("perpanjangan-chatbot")
 
 # ============================================================
 # CONFIG 
 # ============================================================
-CLIENT = OpenAI(api_key=OPENAI_API_KEY)
 TOP_K = 3
 
 EXECUTOR = ThreadPoolExecutor(max_workers=2,
                               thread_name_prefix="openai-worker-")
+init_db()
+
+# client OpenAI dibuat saat dipakai pertama kali (import openai ~0.5 detik),
+# begitu juga retrieval_store (numpy) bersama index-nya
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+def get_openai_client():
+    with _CLIENTS_LOCK:
+        if "openai" not in _CLIENTS:
+            from openai import OpenAI
+            _CLIENTS["openai"] = OpenAI(api_key=OPENAI_API_KEY)
+        return _CLIENTS["openai"]
+
+def get_retrieval_index():
+    import retrieval_store
+    return retrieval_store.get_retrieval_index()
 
 # ============================================================
 # PLACEHOLDERS
@@ -95,8 +103,8 @@ def normalize_user_query(text):
 # ============================================================
 
 def generate_embedding(text):
-    res = CLIENT.embeddings.create(
-        model="text-embedding-3-large",
+    res = get_openai_client().embeddings.create(
+        **embedding_params("text-embedding-3-large"),
         input=text
     )
     return res.data[0].embedding
@@ -177,7 +185,7 @@ def classify_intent_gpt(user_text, context):
     inferred_child: <nama_sub_intent>
     """
 
-    res = CLIENT.chat.completions.create(
+    res = get_openai_client().chat.completions.create(
         model="gpt-4.1-mini",
         messages=[{"role": "user", "content": prompt}]
     ).choices[0].message.content.strip()
@@ -204,51 +212,15 @@ def generate_embedding_async(text):
 def classify_intent_async(user_text, context):
     return EXECUTOR.submit(classify_intent_gpt, user_text, context)
 
-# ============================================================
-# COSINE SIMILARITY & TOP K RETRIEVAL
-# ============================================================
-
-def cosine_sim(a, b):
-    a = np.array(a)
-    b = np.array(b)
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-
-def retrieve_top_k(query_embedding, df, k=3):
-    # === COPY EMBEDDING ===
-    df_temp = df.copy()
-
-    # === COSINE SIMILARITY ===
-    df_temp["similarity"] = df_temp["embedding"].apply(
-        lambda e: cosine_sim(e, query_embedding)
-    )
-
-    # === NORMALISASI ===
-    sim_min = df_temp["similarity"].min()
-    sim_max = df_temp["similarity"].max()
-    df_temp["similarity_norm"] = (
-    (df_temp["similarity"] - sim_min) /
-    (sim_max - sim_min + 1e-6)
-    )
-
-    df_temp["similarity_norm_100"] = df_temp["similarity_norm"] * 100
-
-    # === FINAL SCORE ===
-    df_temp["final_score"] = (
-    df_temp["similarity_norm_100"] * 0.7 +
-    df_temp["priority_score"] * 0.3
-    ).round().astype(int)
-
-    return df_temp.sort_values("final_score", ascending=False).head(k)
-
 # ============================================================
 # PROMPT BUILDER
 # ============================================================
 
-def build_prompt_from_matches(user_text, matches_df):
+def build_prompt_from_matches(user_text, matches):
 
     sections = []
 
-    for _, row in matches_df.iterrows():
+    for row in matches:
         ctx_text = "\n".join(row["context"])
         adm = row["admin_response"]
         usr = row["user_message"]
@@ -333,7 +305,7 @@ def build_prompt_from_matches(user_text, matches_df):
         - Desain Bisnis gratis : banner/kartu nama/logo (pilih salah satu) dapat dikirim dalam file PSD.
     2. Selalu tekankan layanan GRATIS ini dalam jawaban Anda jika relevan, jika klien menanyakan diluar layanan gratis, maka jawab dengan sopan bahwa layanan tersebut di luar layanan gratis dan ada tambahan biaya, kemudian izin untuk menginformasikan ke tim terkait.
 
-    Berikut adalah {len(matches_df)} percakapan paling mirip dari database:
+    Berikut adalah {len(matches)} percakapan paling mirip dari database:
 
     {match_block}
 
@@ -485,7 +457,7 @@ def enforce_placeholders(user_text, draft_text, inferred_child):
     Pastikan jawaban sesuai dengan pertanyaan user dan tidak berbelit.
     """
 
-    res = CLIENT.chat.completions.create(
+    res = get_openai_client().chat.completions.create(
         model="gpt-4.1-mini",
         messages=[{"role": "user", "content": guard_prompt}]
     )
@@ -497,8 +469,8 @@ def enforce_placeholders(user_text, draft_text, inferred_child):
 # ============================================================
 MAX_CONTEXT_TURNS = 6
 
-def generate_bot_reply_with_context(user_text, context_text, matches_df):
-    prompt_matches = build_prompt_from_matches(user_text, matches_df)
+def generate_bot_reply_with_context(user_text, context_text, matches):
+    prompt_matches = build_prompt_from_matches(user_text, matches)
 
     final_prompt = f"""
     === RIWAYAT PERCAKAPAN SEBELUMNYA ===
@@ -516,7 +488,7 @@ def generate_bot_reply_with_context(user_text, context_text, matches_df):
     - Tidak menyangkal informasi yang sudah diberikan
     """
 
-    res = CLIENT.chat.completions.create(
+    res = get_openai_client().chat.completions.create(
         model="gpt-4.1-mini",
                 messages=[
             {"role": "system", "content": "Anda adalah AI admin pelayanan perpanjangan website."},
@@ -556,6 +528,37 @@ def save_chat_to_db(
         "embedding": embedding or []
     })
 
+# ============================================================
+# WARMUP
+# ============================================================
+
+def warmup():
+    """
+    Muat client & retrieval index, lalu request kecil lewat embedding &
+    chat completion supaya koneksi (DNS, TLS, connection pool) sudah siap
+    sebelum request user pertama.
+    """
+    t0 = time.perf_counter()
+    try:
+        get_retrieval_index()
+        generate_embedding("warmup")
+        get_openai_client().chat.completions.create(
+            model="gpt-4.1-mini",
+            messages=[{"role": "user", "content": "ping"}],
+            max_tokens=1
+        )
+    except Exception as e:
+        logger.warning(f"[WARMUP] failed: {e}")
+        return False
+    logger.info(f"[WARMUP] done in {time.perf_counter() - t0:.2f}s")
+    return True
+
+def start_background_warmup():
+    """Warmup tanpa menahan server mulai menerima request."""
+    thread = threading.Thread(target=warmup, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
 # ============================================================
 # FLASK SETUP
 # ============================================================
@@ -634,14 +637,14 @@ def chat():
         f"[EMBEDDING] session_id={session_id} | vector_dim={len(query_embedding)}"
     )
     # === RETRIEVAL (DATA LAMA) ===
-    dataset = fetch_dataset_by_intent(
-        inferred_parent if inferred_parent != "lainnya" else None
+    matches, retrieval_info = get_retrieval_index().search(
+        query_embedding, inferred_parent, inferred_child, k=TOP_K
     )
-    df_retrieval = pd.DataFrame(dataset)
     logger.info(
-        f"[RETRIEVAL] intent_parent={inferred_parent} | candidates={len(df_retrieval)}"
+        f"[RETRIEVAL] intent_parent={inferred_parent} | intent_child={inferred_child} | "
+        f"level={retrieval_info['level']} | candidates={retrieval_info['candidates']}"
     )
-    if df_retrieval.empty:
+    if not matches:
         bot_text = "Baik kak, untuk hal ini kami perlu cek dulu ke tim terkait ya 🙏"
 
         turn_index = fetch_next_turn_index(conversation_id)
@@ -666,9 +669,8 @@ def chat():
             "admin_response": bot_text
         })
 
-    matches_df = retrieve_top_k(query_embedding, df_retrieval, TOP_K)
-    if not matches_df.empty:
-        top = matches_df.iloc[0]
+    if matches:
+        top = matches[0]
         logger.info(
             f"[TOP MATCH] sim={top['similarity']:.4f} | "
             f"priority={top['priority_score']} | "
@@ -678,18 +680,18 @@ def chat():
         logger.warning(
             f"[RETRIEVAL EMPTY] session_id={session_id}"
         )
-    if matches_df is None or len(matches_df) == 0:
+    if not matches:
         top_similarity = 0.0
         top_match = None
     else:
-        top_match = matches_df.iloc[0]
+        top_match = matches[0]
         top_similarity = float(top_match["similarity"])
 
     matches_summary = []
-    if matches_df is not None:
-        for _, r in matches_df.iterrows():
+    if matches:
+        for r in matches:
             matches_summary.append({
-                "conversation_id": int(r["conversation_id"]) if not pd.isna(r["conversation_id"]) else None,
+                "conversation_id": int(r["conversation_id"]) if r.get("conversation_id") is not None else None,
                 "intent_parent": r.get("intent_parent"),
                 "intent_child": r.get("intent_child"),
                 "user_message": r.get("user_message"),
@@ -704,11 +706,10 @@ def chat():
     # =====================================================
 
     draft_text = generate_bot_reply_with_context(
-        user_query, context_text, matches_df
+        user_query, context_text, matches
     )
     logger.info(
-        f"[LAYER-1 DRAFT] session_id={session_id} | "
-        f"answer={draft_text}"
+        f"[LAYER-1 DRAFT] session_id={session_id} | chars={len(draft_text)}"
     )
     logger.debug(
         f"[LAYER-1 CONTENT]\n{draft_text}"
@@ -720,8 +721,7 @@ def chat():
         inferred_child
     )
     logger.info(
-        f"[LAYER-2 FINAL] session_id={session_id} | "
-        f"answer={bot_text}"
+        f"[LAYER-2 FINAL] session_id={session_id} | chars={len(bot_text)}"
     )
 
     if bot_text != draft_text:
@@ -782,8 +782,29 @@ def chat():
 # ENDPOINT /feedback
 # ============================================================
 
+def apply_feedback_and_reindex(counts):
+    """Batch FEEDBACK_QUEUE: tulis ke SQLite lalu update priority index."""
+    priorities = apply_feedback_batch(counts)
+    if priorities:
+        get_retrieval_index().update_priorities(priorities)
+
+
+FEEDBACK_QUEUE = FeedbackQueue(
+    apply_feedback_and_reindex,
+    flush_interval=float(os.getenv("FEEDBACK_FLUSH_SECONDS", "1")),
+    max_batch=int(os.getenv("FEEDBACK_MAX_BATCH", "500")),
+    logger=logger,
+)
+
 @app.route("/feedback", methods=["POST"])
 def feedback():
+    """
+    Rating 1 / -1 untuk jawaban sebuah session. Rating hanya dimasukkan ke
+    FEEDBACK_QUEUE: response "feedback queued" dikirim sebelum ditulis ke
+    SQLite, jadi error saat batch diterapkan (batch dikembalikan ke queue
+    & dicoba ulang) tidak pernah sampai ke client. Beberapa rating untuk
+    session yang sama dijumlahkan, tidak saling menimpa.
+    """
     payload = request.get_json(silent=True) or {}
 
     session_id = payload.get("session_id")
@@ -801,18 +822,18 @@ def feedback():
             "message": "no feedback applied"
         })
 
-    success = apply_feedback_db(session_id, rating)
-
-    if not success:
+    if not session_exists(session_id):
         return jsonify({
             "error": "session_id not found"
         }), 404
 
+    FEEDBACK_QUEUE.submit(session_id, rating)
+
     return jsonify({
         "status": "ok",
         "session_id": session_id,
         "rating": rating,
-        "message": "feedback saved to sqlite"
+        "message": "feedback queued"
     })
 
 # ============================================================
@@ -820,4 +841,6 @@ def feedback():
 # ============================================================
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=8080, debug=True)
+    start_background_warmup()
+    # debugger Werkzeug hanya untuk development lokal (FLASK_DEBUG=1)
+    app.run(host="127.0.0.1", port=8080, debug=os.getenv("FLASK_DEBUG", "0") == "1")
@@ -1,28 +1,38 @@
 import os
 from dotenv import load_dotenv
 load_dotenv()
+import hmac
 import uuid
 import re
 import time
 import threading
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
-
-import pandas as pd
-import numpy as np
-from openai import OpenAI, AuthenticationError
-try:
-    from anthropic import Anthropic
-except ImportError:
-    Anthropic = None
-from flask import Flask, request, jsonify
+from concurrent.futures import TimeoutError
+
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 
-from db import apply_feedback_db
+from db import apply_feedback_batch
 from db import fetch_context
-from db import fetch_dataset_by_intent
+from db import fetch_last_intent_child
 from db import fetch_next_turn_index
 from db import insert_chat_pair
+from db import session_exists
+from db_init import init_db
+from embedding_cache import embedding_params
+from cancellation import CancelToken, RequestCancelled, current_cancel_token
+from admission import (
+    AdaptiveLimiter,
+    LimiterRejected,
+    PRIORITY_NAMES,
+    PRIORITY_PAYMENT,
+    request_priority,
+)
+from executors import ExecutorSaturated, InstrumentedExecutor
+from feedback_queue import FeedbackQueue
 from log_db import init_log_db, start_request_log, finalize_request_log
+from profiler import PROFILER
+from telemetry import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from telemetry import RequestTrace, record_tokens, render_metrics
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
@@ -30,40 +40,47 @@ if not OPENAI_API_KEY:
 
 CLAUDE_MODEL = os.getenv("CLAUDE_MODEL", "claude-sonnet-4-6")
 CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY")
-CLAUDE_CLIENT = Anthropic(api_key=CLAUDE_API_KEY) if Anthropic and CLAUDE_API_KEY else None
 
 import logging
+from logging_setup import setup_logging
 
 # ============================================================
 # LOGGING SETUP
 # ============================================================
 
 LOG_DIR = "logs"
-os.makedirs(LOG_DIR, exist_ok=True)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(message)s",
-    handlers=[
-        logging.FileHandler(f"{LOG_DIR}/chatbot.log", encoding="utf-8"),
-        logging.StreamHandler()
-    ]
-)
+
+# file harian logs/chatbot-YYYY-MM-DD.log lewat QueueHandler (non-blocking)
+setup_logging(LOG_DIR)
 
 logger = logging.getLogger("perpanjangan-chatbot")
 
 # ============================================================
 # CONFIG 
 # ============================================================
-CLIENT = OpenAI(api_key=OPENAI_API_KEY)
 TOP_K = 3
-EXECUTOR = ThreadPoolExecutor(max_workers=2,
-                              thread_name_prefix="openai-worker-")
-CHAT_EXECUTOR = ThreadPoolExecutor(
-    max_workers=int(os.getenv("CHAT_MAX_WORKERS", "8")),
-    thread_name_prefix="chat-worker-"
+EXECUTOR = InstrumentedExecutor(max_workers=2,
+                                thread_name_prefix="openai-worker-")
+# CHAT_MAX_QUEUE > 0: request yang antre melebihi batas langsung dibalas
+# 503 + Retry-After, bukan menunggu sampai CHAT_TIMEOUT_SECONDS
+CHAT_MAX_WORKERS = int(os.getenv("CHAT_MAX_WORKERS", "16"))
+CHAT_EXECUTOR = InstrumentedExecutor(
+    max_workers=CHAT_MAX_WORKERS,
+    thread_name_prefix="chat-worker-",
+    max_queue=int(os.getenv("CHAT_MAX_QUEUE", "0")),
 )
 CHAT_TIMEOUT_SECONDS = int(os.getenv("CHAT_TIMEOUT_SECONDS", "120"))
+# concurrency /chat adaptif (lihat admission.py); CHAT_MAX_WORKERS jadi batas atas
+CHAT_LIMITER = AdaptiveLimiter(
+    "chat",
+    min_limit=int(os.getenv("CHAT_CONCURRENCY_MIN", "2")),
+    max_limit=CHAT_MAX_WORKERS,
+    initial_limit=int(os.getenv("CHAT_CONCURRENCY_INITIAL", "8")),
+    latency_target=float(os.getenv("CHAT_LATENCY_TARGET_SECONDS", "30")),
+    max_waiting=int(os.getenv("CHAT_ADMISSION_QUEUE", "32")),
+    wait_timeout=float(os.getenv("CHAT_ADMISSION_TIMEOUT_SECONDS", "30")),
+)
+init_db()
 init_log_db()
 
 # ============================================================
@@ -97,11 +114,48 @@ def normalize_user_query(text):
 
     return last_user.strip()
 
-def handle_llm_claude(messages, system_prompt=None, model=CLAUDE_MODEL, max_tokens=1024, temperature=0):
-    if Anthropic is None:
-        raise RuntimeError("Package anthropic belum terpasang. Install dengan: pip install anthropic")
+# ============================================================
+# LAZY CLIENTS
+# ============================================================
+#
+# openai & anthropic butuh ~1.5 detik untuk di-import, jadi baru dimuat
+# saat dipakai pertama kali (atau oleh warmup di background). Sama untuk
+# retrieval_store (numpy + vector_store), dimuat bersama index-nya.
+
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+def get_openai_client():
+    with _CLIENTS_LOCK:
+        if "openai" not in _CLIENTS:
+            from openai import OpenAI
+            _CLIENTS["openai"] = OpenAI(api_key=OPENAI_API_KEY)
+        return _CLIENTS["openai"]
+
+def get_claude_client():
+    """None jika package anthropic belum terpasang atau CLAUDE_API_KEY kosong."""
+    with _CLIENTS_LOCK:
+        if "claude" not in _CLIENTS:
+            try:
+                from anthropic import Anthropic
+            except ImportError:
+                Anthropic = None
+            _CLIENTS["claude"] = Anthropic(api_key=CLAUDE_API_KEY) if Anthropic and CLAUDE_API_KEY else None
+        return _CLIENTS["claude"]
+
+def get_retrieval_index():
+    import retrieval_store
+    return retrieval_store.get_retrieval_index()
+
+def is_openai_auth_error(exc):
+    from openai import AuthenticationError
+    return isinstance(exc, AuthenticationError)
 
-    if CLAUDE_CLIENT is None:
+def handle_llm_claude(messages, system_prompt=None, model=CLAUDE_MODEL, max_tokens=1024, temperature=0):
+    client = get_claude_client()
+    if client is None:
+        if CLAUDE_API_KEY:
+            raise RuntimeError("Package anthropic belum terpasang. Install dengan: pip install anthropic")
         raise RuntimeError("CLAUDE_API_KEY belum diset.")
 
     payload = {
@@ -115,22 +169,62 @@ def handle_llm_claude(messages, system_prompt=None, model=CLAUDE_MODEL, max_toke
         payload["system"] = system_prompt
 
     logger.info(f"[CLAUDE MODEL IN USE] model={model}")
-    res = CLAUDE_CLIENT.messages.create(**payload)
+    token = current_cancel_token()
+    if token is None:
+        res = client.messages.create(**payload)
+    else:
+        res = _stream_claude(client, payload, token)
+    usage = getattr(res, "usage", None)
+    if usage is not None:
+        record_tokens(usage.input_tokens, usage.output_tokens)
     parts = [
         block.text for block in res.content
         if getattr(block, "type", "") == "text"
     ]
     return clean_bot_output("\n".join(parts).strip())
 
+def _stream_claude(client, payload, token):
+    """
+    Versi messages.create yang bisa dibatalkan: stream dicek per event dan
+    ditutup dari thread lain saat token dibatalkan (koneksi HTTP diputus,
+    tidak menunggu jawaban selesai).
+    """
+    token.raise_if_cancelled()
+    with client.messages.stream(**payload, timeout=token.remaining()) as stream:
+        unregister = token.on_cancel(stream.close)
+        try:
+            for _ in stream:
+                if token.cancelled:
+                    break
+            token.raise_if_cancelled()
+            return stream.get_final_message()
+        except RequestCancelled:
+            raise
+        except Exception:
+            # error karena stream ditutup saat cancel → RequestCancelled
+            token.raise_if_cancelled()
+            raise
+        finally:
+            unregister()
+
 # ============================================================
 # EMBEDDING & INTENT
 # ============================================================
 
 def generate_embedding(text):
-    res = CLIENT.embeddings.create(
-        model="text-embedding-3-large",
-        input=text
+    options = {}
+    token = current_cancel_token()
+    if token is not None:
+        token.raise_if_cancelled()
+        options["timeout"] = token.remaining()
+    res = get_openai_client().embeddings.create(
+        **embedding_params("text-embedding-3-large"),
+        input=text,
+        **options
     )
+    usage = getattr(res, "usage", None)
+    if usage is not None:
+        record_tokens(input_tokens=usage.prompt_tokens)
     return res.data[0].embedding
 
 def classify_intent_gpt(user_text, context):
@@ -241,57 +335,25 @@ def classify_intent_gpt(user_text, context):
 # THREADPOOL WRAPPERS
 # ============================================================
 
-def generate_embedding_async(text):
+def generate_embedding_async(text, trace=None):
+    if trace is not None:
+        return EXECUTOR.submit(trace.run, "embedding", generate_embedding, text)
     return EXECUTOR.submit(generate_embedding, text)
 
-def classify_intent_async(user_text, context):
+def classify_intent_async(user_text, context, trace=None):
+    if trace is not None:
+        return EXECUTOR.submit(trace.run, "intent", classify_intent_gpt, user_text, context)
     return EXECUTOR.submit(classify_intent_gpt, user_text, context)
 
-# ============================================================
-# COSINE SIMILARITY & TOP K RETRIEVAL
-# ============================================================
-
-def cosine_sim(a, b):
-    a = np.array(a)
-    b = np.array(b)
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-
-def retrieve_top_k(query_embedding, df, k=3):
-    # === COPY EMBEDDING ===
-    df_temp = df.copy()
-
-    # === COSINE SIMILARITY ===
-    df_temp["similarity"] = df_temp["embedding"].apply(
-        lambda e: cosine_sim(e, query_embedding)
-    )
-
-    # === NORMALISASI ===
-    sim_min = df_temp["similarity"].min()
-    sim_max = df_temp["similarity"].max()
-    df_temp["similarity_norm"] = (
-    (df_temp["similarity"] - sim_min) /
-    (sim_max - sim_min + 1e-6)
-    )
-
-    df_temp["similarity_norm_100"] = df_temp["similarity_norm"] * 100
-
-    # === FINAL SCORE ===
-    df_temp["final_score"] = (
-    df_temp["similarity_norm_100"] * 0.7 +
-    df_temp["priority_score"] * 0.3
-    ).round().astype(int)
-
-    return df_temp.sort_values("final_score", ascending=False).head(k)
-
 # ============================================================
 # PROMPT BUILDER
 # ============================================================
 
-def build_prompt_from_matches(user_text, matches_df):
+def build_prompt_from_matches(user_text, matches):
 
     sections = []
 
-    for _, row in matches_df.iterrows():
+    for row in matches:
         ctx_text = "\n".join(row["context"])
         adm = row["admin_response"]
         usr = row["user_message"]
@@ -393,7 +455,7 @@ def build_prompt_from_matches(user_text, matches_df):
     3. Berikan juga informasi bahwa :
         - Jika website sudah lebih dari 30 hari tidak aktif, maka website akan memasuki redemption period sehingga harus ganti nama domain nantinya dan akan ada biaya tambahan sesuai paket yang diambil. 
 
-    Berikut adalah {len(matches_df)} percakapan paling mirip dari database:
+    Berikut adalah {len(matches)} percakapan paling mirip dari database:
 
     {match_block}
 
@@ -558,8 +620,8 @@ def enforce_placeholders(user_text, draft_text, inferred_child):
 # ============================================================
 MAX_CONTEXT_TURNS = 6
 
-def generate_bot_reply_with_context(user_text, context_text, matches_df):
-    prompt_matches = build_prompt_from_matches(user_text, matches_df)
+def generate_bot_reply_with_context(user_text, context_text, matches):
+    prompt_matches = build_prompt_from_matches(user_text, matches)
 
     final_prompt = f"""
     === RIWAYAT PERCAKAPAN SEBELUMNYA ===
@@ -615,6 +677,39 @@ def save_chat_to_db(
         "embedding": embedding or []
     })
 
+# ============================================================
+# WARMUP
+# ============================================================
+
+def warmup():
+    """
+    Muat client & retrieval index, lalu request kecil lewat embedding &
+    Claude supaya koneksi (DNS, TLS, connection pool) sudah siap sebelum
+    request user pertama. Dipanggil per worker setelah fork (lihat
+    gunicorn.conf.py), atau di background lewat start_background_warmup().
+    """
+    t0 = time.perf_counter()
+    try:
+        get_retrieval_index()
+        generate_embedding("warmup")
+        if get_claude_client() is not None:
+            handle_llm_claude([{"role": "user", "content": "ping"}], max_tokens=1)
+    except Exception as e:
+        logger.warning(f"[WARMUP] failed: {e}")
+        return False
+    logger.info(f"[WARMUP] done in {time.perf_counter() - t0:.2f}s")
+    return True
+
+def start_background_warmup():
+    """
+    Warmup tanpa menahan server mulai menerima request; request yang datang
+    lebih dulu hanya menunggu bagian yang belum siap (lock client/index).
+    Jangan dipanggil sebelum fork: thread tidak ikut ke proses worker.
+    """
+    thread = threading.Thread(target=warmup, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
 # ============================================================
 # FLASK SETUP
 # ============================================================
@@ -644,14 +739,45 @@ def chat():
         thread_name=threading.current_thread().name,
         user_query=user_query,
     )
-    future = CHAT_EXECUTOR.submit(process_chat_request, payload, request_id)
+    trace = RequestTrace(cancel_token=CancelToken(CHAT_TIMEOUT_SECONDS))
+
+    priority = request_priority(user_query)
+    if priority != PRIORITY_PAYMENT and CHAT_LIMITER.would_wait():
+        # intent turn sebelumnya hanya berpengaruh saat request harus antre
+        priority = request_priority(user_query, _last_intent_child(payload))
+    try:
+        CHAT_LIMITER.acquire(priority)
+    except LimiterRejected as e:
+        logger.warning(
+            f"[CHAT SHED] priority={PRIORITY_NAMES[priority]} | reason={e.reason} | "
+            f"limiter={CHAT_LIMITER.stats()}"
+        )
+        return overloaded_response(request_id, payload, trace, e, e.retry_after)
+
     try:
-        result, status_code = future.result(timeout=CHAT_TIMEOUT_SECONDS)
+        future = CHAT_EXECUTOR.submit(process_admitted_chat_request, payload, request_id, trace)
+    except ExecutorSaturated as e:
+        CHAT_LIMITER.release(0, overloaded=True)
+        logger.warning(
+            f"[CHAT OVERLOADED] queue={e.queue_depth} | retry_after={e.retry_after}s"
+        )
+        return overloaded_response(request_id, payload, trace, e, e.retry_after)
+    except BaseException:
+        # slot limiter sudah diambil, jangan bocor saat submit gagal
+        CHAT_LIMITER.release(0, overloaded=False)
+        raise
+    try:
+        # waktu antre di limiter ikut dihitung dalam CHAT_TIMEOUT_SECONDS
+        result, status_code = future.result(timeout=trace.cancel_token.remaining())
         return jsonify(result), status_code
     except TimeoutError:
+        # hentikan LLM call yang sedang jalan & lewati insert chat_pairs
+        trace.cancel_token.cancel("chat_timeout")
         logger.error(
-            f"[CHAT TIMEOUT] exceeded {CHAT_TIMEOUT_SECONDS} seconds"
+            f"[CHAT TIMEOUT] exceeded {CHAT_TIMEOUT_SECONDS} seconds | "
+            f"queued={CHAT_EXECUTOR.queued} | active={CHAT_EXECUTOR.active}"
         )
+        trace.finish("chat_timeout", 504)
         try:
             finalize_request_log(
                 request_id=request_id,
@@ -670,6 +796,7 @@ def chat():
         }), 504
     except Exception as e:
         logger.exception(f"[CHAT EXECUTOR ERROR] {str(e)}")
+        trace.finish("chat_processing_failed", 500)
         try:
             finalize_request_log(
                 request_id=request_id,
@@ -687,9 +814,58 @@ def chat():
             "message": str(e)
         }), 500
 
-def process_chat_request(payload, request_id):
+def _last_intent_child(payload):
+    try:
+        conversation_id = int(payload.get("conversation_id"))
+    except (TypeError, ValueError):
+        return None
+    try:
+        return fetch_last_intent_child(conversation_id)
+    except Exception:
+        logger.exception("[ADMISSION] failed to read last intent")
+        return None
+
+def overloaded_response(request_id, payload, trace, error, retry_after):
+    trace.finish("chat_overloaded", 503)
+    try:
+        finalize_request_log(
+            request_id=request_id,
+            status="chat_overloaded",
+            http_status=503,
+            error_code="chat_overloaded",
+            error_message=str(error),
+            payload=payload,
+            thread_name=threading.current_thread().name,
+        )
+    except Exception:
+        logger.exception("[LOG_DB ERROR] failed to write chat_overloaded log")
+    return jsonify({
+        "error": "chat_overloaded",
+        "message": "Server sedang sibuk, silakan coba lagi."
+    }), 503, {"Retry-After": str(retry_after)}
+
+def process_admitted_chat_request(payload, request_id, trace):
+    """
+    Jalankan request yang sudah lolos CHAT_LIMITER, lalu kembalikan slot
+    beserta latensi & sinyal overload untuk penyesuaian limit.
+    """
+    started_at = time.perf_counter()
+    overloaded = True
+    try:
+        with PROFILER.profile_request(trace):
+            result, status_code = process_chat_request(payload, request_id, trace)
+        overloaded = status_code in (502, 503, 504) or trace.cancel_token.cancelled
+        return result, status_code
+    finally:
+        CHAT_LIMITER.release(time.perf_counter() - started_at, overloaded=overloaded)
+
+def process_chat_request(payload, request_id, trace=None):
     started_at = time.perf_counter()
     thread_name = threading.current_thread().name
+    if trace is None:
+        trace = RequestTrace()
+    trace.mark_started()
+    token = trace.cancel_token or CancelToken()
     session_id = str(uuid.uuid4())
 
     context_list = []
@@ -704,6 +880,7 @@ def process_chat_request(payload, request_id):
     draft_text = None
     bot_text = None
     def finalize_and_return(response, http_status, status, error_code=None, error_message=None):
+        trace.finish(status, http_status)
         try:
             duration_ms = int((time.perf_counter() - started_at) * 1000)
             finalize_request_log(
@@ -730,11 +907,20 @@ def process_chat_request(payload, request_id):
                 payload=payload,
                 thread_name=thread_name,
                 duration_ms=duration_ms,
+                **trace.log_fields(),
             )
         except Exception as e:
             logger.error(f"[LOG_DB ERROR] request_id={request_id} | {str(e)}", exc_info=True)
         return response, http_status
 
+    def cancelled_and_return():
+        # chat() sudah membalas (504) → respons ini tidak dikirim, hanya dicatat
+        logger.warning(f"[CHAT CANCELLED] request_id={request_id} | reason={token.reason}")
+        return finalize_and_return({
+            "error": "request_cancelled",
+            "message": "Permintaan dibatalkan."
+        }, 499, "cancelled", "request_cancelled", token.reason)
+
     user_query = normalize_user_query(payload.get("query") or payload.get("q"))
     conversation_id = payload.get("conversation_id")
 
@@ -759,8 +945,11 @@ def process_chat_request(payload, request_id):
         return finalize_and_return({"error": "query required"}, 400, "invalid_request", "query_required", "query required")
 
     # === CONTEXT ===
-    context_list = fetch_context(conversation_id)
+    with trace.span("context"):
+        context_list = fetch_context(conversation_id)
     context_text = "\n".join(context_list)
+    if token.cancelled:
+        return cancelled_and_return()
     logger.debug(
         f"[CONTEXT] conversation_id={conversation_id} | turns={len(context_list)}"
     )
@@ -769,13 +958,20 @@ def process_chat_request(payload, request_id):
     )
 
     # === PARALLEL EXECUTION ===
-    intent_future = classify_intent_async(user_query, context_text)
-    embedding_future = generate_embedding_async(user_query)
+    intent_future = classify_intent_async(user_query, context_text, trace)
+    embedding_future = generate_embedding_async(user_query, trace)
+    # future yang belum mulai dibatalkan; yang sedang jalan berhenti sendiri
+    token.on_cancel(intent_future.cancel)
+    token.on_cancel(embedding_future.cancel)
 
     # === TUNGGU HASILNYA ===
     try:
         query_embedding = embedding_future.result()
-    except AuthenticationError:
+    except Exception as e:
+        if token.cancelled:
+            return cancelled_and_return()
+        if not is_openai_auth_error(e):
+            raise
         logger.exception(
             f"[OPENAI AUTH ERROR] session_id={session_id} | invalid OPENAI_API_KEY"
         )
@@ -793,6 +989,8 @@ def process_chat_request(payload, request_id):
             exc_info=True
         )
         inferred_parent, inferred_child = "lainnya", "tidak_jelas"
+    if token.cancelled:
+        return cancelled_and_return()
 
     logger.info(
         f"[INTENT] session_id={session_id} | parent={inferred_parent} | child={inferred_child}"
@@ -803,36 +1001,42 @@ def process_chat_request(payload, request_id):
     )
 
     # === RETRIEVAL===
-    dataset = fetch_dataset_by_intent(
-        inferred_parent if inferred_parent != "lainnya" else None
-    )
-    df_retrieval = pd.DataFrame(dataset)
-    retrieval_candidates = len(df_retrieval)
+    with trace.span("retrieval"):
+        matches, retrieval_info = get_retrieval_index().search(
+            query_embedding,
+            inferred_parent,
+            inferred_child,
+            k=TOP_K,
+        )
+    retrieval_candidates = retrieval_info["candidates"]
     logger.info(
-        f"[RETRIEVAL] intent_parent={inferred_parent} | candidates={retrieval_candidates}"
+        f"[RETRIEVAL] intent_parent={inferred_parent} | intent_child={inferred_child} | "
+        f"level={retrieval_info['level']} | candidates={retrieval_candidates}"
     )
 
-    if df_retrieval.empty:
+    if not matches:
         bot_text = "Baik kak, untuk hal ini kami perlu cek dulu ke tim terkait ya 🙏"
-        save_chat_to_db(
-            conversation_id=conversation_id,
-            session_id=session_id,
-            user_message=user_query,
-            admin_response=bot_text,
-            context=context_list,
-            intent_parent=inferred_parent,
-            intent_child=inferred_child,
-            priority_score=50,
-            embedding=query_embedding
-        )
+        if token.cancelled:
+            return cancelled_and_return()
+        with trace.span("db_insert"):
+            save_chat_to_db(
+                conversation_id=conversation_id,
+                session_id=session_id,
+                user_message=user_query,
+                admin_response=bot_text,
+                context=context_list,
+                intent_parent=inferred_parent,
+                intent_child=inferred_child,
+                priority_score=50,
+                embedding=query_embedding
+            )
         return finalize_and_return({
             "status": "ok",
             "admin_response": bot_text
         }, 200, "success_empty_retrieval")
 
-    matches_df = retrieve_top_k(query_embedding, df_retrieval, TOP_K)
-    if not matches_df.empty:
-        top = matches_df.iloc[0]
+    if matches:
+        top = matches[0]
         top_similarity = float(top["similarity"])
         top_priority_score = float(top["priority_score"])
         top_final_score = float(top["final_score"])
@@ -847,9 +1051,9 @@ def process_chat_request(payload, request_id):
         )
 
     matches_summary = []
-    for _, r in matches_df.iterrows():
+    for r in matches:
         matches_summary.append({
-            "conversation_id": int(r["conversation_id"]) if not pd.isna(r["conversation_id"]) else None,
+            "conversation_id": int(r["conversation_id"]) if r.get("conversation_id") is not None else None,
             "intent_parent": r.get("intent_parent"),
             "intent_child": r.get("intent_child"),
             "user_message": r.get("user_message"),
@@ -861,9 +1065,12 @@ def process_chat_request(payload, request_id):
 
     # === GENERATE RESPONSE ===
     try:
-        draft_text = generate_bot_reply_with_context(
-            user_query, context_text, matches_df
-        )
+        with trace.span("generation"):
+            draft_text = generate_bot_reply_with_context(
+                user_query, context_text, matches
+            )
+    except RequestCancelled:
+        return cancelled_and_return()
     except Exception as e:
         logger.error(
             f"[CLAUDE GENERATION ERROR] session_id={session_id} | {str(e)}",
@@ -881,21 +1088,23 @@ def process_chat_request(payload, request_id):
         }, 502, "claude_generation_empty", "claude_generation_failed", "Claude tidak mengembalikan respons.")
 
     logger.info(
-        f"[LAYER-1 DRAFT] session_id={session_id} | "
-        f"answer={draft_text}"
+        f"[LAYER-1 DRAFT] session_id={session_id} | chars={len(draft_text)}"
     )
     logger.debug(
         f"[LAYER-1 CONTENT]\n{draft_text}"
     )
 
-    bot_text = enforce_placeholders(
-        user_query,
-        draft_text,
-        inferred_child
-    )
+    try:
+        with trace.span("placeholder_guard"):
+            bot_text = enforce_placeholders(
+                user_query,
+                draft_text,
+                inferred_child
+            )
+    except RequestCancelled:
+        return cancelled_and_return()
     logger.info(
-        f"[LAYER-2 FINAL] session_id={session_id} | "
-        f"answer={bot_text}"
+        f"[LAYER-2 FINAL] session_id={session_id} | chars={len(bot_text)}"
     )
 
     if bot_text != draft_text:
@@ -908,24 +1117,27 @@ def process_chat_request(payload, request_id):
     )
 
     # === SAVE ===
-    turn_index = fetch_next_turn_index(conversation_id)
-    logger.info(
-        f"[DB INSERT] conversation_id={conversation_id} | "
-        f"turn_index={turn_index} | session_id={session_id}"
-    )
-
+    # jawaban yang tidak akan dilihat user tidak masuk corpus retrieval
+    if token.cancelled:
+        return cancelled_and_return()
     try:
-        save_chat_to_db(
-            conversation_id=conversation_id,
-            session_id=session_id,
-            user_message=user_query,
-            admin_response=bot_text,
-            context=context_list,
-            intent_parent=inferred_parent,
-            intent_child=inferred_child,
-            priority_score=50,
-            embedding=query_embedding
-        )
+        with trace.span("db_insert"):
+            turn_index = fetch_next_turn_index(conversation_id)
+            logger.info(
+                f"[DB INSERT] conversation_id={conversation_id} | "
+                f"turn_index={turn_index} | session_id={session_id}"
+            )
+            save_chat_to_db(
+                conversation_id=conversation_id,
+                session_id=session_id,
+                user_message=user_query,
+                admin_response=bot_text,
+                context=context_list,
+                intent_parent=inferred_parent,
+                intent_child=inferred_child,
+                priority_score=50,
+                embedding=query_embedding
+            )
     except Exception as e:
         logger.critical(
             f"[DB ERROR] session_id={session_id} | {str(e)}",
@@ -945,12 +1157,78 @@ def process_chat_request(payload, request_id):
         "matches": matches_summary
     }, 200, "success")
 
+# ============================================================
+# ENDPOINT /metrics
+# ============================================================
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+# ============================================================
+# ENDPOINT /admin/profile
+# ============================================================
+
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN")
+
+@app.route("/admin/profile", methods=["GET", "POST"])
+def admin_profile():
+    """
+    GET  → status profiler.
+    POST → {"sample_rate": 0.1, "interval_ms": 5, "duration_seconds": 300}
+    Hanya aktif jika PROFILE_ADMIN_TOKEN diset (header X-Admin-Token).
+    """
+    if not PROFILE_ADMIN_TOKEN:
+        return jsonify({"error": "not found"}), 404
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), PROFILE_ADMIN_TOKEN):
+        return jsonify({"error": "forbidden"}), 403
+
+    if request.method == "GET":
+        return jsonify(PROFILER.stats())
+
+    payload = request.get_json(silent=True) or {}
+    try:
+        stats = PROFILER.configure(
+            sample_rate=payload.get("sample_rate"),
+            interval_ms=payload.get("interval_ms"),
+            duration_seconds=payload.get("duration_seconds"),
+        )
+    except (TypeError, ValueError):
+        return jsonify({"error": "invalid input"}), 400
+
+    logger.warning(
+        f"[PROFILER] sample_rate={stats['sample_rate']} | interval_ms={stats['interval_ms']} | "
+        f"expires_in={stats['expires_in']}"
+    )
+    return jsonify(stats)
+
 # ============================================================
 # ENDPOINT /feedback
 # ============================================================
 
+def apply_feedback_and_reindex(counts):
+    """Batch FEEDBACK_QUEUE: tulis ke SQLite lalu update priority index."""
+    priorities = apply_feedback_batch(counts)
+    if priorities:
+        get_retrieval_index().update_priorities(priorities)
+
+
+FEEDBACK_QUEUE = FeedbackQueue(
+    apply_feedback_and_reindex,
+    flush_interval=float(os.getenv("FEEDBACK_FLUSH_SECONDS", "1")),
+    max_batch=int(os.getenv("FEEDBACK_MAX_BATCH", "500")),
+    logger=logger,
+)
+
 @app.route("/feedback", methods=["POST"])
 def feedback():
+    """
+    Rating 1 / -1 untuk jawaban sebuah session. Rating hanya dimasukkan ke
+    FEEDBACK_QUEUE: response "feedback queued" dikirim sebelum ditulis ke
+    SQLite, jadi error saat batch diterapkan (batch dikembalikan ke queue
+    & dicoba ulang) tidak pernah sampai ke client. Beberapa rating untuk
+    session yang sama dijumlahkan, tidak saling menimpa.
+    """
     payload = request.get_json(silent=True) or {}
 
     session_id = payload.get("session_id")
@@ -968,18 +1246,18 @@ def feedback():
             "message": "no feedback applied"
         })
 
-    success = apply_feedback_db(session_id, rating)
-
-    if not success:
+    if not session_exists(session_id):
         return jsonify({
             "error": "session_id not found"
         }), 404
 
+    FEEDBACK_QUEUE.submit(session_id, rating)
+
     return jsonify({
         "status": "ok",
         "session_id": session_id,
         "rating": rating,
-        "message": "feedback saved to sqlite"
+        "message": "feedback queued"
     })
 
 # ============================================================
@@ -987,4 +1265,6 @@ def feedback():
 # ============================================================
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=8080, debug=True)
+    start_background_warmup()
+    # debugger Werkzeug hanya untuk development lokal (FLASK_DEBUG=1)
+    app.run(host="127.0.0.1", port=8080, debug=os.getenv("FLASK_DEBUG", "0") == "1")
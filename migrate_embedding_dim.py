@@ -0,0 +1,84 @@
+import argparse
+import json
+import sqlite3
+import time
+
+from db_init import init_db
+from embedding_cache import EMBEDDING_DIM, truncate_embedding
+
+DB_PATH = "chatbot.db"
+BATCH_SIZE = 2000
+
+# =========================================================
+# TRUNCATE & RENORMALIZE EMBEDDING CORPUS
+# =========================================================
+#
+# text-embedding-3-* dilatih Matryoshka: N dimensi pertama + normalisasi
+# ulang setara dengan request `dimensions=N`, jadi corpus lama tidak perlu
+# di-embed ulang lewat API. Jalankan setelah EMBEDDING_DIM diset supaya
+# embedding di chat_pairs sama dimensinya dengan embedding query.
+
+
+def migrate_embedding_dim(dim=EMBEDDING_DIM, batch_size=BATCH_SIZE, dry_run=False):
+    if not dim:
+        raise ValueError("EMBEDDING_DIM belum diset (atau pakai --dim)")
+
+    init_db()
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+
+    stats = {"truncated": 0, "already": 0, "too_short": 0}
+    last_id = 0
+    while True:
+        cur.execute(
+            """
+            SELECT id, embedding FROM chat_pairs
+            WHERE id > ? AND embedding IS NOT NULL
+            ORDER BY id
+            LIMIT ?
+            """,
+            (last_id, batch_size),
+        )
+        rows = cur.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        updates = []
+        for row_id, emb_json in rows:
+            emb = json.loads(emb_json)
+            if len(emb) == dim:
+                stats["already"] += 1
+            elif len(emb) < dim:
+                stats["too_short"] += 1
+            else:
+                updates.append((json.dumps(truncate_embedding(emb, dim)), row_id))
+
+        stats["truncated"] += len(updates)
+        if updates and not dry_run:
+            cur.executemany("UPDATE chat_pairs SET embedding = ? WHERE id = ?", updates)
+            conn.commit()
+
+    if not dry_run and stats["truncated"]:
+        # ruang yang dibebaskan baru kembali ke OS lewat vacuum
+        # (lihat compaction.py untuk incremental vacuum)
+        cur.execute("PRAGMA optimize")
+    conn.close()
+
+    print(
+        f"[EMBED DIM] dim={dim} | truncated={stats['truncated']} | "
+        f"already={stats['already']} | too_short={stats['too_short']} | "
+        f"{time.perf_counter() - t0:.1f}s" + (" | dry run" if dry_run else "")
+    )
+    if stats["too_short"]:
+        print("[EMBED DIM] ⚠️ ada embedding lebih pendek dari dim, perlu di-embed ulang")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Truncate & renormalize embedding chat_pairs")
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    migrate_embedding_dim(dim=args.dim, dry_run=args.dry_run)
@@ -1,63 +1,231 @@
+import hashlib
 import json
+import os
 import sqlite3
-from turtle import pd
+import time
+
+from db_init import init_db
+from dedup import response_key
 
 DB_PATH = "chatbot.db"
 JSON_PATH = "model/pairs_perpanjangan_with_intent_embedding.json"
 
-def migrate(overwrite=True):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+# jumlah row per executemany
+BULK_CHUNK_SIZE = int(os.getenv("MIGRATE_CHUNK_SIZE", "5000"))
 
-    if overwrite:
-        print("⚠️ Clearing existing chat_pairs data...")
-        cur.execute("DELETE FROM chat_pairs")
-        conn.commit()
+# index target upsert, tidak boleh di-drop selama load
+UPSERT_INDEX = "ux_import_turn"
 
-    with open(JSON_PATH, "r", encoding="utf-8") as f:
-        import pandas as pd
-        df = pd.read_json(JSON_PATH, lines=True)
-        data = df.to_dict(orient="records")
+# PRAGMA per-connection untuk bulk load (tidak persisten ke file DB)
+BULK_PRAGMAS = (
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",  # ~256MB page cache
+)
 
-    inserted = 0
 
-    for row in data:
-        cur.execute("""
-            INSERT INTO chat_pairs (
-                conversation_id,
-                session_id,
-                turn_index,
-                user_message,
-                admin_response,
-                context,
-                intent_parent,
-                intent_child,
-                priority_score,
-                reward_count,
-                punish_count,
-                embedding
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            row.get("conversation_id", 0),
-            row.get("session_id"),
-            row.get("turn_index", 0),
+def row_content_hash(params):
+    """
+    Hash dari nilai yang akan ditulis ke DB (context & embedding sudah
+    dalam bentuk JSON), jadi tidak perlu serialize ulang hanya untuk hash.
+    Kalau hash sama dengan di DB, row tidak perlu ditulis ulang.
+    """
+    h = hashlib.sha256()
+    for value in params:
+        h.update(str(value).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+UPSERT_SQL = """
+    INSERT INTO chat_pairs (
+        conversation_id,
+        session_id,
+        turn_index,
+        user_message,
+        admin_response,
+        context,
+        intent_parent,
+        intent_child,
+        priority_score,
+        reward_count,
+        punish_count,
+        embedding,
+        content_hash,
+        response_key
+    ) VALUES (?, NULL, ?, ?, ?, ?, ?, ?, ?, 0, 0, ?, ?, ?)
+    ON CONFLICT (conversation_id, turn_index) WHERE session_id IS NULL
+    DO UPDATE SET
+        user_message = excluded.user_message,
+        admin_response = excluded.admin_response,
+        context = excluded.context,
+        intent_parent = excluded.intent_parent,
+        intent_child = excluded.intent_child,
+        -- skor yang sudah disesuaikan lewat /feedback tidak ditimpa
+        priority_score = CASE
+            WHEN chat_pairs.reward_count + chat_pairs.punish_count = 0
+            THEN excluded.priority_score
+            ELSE chat_pairs.priority_score
+        END,
+        embedding = excluded.embedding,
+        content_hash = excluded.content_hash,
+        -- isi berubah: status duplikat lama tidak berlaku lagi, dedup.py
+        -- mengevaluasi ulang dengan response_key baru
+        response_key = excluded.response_key,
+        canonical_id = NULL
+"""
+
+# =========================================================
+# STREAMING READER
+# =========================================================
+
+def iter_json_lines(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_changed_params(rows, existing, stats):
+    for row in rows:
+        row.setdefault("conversation_id", 0)
+        row.setdefault("turn_index", 0)
+        if row.get("priority_score") is None:
+            row["priority_score"] = 50
+
+        params = (
+            row["conversation_id"],
+            row["turn_index"],
             row.get("user_message"),
             row.get("admin_response"),
-            json.dumps(row.get("context", []), ensure_ascii=False),
+            json.dumps(row.get("context") or [], ensure_ascii=False),
             row.get("intent_parent"),
             row.get("intent_child"),
-            row.get("priority_score", 50),
-            row.get("reward_count", 0),
-            row.get("punish_count", 0),
-            json.dumps(row.get("embedding")) if row.get("embedding") else None
-        ))
+            row["priority_score"],
+            json.dumps(row.get("embedding")) if row.get("embedding") else None,
+        )
+
+        content_hash = row_content_hash(params)
+        if existing.get((row["conversation_id"], row["turn_index"])) == content_hash:
+            stats["unchanged"] += 1
+            continue
+
+        stats["upserted"] += 1
+        yield params + (content_hash, response_key(row.get("admin_response")))
+
+
+def iter_chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# =========================================================
+# INDEX HELPERS
+# =========================================================
+
+def drop_secondary_indexes(cur):
+    """
+    Drop index chat_pairs (kecuali target upsert), return SQL-nya
+    supaya bisa dibuat ulang persis sama setelah load.
+    """
+    cur.execute(
+        """
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND tbl_name = 'chat_pairs'
+          AND sql IS NOT NULL AND name != ?
+        """,
+        (UPSERT_INDEX,),
+    )
+    indexes = cur.fetchall()
+    for name, _ in indexes:
+        cur.execute(f"DROP INDEX IF EXISTS {name}")
+    return [sql for _, sql in indexes]
+
+# =========================================================
+# MIGRATE
+# =========================================================
+
+def migrate(overwrite=False, rebuild_indexes=None, path=JSON_PATH):
+    """
+    Load hasil embedding ke chat_pairs secara streaming dalam 1 transaksi.
+
+    overwrite=False (default): upsert hanya row yang content hash-nya berubah,
+    reward_count/punish_count dan skor hasil feedback tidak disentuh.
+    overwrite=True: hapus semua row hasil import (session_id NULL) lalu isi
+    ulang (tetap atomik). Row live dari /chat tidak ikut dihapus.
+
+    rebuild_indexes=None → otomatis: index sekunder di-drop & dibangun ulang
+    jika overwrite atau belum ada row hasil import (full load).
+    """
+    init_db()
+
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    cur = conn.cursor()
+    for pragma in BULK_PRAGMAS:
+        cur.execute(pragma)
+
+    stats = {"upserted": 0, "unchanged": 0}
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+
+        if overwrite:
+            # hanya row hasil import; row live dari /chat (session_id NOT NULL)
+            # beserta counter feedback-nya tetap
+            print("⚠️ Clearing imported chat_pairs rows...")
+            cur.execute("DELETE FROM chat_pairs WHERE session_id IS NULL")
+            # duplikat yang menunjuk row import terhapus kembali jadi kanonik;
+            # dedup.py menandainya ulang pada run berikutnya
+            cur.execute("""
+                UPDATE chat_pairs SET canonical_id = NULL
+                WHERE canonical_id IS NOT NULL
+                  AND canonical_id NOT IN (SELECT id FROM chat_pairs)
+            """)
+
+        cur.execute("""
+            SELECT conversation_id, turn_index, content_hash
+            FROM chat_pairs
+            WHERE session_id IS NULL
+        """)
+        existing = {(cid, turn): h for cid, turn, h in cur.fetchall()}
+
+        if rebuild_indexes is None:
+            rebuild_indexes = overwrite or not existing
+
+        index_sql = drop_secondary_indexes(cur) if rebuild_indexes else []
+
+        params = iter_changed_params(iter_json_lines(path), existing, stats)
+        for chunk in iter_chunks(params, BULK_CHUNK_SIZE):
+            cur.executemany(UPSERT_SQL, chunk)
+
+        if index_sql:
+            print(f"[MIGRATE] Rebuilding {len(index_sql)} index(es)...")
+            for sql in index_sql:
+                cur.execute(sql)
 
-        inserted += 1
+        cur.execute("COMMIT")
+    except Exception:
+        cur.execute("ROLLBACK")
+        conn.close()
+        raise
 
-    conn.commit()
+    cur.execute("PRAGMA optimize")
     conn.close()
 
-    print(f"✅ Migrated {inserted} rows into SQLite")
+    elapsed = time.perf_counter() - t0
+    total = stats["upserted"] + stats["unchanged"]
+    print(
+        f"✅ Migrated into SQLite | upserted={stats['upserted']} | "
+        f"unchanged={stats['unchanged']} | {elapsed:.1f}s "
+        f"({total / max(elapsed, 1e-9):,.0f} rows/s)"
+    )
+    return stats
 
 if __name__ == "__main__":
-    migrate(overwrite=True)
+    migrate(overwrite=False)
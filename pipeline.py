@@ -0,0 +1,175 @@
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import time
+from datetime import datetime
+from graphlib import TopologicalSorter
+
+# =========================================================
+# INCREMENTAL DATA PIPELINE (DAG)
+# =========================================================
+#
+# raw SQL → clean → pairs → filter → score → embed → load (SQLite)
+#
+# Level stage : stage dilewati jika hash semua input sama dengan run terakhir
+#               dan semua output masih ada.
+# Level row   : stage mahal sudah incremental per row:
+#               - score : checkpoint per hash isi row (llm_jobs.CheckpointStore)
+#               - embed : cache embedding per hash text (embedding_cache)
+#               - load  : upsert hanya row yang content_hash-nya berubah
+
+PIPELINE_STATE_PATH = "data/pipeline_state.json"
+
+
+class Stage:
+    def __init__(self, name, module, func, inputs, outputs, deps=(), kwargs=None):
+        self.name = name
+        self.module = module
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.kwargs = kwargs or {}
+
+    def run(self):
+        # import lazy: modul scoring/embedding membuat client OpenAI saat import
+        mod = importlib.import_module(self.module)
+        return getattr(mod, self.func)(**self.kwargs)
+
+
+STAGES = [
+    Stage(
+        "clean", "data_prepare1_cleaning_normalizing", "main",
+        inputs=["data/clean_dataset.sql"],
+        outputs=["data/cleaned_dataset.json"],
+    ),
+    Stage(
+        "pairs", "data_prepare2_pairs", "main",
+        inputs=["data/cleaned_dataset.json"],
+        outputs=["data/pairs_dataset.json"],
+        deps=["clean"],
+    ),
+    Stage(
+        "filter", "data_prepare3_filtering", "main",
+        inputs=["data/pairs_dataset.json", "data/perpanjangan_web.csv"],
+        outputs=["data/pairs_perpanjangan.json"],
+        deps=["pairs"],
+    ),
+    Stage(
+        "score", "data_prepare4_scoring", "main",
+        inputs=["data/pairs_perpanjangan.json"],
+        outputs=["data/pairs_perpanjangan_with_intent_and_score.json"],
+        deps=["filter"],
+    ),
+    Stage(
+        "embed", "data_prepare5_embedding", "main",
+        inputs=["data/pairs_perpanjangan_with_intent_and_score.json"],
+        outputs=["model/pairs_perpanjangan_with_intent_embedding.json"],
+        deps=["score"],
+    ),
+    Stage(
+        "load", "migrate_json_to_sqlite", "migrate",
+        inputs=["model/pairs_perpanjangan_with_intent_embedding.json"],
+        outputs=[],
+        deps=["embed"],
+        kwargs={"overwrite": False},
+    ),
+]
+
+# =========================================================
+# STATE
+# =========================================================
+
+def file_hash(path, chunk_size=1 << 20):
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_state(path=PIPELINE_STATE_PATH):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state, path=PIPELINE_STATE_PATH):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+# =========================================================
+# RUNNER
+# =========================================================
+
+def stage_is_stale(stage, state, input_hashes):
+    prev = state.get(stage.name)
+    if not prev:
+        return "never run"
+    if any(not os.path.exists(p) for p in stage.outputs):
+        return "output missing"
+    if prev.get("inputs") != input_hashes:
+        return "input changed"
+    return None
+
+
+def run_pipeline(only=None, force=()):
+    stages = {s.name: s for s in STAGES}
+    order = list(TopologicalSorter({s.name: s.deps for s in STAGES}).static_order())
+    if only:
+        order = [n for n in order if n in only]
+
+    state = load_state()
+    summary = []
+
+    for name in order:
+        stage = stages[name]
+
+        missing = [p for p in stage.inputs if not os.path.exists(p)]
+        if missing:
+            raise FileNotFoundError(f"[PIPELINE] {name}: input tidak ditemukan: {missing}")
+
+        input_hashes = {p: file_hash(p) for p in stage.inputs}
+        reason = "forced" if name in force else stage_is_stale(stage, state, input_hashes)
+
+        if not reason:
+            print(f"[PIPELINE] {name}: up to date, skip")
+            summary.append((name, "skipped", 0.0))
+            continue
+
+        print(f"[PIPELINE] {name}: running ({reason})")
+        t0 = time.perf_counter()
+        stage.run()
+        elapsed = time.perf_counter() - t0
+
+        state[name] = {
+            "inputs": input_hashes,
+            "outputs": {p: file_hash(p) for p in stage.outputs},
+            "finished_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "duration_s": round(elapsed, 2),
+        }
+        save_state(state)
+        summary.append((name, "ran", elapsed))
+
+    print("[PIPELINE] Summary:")
+    for name, status, elapsed in summary:
+        print(f"  - {name:<7} {status:<8} {elapsed:8.1f}s")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental data pipeline runner")
+    parser.add_argument("--only", nargs="*", help="jalankan stage tertentu saja")
+    parser.add_argument("--force", nargs="*", default=[], help="paksa stage dijalankan ulang")
+    args = parser.parse_args()
+    run_pipeline(only=args.only, force=set(args.force))
@@ -0,0 +1,218 @@
+import atexit
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+
+from telemetry import PROFILED_THREADS, Counter, Gauge
+
+# =========================================================
+# SAMPLING PROFILER (OPT-IN)
+# =========================================================
+#
+# Stack sampler untuk traffic /chat live, tanpa dependency tambahan:
+#   - sebagian request (sample_rate) ditandai trace.profiled=True; span
+#     telemetry mendaftarkan thread yang sedang mengerjakan request itu
+#     (termasuk task intent/embedding di EXECUTOR) ke PROFILED_THREADS
+#   - satu thread sampler membaca sys._current_frames() tiap interval_ms
+#     dan menghitung stack thread terdaftar
+#   - hasil agregat ditulis ke logs/profile-<YYYYmmdd-HH>-<pid>.collapsed
+#     (format "frame;frame;frame count" → flamegraph.pl / speedscope)
+#
+# Mati secara default (PROFILE_SAMPLE_RATE=0): biaya per request hanya satu
+# perbandingan float, dan thread sampler tidak berjalan. Nyalakan lewat env
+# atau sementara lewat POST /admin/profile.
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "logs")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_FLUSH_SECONDS = float(os.getenv("PROFILE_FLUSH_SECONDS", "30"))
+PROFILE_MAX_DEPTH = 128
+
+SAMPLES_TOTAL = Counter("ppj_profiler_samples_total", "Stack sample yang dicatat profiler")
+PROFILED_REQUESTS_TOTAL = Counter("ppj_profiler_requests_total", "Request /chat yang di-profile")
+SAMPLE_RATE = Gauge("ppj_profiler_sample_rate", "Fraksi request /chat yang di-profile")
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    def __init__(
+        self,
+        out_dir=PROFILE_DIR,
+        sample_rate=PROFILE_SAMPLE_RATE,
+        interval_ms=PROFILE_INTERVAL_MS,
+        flush_seconds=PROFILE_FLUSH_SECONDS,
+    ):
+        self.out_dir = out_dir
+        self.default_rate = sample_rate
+        self.sample_rate = sample_rate
+        self.interval_ms = interval_ms
+        self.flush_seconds = flush_seconds
+        # None = tanpa batas (mode env); diset saat diaktifkan lewat admin
+        self.expires_at = None
+        self.samples = 0
+        self._stacks = StackCounter()
+        self._bucket = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+        SAMPLE_RATE.set_function(lambda: self.sample_rate)
+
+    # ------------------------
+    # KONTROL
+    # ------------------------
+    def configure(self, sample_rate=None, interval_ms=None, duration_seconds=None):
+        """
+        Ubah sample rate / interval saat runtime. duration_seconds > 0 →
+        kembali ke rate env setelah durasi habis.
+        """
+        sample_rate = None if sample_rate is None else min(max(float(sample_rate), 0.0), 1.0)
+        interval_ms = None if interval_ms is None else max(float(interval_ms), 1.0)
+        duration_seconds = float(duration_seconds) if duration_seconds else None
+        with self._lock:
+            if sample_rate is not None:
+                self.sample_rate = sample_rate
+            if interval_ms is not None:
+                self.interval_ms = interval_ms
+            self.expires_at = time.monotonic() + duration_seconds if duration_seconds else None
+        if self.sample_rate > 0:
+            self._ensure_thread()
+        else:
+            self.flush()
+        return self.stats()
+
+    def _expire(self):
+        if self.expires_at is not None and time.monotonic() >= self.expires_at:
+            with self._lock:
+                self.sample_rate = self.default_rate
+                self.expires_at = None
+
+    def should_sample(self):
+        rate = self.sample_rate
+        if rate <= 0:
+            return False
+        self._expire()
+        return rate >= 1 or random.random() < rate
+
+    @contextmanager
+    def profile_request(self, trace):
+        """Bungkus satu request; yield True jika request ini di-profile."""
+        if not self.should_sample():
+            yield False
+            return
+
+        trace.profiled = True
+        PROFILED_REQUESTS_TOTAL.inc()
+        ident = threading.get_ident()
+        PROFILED_THREADS[ident] = "request"
+        self._ensure_thread()
+        try:
+            yield True
+        finally:
+            PROFILED_THREADS.pop(ident, None)
+
+    # ------------------------
+    # SAMPLING
+    # ------------------------
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="profiler-sampler", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        own = threading.get_ident()
+        last_flush = time.monotonic()
+        while True:
+            self._expire()
+            with self._lock:
+                if self.sample_rate <= 0 and not PROFILED_THREADS:
+                    self._thread = None
+                    break
+            self.sample(skip=own)
+            if time.monotonic() - last_flush >= self.flush_seconds:
+                self.flush()
+                last_flush = time.monotonic()
+            time.sleep(self.interval_ms / 1000)
+        self.flush()
+
+    def sample(self, skip=None):
+        frames = sys._current_frames()
+        stacks = []
+        for ident, stage in list(PROFILED_THREADS.items()):
+            frame = frames.get(ident)
+            if frame is None or ident == skip:
+                continue
+            names = []
+            while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            names.append(f"stage:{stage}")
+            stacks.append(";".join(reversed(names)))
+        if not stacks:
+            return
+
+        bucket = time.strftime("%Y%m%d-%H")
+        with self._lock:
+            if self._bucket != bucket:
+                previous = self._bucket, self._stacks
+                self._bucket, self._stacks = bucket, StackCounter()
+            else:
+                previous = None
+            self._stacks.update(stacks)
+            self.samples += len(stacks)
+        if previous and previous[0]:
+            self._write(*previous)
+        SAMPLES_TOTAL.inc(len(stacks))
+
+    # ------------------------
+    # OUTPUT
+    # ------------------------
+    def output_path(self, bucket=None):
+        bucket = bucket or self._bucket or time.strftime("%Y%m%d-%H")
+        return os.path.join(self.out_dir, f"profile-{bucket}-{os.getpid()}.collapsed")
+
+    def _write(self, bucket, stacks):
+        if not stacks:
+            return
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = self.output_path(bucket)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        os.replace(tmp, path)
+
+    def flush(self):
+        """Tulis ulang file jam berjalan dengan agregat terbaru."""
+        with self._lock:
+            bucket, stacks = self._bucket, StackCounter(self._stacks)
+        if bucket:
+            self._write(bucket, stacks)
+
+    def stats(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "default_rate": self.default_rate,
+            "interval_ms": self.interval_ms,
+            "expires_in": (
+                round(max(self.expires_at - time.monotonic(), 0), 1)
+                if self.expires_at is not None else None
+            ),
+            "running": self._thread is not None and self._thread.is_alive(),
+            "profiled_threads": len(PROFILED_THREADS),
+            "samples": self.samples,
+            "output": self.output_path(),
+        }
+
+
+PROFILER = StackSampler()
+# sisa agregat yang belum sempat di-flush saat worker berhenti
+atexit.register(PROFILER.flush)
@@ -0,0 +1,564 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from embedding_cache import EMBEDDING_DIM
+from shared_matrix import SHARED_MATRIX_PATH, ensure_published, open_shared_matrix
+from vector_store import (
+    DenseStore,
+    MappedStore,
+    PQStore,
+    ProductQuantizer,
+    pick_subspaces,
+    spill_rows,
+)
+
+DB_PATH = "chatbot.db"
+
+# cosine minimum top match supaya partisi sempit dianggap cukup
+RETRIEVAL_FALLBACK_SIMILARITY = float(os.getenv("RETRIEVAL_FALLBACK_SIMILARITY", "0.5"))
+# partisi dengan row lebih sedikit dari ini langsung dilebarkan
+RETRIEVAL_MIN_PARTITION_SIZE = int(os.getenv("RETRIEVAL_MIN_PARTITION_SIZE", "3"))
+# interval reload penuh (menangkap update priority, dedup, compaction)
+RETRIEVAL_RELOAD_SECONDS = int(os.getenv("RETRIEVAL_RELOAD_SECONDS", "300"))
+
+# penyimpanan vektor: float32 (exact) | float16 | pq
+RETRIEVAL_STORAGE = os.getenv("RETRIEVAL_STORAGE", "float32")
+# kandidat teratas yang di-rescore dengan salinan float32 (float16 / pq);
+# mode shared float16 tidak punya salinan float32 → tanpa rerank
+RETRIEVAL_RERANK = int(os.getenv("RETRIEVAL_RERANK", "50"))
+# folder file sementara untuk salinan float32 rerank (default: tempdir OS)
+RETRIEVAL_RERANK_DIR = os.getenv("RETRIEVAL_RERANK_DIR") or None
+RETRIEVAL_PQ_SUBSPACES = int(os.getenv("RETRIEVAL_PQ_SUBSPACES", "96"))
+RETRIEVAL_PQ_PATH = os.getenv("RETRIEVAL_PQ_PATH", "model/pq_codebook.npz")
+# di bawah jumlah row ini PQ tidak dilatih, pakai float16
+RETRIEVAL_PQ_MIN_ROWS = int(os.getenv("RETRIEVAL_PQ_MIN_ROWS", "4096"))
+# two-stage search: pass kasar di N dimensi pertama (Matryoshka), lalu
+# RETRIEVAL_RERANK kandidat teratas di-rescore dengan dimensi penuh. 0 = mati.
+# Hanya di mode shared: tier kasar ikut dipublish di file matrix bersama
+# (page cache, dibagi antar worker); tanpa shared tidak dibangun karena
+# menambah 4 * N byte/row di memori tiap worker
+RETRIEVAL_COARSE_DIM = int(os.getenv("RETRIEVAL_COARSE_DIM", "256"))
+# matrix embedding di-map dari file bersama (shared_matrix.py), untuk
+# deployment multi-worker. Row baru sampai RETRIEVAL_SHARED_MAX_TAIL
+# ditampung di tail privat sebelum generasi baru dipublish
+RETRIEVAL_SHARED = os.getenv("RETRIEVAL_SHARED", "0") == "1"
+RETRIEVAL_SHARED_MAX_TAIL = int(os.getenv("RETRIEVAL_SHARED_MAX_TAIL", "5000"))
+
+# =========================================================
+# HIERARCHICAL RETRIEVAL INDEX
+# =========================================================
+#
+# Corpus dipartisi per (intent_parent, intent_child). Query dicari di:
+#   1. partisi child  (intent_parent, intent_child)
+#   2. partisi parent (intent_parent)
+#   3. global
+# dan hanya melebar ke level berikutnya jika similarity top match
+# < RETRIEVAL_FALLBACK_SIMILARITY (atau partisinya terlalu kecil).
+#
+# Skoring sama dengan retrieve_top_k lama: similarity dinormalisasi
+# min-max di antara kandidat level terpilih, lalu
+# final_score = sim_norm_100 * 0.7 + priority_score * 0.3.
+
+# field milik instance (config + lock), tidak ikut ditukar saat reload
+_INSTANCE_FIELDS = ("db_path", "storage", "shared", "_lock", "_refresh_lock", "_reloader")
+
+_ROW_COLUMNS = (
+    "id", "conversation_id", "turn_index", "user_message", "admin_response",
+    "context", "intent_parent", "intent_child", "priority_score",
+)
+
+
+def fetch_retrieval_rows(after_id=0, db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT {", ".join(_ROW_COLUMNS)}, embedding
+        FROM chat_pairs
+        WHERE id > ?
+          AND canonical_id IS NULL
+          AND embedding IS NOT NULL
+        ORDER BY id
+        """,
+        (after_id,),
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def fetch_retrieval_meta(upto_id, db_path=DB_PATH):
+    """Metadata row (tanpa embedding) untuk baris matrix bersama."""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        f"""
+        SELECT {", ".join(_ROW_COLUMNS)}
+        FROM chat_pairs
+        WHERE id <= ? AND canonical_id IS NULL
+        """,
+        (upto_id,),
+    ).fetchall()
+    conn.close()
+    return {r[0]: r for r in rows}
+
+
+def _final_score(sims, priorities, sim_min, sim_max):
+    sim_norm = np.clip((sims - sim_min) / (sim_max - sim_min + 1e-6), 0.0, 1.0)
+    final = np.rint(sim_norm * 100 * 0.7 + priorities * 0.3).astype(int)
+    return sim_norm, final
+
+
+def rank_candidates(sims, priorities, k=3, rerank=0, exact_sims=None):
+    """
+    Normalisasi min-max + final_score untuk 1 set kandidat.
+
+    Jika sims hanya aproksimasi (float16 / PQ / pass kasar), kandidat
+    dengan similarity tertinggi & terendah di-rescore dulu dengan
+    exact_sims(posisi) supaya min/max normalisasi akurat, lalu `rerank`
+    kandidat teratas menurut final_score di-rescore juga.
+    Return (posisi urut final_score, sims, sim_norm, final).
+    """
+    sims = np.array(sims, dtype=np.float32)
+    n = len(sims)
+
+    if not rerank or exact_sims is None or not n:
+        sim_norm, final = _final_score(sims, priorities, float(sims.min()), float(sims.max()))
+        return np.argsort(-final, kind="stable")[:k], sims, sim_norm, final
+
+    r = min(rerank, n)
+    rescored = np.zeros(n, dtype=bool)
+
+    def rescore(positions):
+        positions = positions[~rescored[positions]]
+        if len(positions):
+            exact = exact_sims(positions)
+            # NaN = embedding asli tidak ditemukan, pakai nilai aproksimasi
+            sims[positions] = np.where(np.isnan(exact), sims[positions], exact)
+            rescored[positions] = True
+
+    rescore(np.union1d(np.argpartition(-sims, r - 1)[:r], np.argpartition(sims, r - 1)[:r]))
+    sim_min = float(sims[rescored].min())
+    sim_max = float(sims[rescored].max())
+    sim_norm, final = _final_score(sims, priorities, sim_min, sim_max)
+
+    top = np.sort(np.argsort(-final, kind="stable")[:r])
+    rescore(top)
+    sim_norm[top], final[top] = _final_score(sims[top], priorities[top], sim_min, sim_max)
+    order = top[np.argsort(-final[top], kind="stable")][:k]
+    return order, sims, sim_norm, final
+
+
+def retrieve_top_k(query_embedding, matrix, priorities, k=3):
+    """
+    Jalur exact: cosine ke semua row matrix (unit-norm float32).
+    Dipakai sebagai baseline benchmark.
+    """
+    sims = matrix @ _unit(query_embedding)
+    return rank_candidates(sims, priorities, k)
+
+
+def make_store(block, storage=RETRIEVAL_STORAGE):
+    dim = block.shape[1]
+    if storage == "pq" and len(block) >= RETRIEVAL_PQ_MIN_ROWS:
+        m = pick_subspaces(dim, RETRIEVAL_PQ_SUBSPACES)
+        pq = None
+        if os.path.exists(RETRIEVAL_PQ_PATH):
+            pq = ProductQuantizer.load(RETRIEVAL_PQ_PATH)
+            if (pq.dim, pq.m) != (dim, m):
+                pq = None
+        if pq is None:
+            t0 = time.perf_counter()
+            pq = ProductQuantizer(dim, m).fit(block)
+            pq.save(RETRIEVAL_PQ_PATH)
+            print(f"[RETRIEVAL INDEX] trained PQ m={m} on {len(block)} rows | {time.perf_counter() - t0:.1f}s")
+        return PQStore(pq)
+    if storage in ("pq", "float16"):
+        return DenseStore(dim, np.float16)
+    return DenseStore(dim, np.float32)
+
+
+class RetrievalIndex:
+    """
+    Index in-memory: vektor unit-norm (lihat vector_store) + metadata row,
+    dengan daftar posisi row per partisi (parent, child) dan parent.
+    """
+
+    def __init__(self, db_path=DB_PATH, storage=RETRIEVAL_STORAGE, shared=RETRIEVAL_SHARED):
+        self.db_path = db_path
+        self.storage = storage
+        # PQ code sudah kecil, mode shared hanya untuk store dense
+        self.shared = shared and storage != "pq"
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._reloader = None
+        self._reset()
+
+    def _reset(self):
+        self.dim = None
+        self._store = None
+        self._coarse = None
+        self._rerank = None
+        self._priority = np.zeros(0, dtype=np.float32)
+        self._n = 0
+        self.rows = []
+        self._pos_by_id = {}
+        self._by_child = {}
+        self._by_parent = {}
+        self._cache = {}
+        self._missing = []
+        self.generation = None
+        self.max_id = 0
+        self.loaded_at = 0.0
+
+    def __len__(self):
+        return self._n
+
+    # ---------------------------------------------------------
+    # LOAD / APPEND
+    # ---------------------------------------------------------
+
+    def load(self):
+        """
+        Bangun state baru di instance terpisah (tanpa lock, search tetap
+        jalan dengan state lama), lalu tukar semua field sekaligus di bawah
+        _lock supaya search tidak pernah melihat state setengah jadi.
+        """
+        t0 = time.perf_counter()
+        fresh = RetrievalIndex(self.db_path, self.storage, self.shared)
+        fresh._build()
+        with self._lock:
+            for name, value in vars(fresh).items():
+                if name not in _INSTANCE_FIELDS:
+                    setattr(self, name, value)
+        print(
+            f"[RETRIEVAL INDEX] loaded rows={self._n} | partitions={len(self._by_child)} | "
+            f"dim={self.dim} | storage={type(self._store).__name__ if self._store else None} "
+            f"{self.nbytes / 2**20:.1f}MB | shared={self.shared_nbytes / 2**20:.1f}MB | "
+            f"generation={self.generation} | "
+            f"{time.perf_counter() - t0:.2f}s"
+        )
+
+    def _build(self):
+        loaded_at = time.time()
+        shared = self._open_shared() if self.shared else None
+        if shared is not None:
+            meta = fetch_retrieval_meta(shared.max_id, self.db_path)
+            rows = fetch_retrieval_rows(shared.max_id, self.db_path)
+            self._attach_shared(shared, meta)
+        else:
+            rows = fetch_retrieval_rows(0, self.db_path)
+        self._append_rows(rows)
+        self.loaded_at = loaded_at
+
+    def _open_shared(self):
+        dtype = np.float16 if self.storage == "float16" else np.float32
+        ensure_published(
+            self.db_path,
+            SHARED_MATRIX_PATH,
+            dtype=dtype,
+            coarse_dim=RETRIEVAL_COARSE_DIM,
+            embedding_dim=EMBEDDING_DIM,
+            max_tail=RETRIEVAL_SHARED_MAX_TAIL,
+        )
+        return open_shared_matrix(SHARED_MATRIX_PATH)
+
+    def _attach_shared(self, shared, meta):
+        self.dim = shared.header["dim"]
+        self._store = MappedStore(shared.matrix)
+        if shared.coarse is not None:
+            self._coarse = MappedStore(shared.coarse)
+
+        priority = np.empty(len(shared.ids), dtype=np.float32)
+        for pos, row_id in enumerate(shared.ids.tolist()):
+            r = meta.get(row_id)
+            if r is None:
+                # row terhapus setelah publish: posisi tetap, dikeluarkan dari partisi
+                self.rows.append(None)
+                self._missing.append(pos)
+                priority[pos] = 0
+                continue
+            item = self._make_item(r)
+            self.rows.append(item)
+            self._index_item(item, pos)
+            priority[pos] = item["priority_score"]
+
+        self._priority = priority
+        self._n = len(priority)
+        self.max_id = shared.max_id
+        self.generation = shared.generation
+
+    @staticmethod
+    def _make_item(r):
+        item = dict(zip(_ROW_COLUMNS, r[:len(_ROW_COLUMNS)]))
+        item["context"] = json.loads(item["context"]) if item["context"] else []
+        if item["priority_score"] is None:
+            item["priority_score"] = 50
+        return item
+
+    def _index_item(self, item, pos):
+        self._pos_by_id[item["id"]] = pos
+        self._by_child.setdefault((item["intent_parent"], item["intent_child"]), []).append(pos)
+        self._by_parent.setdefault(item["intent_parent"], []).append(pos)
+
+    @property
+    def nbytes(self):
+        # base _rerank ada di page cache (file sementara), hanya tail yang dihitung
+        stores = (self._store, self._coarse, self._rerank)
+        return sum(s.nbytes for s in stores if s is not None)
+
+    @property
+    def shared_nbytes(self):
+        stores = (self._store, self._coarse)
+        return sum(s.shared_nbytes for s in stores if isinstance(s, MappedStore))
+
+    def refresh(self):
+        """
+        Dipanggil tiap request: hanya ambil row baru (id > max_id).
+        Reload penuh (tiap RETRIEVAL_RELOAD_SECONDS, menangkap update
+        priority / dedup / compaction) jalan di thread background; sampai
+        selesai, search memakai state lama + tail yang di-append di sini.
+        """
+        with self._refresh_lock:
+            if not self.loaded_at:
+                self.load()
+                return
+            if time.time() - self.loaded_at > RETRIEVAL_RELOAD_SECONDS:
+                self._start_reload()
+            rows = fetch_retrieval_rows(self.max_id, self.db_path)
+            if rows:
+                with self._lock:
+                    # row yang sudah ada di state hasil reload dilewati (id <= max_id)
+                    self._append_rows(rows)
+
+    def _start_reload(self):
+        if self._reloader is not None and self._reloader.is_alive():
+            return
+        self._reloader = threading.Thread(target=self._reload, name="retrieval-reload", daemon=True)
+        self._reloader.start()
+
+    def _reload(self):
+        try:
+            self.load()
+        except Exception as e:
+            # coba lagi setelah interval berikutnya, bukan di tiap request
+            print(f"[RETRIEVAL INDEX] reload gagal: {e}")
+            with self._lock:
+                self.loaded_at = time.time()
+
+    def _append_rows(self, rows):
+        vectors = []
+        for r in rows:
+            if r[0] <= self.max_id:
+                continue
+            self.max_id = r[0]
+            emb = json.loads(r[-1]) if r[-1] else []
+            if not emb:
+                continue
+            if EMBEDDING_DIM and len(emb) > EMBEDDING_DIM:
+                # corpus lama (dimensi penuh) disamakan dengan dimensi query
+                emb = emb[:EMBEDDING_DIM]
+            if self.dim is None:
+                self.dim = len(emb)
+            if len(emb) != self.dim:
+                continue
+
+            item = self._make_item(r)
+            pos = self._n + len(vectors)
+            self.rows.append(item)
+            self._index_item(item, pos)
+            vectors.append(emb)
+
+        if not vectors:
+            return
+
+        block = np.asarray(vectors, dtype=np.float32)
+        block /= np.linalg.norm(block, axis=1, keepdims=True) + 1e-12
+        prio = np.asarray(
+            [row["priority_score"] for row in self.rows[self._n:]], dtype=np.float32
+        )
+
+        if self._store is None:
+            self._store = make_store(block, self.storage)
+            if not self._store.exact:
+                # salinan float32 untuk rerank, row berikutnya masuk tail privat
+                self._rerank = MappedStore(spill_rows(block, folder=RETRIEVAL_RERANK_DIR))
+        elif self._rerank is not None:
+            self._rerank.append(block)
+        self._store.append(block)
+        if self._coarse is not None:
+            # tail privat tier kasar bersama (maks RETRIEVAL_SHARED_MAX_TAIL row)
+            self._coarse.append(_unit_rows(block[:, :self._coarse.dim]))
+        self._priority = np.concatenate([self._priority[:self._n], prio])
+        self._n += len(block)
+        self._cache = {}
+
+    def update_priorities(self, priorities):
+        """
+        Ubah priority_score in-place ({id: priority}) tanpa reload corpus,
+        mis. setelah batch /feedback. Return jumlah row yang ter-update.
+        """
+        updated = 0
+        with self._lock:
+            for row_id, priority in priorities.items():
+                pos = self._pos_by_id.get(row_id)
+                if pos is None or pos >= self._n:
+                    continue
+                self._priority[pos] = priority
+                self.rows[pos]["priority_score"] = priority
+                updated += 1
+        return updated
+
+    # ---------------------------------------------------------
+    # SEARCH
+    # ---------------------------------------------------------
+
+    def _positions(self, level, intent_parent, intent_child):
+        key = (level, intent_parent, intent_child)
+        idx = self._cache.get(key)
+        if idx is None:
+            if level == "child":
+                pos = self._by_child.get((intent_parent, intent_child), [])
+            elif level == "parent":
+                pos = self._by_parent.get(intent_parent, [])
+            elif self._missing:
+                pos = np.setdiff1d(np.arange(self._n), self._missing)
+            else:
+                return None
+            idx = np.asarray(pos, dtype=np.int64)
+            self._cache[key] = idx
+        return idx
+
+    def search(
+        self,
+        query_embedding,
+        intent_parent=None,
+        intent_child=None,
+        k=3,
+        min_similarity=RETRIEVAL_FALLBACK_SIMILARITY,
+    ):
+        """
+        Return (matches, info). matches = list dict row + similarity,
+        similarity_norm, similarity_norm_100, final_score (urut final_score).
+        info = {"level", "candidates", "best_similarity"}.
+        """
+        self.refresh()
+
+        levels = []
+        if intent_parent and intent_child:
+            levels.append(("child", intent_parent, intent_child))
+        if intent_parent:
+            levels.append(("parent", intent_parent, None))
+        levels.append(("global", None, None))
+
+        if self.dim is None or len(query_embedding) != self.dim:
+            return [], {"level": None, "candidates": 0, "best_similarity": None}
+        q = _unit(query_embedding)
+
+        with self._lock:
+            store = self._store
+            coarse = self._coarse
+            rerank = self._rerank
+            if coarse is not None:
+                q_coarse = _unit(q[:coarse.dim])
+                score = lambda positions: coarse.scores(positions, q_coarse)  # noqa: E731
+            else:
+                score = lambda positions: store.scores(positions, q)  # noqa: E731
+            priority = self._priority[:self._n]
+            rows = self.rows
+            chosen = None
+            for level, parent, child in levels:
+                idx = self._positions(level, parent, child)
+                if idx is not None and len(idx) == 0:
+                    continue
+                if idx is not None and len(idx) < RETRIEVAL_MIN_PARTITION_SIZE:
+                    chosen = chosen or (level, idx, None)
+                    continue
+                # idx None = global, scan semua row tanpa fancy-index copy
+                sims = score(idx)
+                chosen = (level, idx, sims)
+                if level == "global" or self._best_similarity(idx, sims, q) >= min_similarity:
+                    break
+
+        if chosen is None:
+            return [], {"level": None, "candidates": 0, "best_similarity": None}
+
+        level, idx, sims = chosen
+        if sims is None:
+            sims = score(idx)
+        if idx is None:
+            idx = np.arange(len(sims))
+
+        if coarse is not None:
+            exact_sims = lambda top: store.scores(idx[top], q)  # noqa: E731
+        elif rerank is not None:
+            exact_sims = lambda top: rerank.scores(idx[top], q)  # noqa: E731
+        else:
+            exact_sims = None
+
+        order, sims, sim_norm, final = rank_candidates(
+            sims,
+            priority[idx],
+            k,
+            rerank=RETRIEVAL_RERANK if exact_sims else 0,
+            exact_sims=exact_sims,
+        )
+
+        matches = []
+        for i in order:
+            item = dict(rows[idx[i]])
+            item["similarity"] = float(sims[i])
+            item["similarity_norm"] = float(sim_norm[i])
+            item["similarity_norm_100"] = float(sim_norm[i] * 100)
+            item["final_score"] = int(final[i])
+            matches.append(item)
+
+        info = {
+            "level": level,
+            "candidates": int(len(idx)),
+            "best_similarity": float(sims.max()),
+        }
+        return matches, info
+
+    def _best_similarity(self, idx, sims, q):
+        """
+        Similarity top match untuk keputusan fallback. Skor pass kasar
+        (RETRIEVAL_COARSE_DIM) tidak sebanding dengan threshold yang
+        dikalibrasi di dimensi penuh, jadi kandidat kasar teratas
+        di-rescore dulu dengan dimensi penuh.
+        """
+        if self._coarse is None:
+            return float(sims.max())
+        r = max(min(RETRIEVAL_RERANK, len(sims)), 1)
+        top = np.argpartition(-sims, r - 1)[:r]
+        positions = top if idx is None else idx[top]
+        return float(self._store.scores(positions, q).max())
+
+
+def _unit(vec):
+    v = np.asarray(vec, dtype=np.float32)
+    return v / (np.linalg.norm(v) + 1e-12)
+
+
+def _unit_rows(block):
+    return block / (np.linalg.norm(block, axis=1, keepdims=True) + 1e-12)
+
+# =========================================================
+# SHARED INSTANCE
+# =========================================================
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_retrieval_index():
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            _INDEX = RetrievalIndex()
+            _INDEX.load()
+    return _INDEX
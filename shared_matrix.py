@@ -0,0 +1,307 @@
+import argparse
+import json
+import os
+import sqlite3
+import struct
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: mode shared hanya untuk deployment gunicorn
+    fcntl = None
+
+DB_PATH = "chatbot.db"
+SHARED_MATRIX_PATH = os.getenv("RETRIEVAL_SHARED_PATH", "model/retrieval_matrix.bin")
+
+# =========================================================
+# SHARED EMBEDDING MATRIX (MEMMAP)
+# =========================================================
+#
+# Matrix embedding corpus ditulis 1x ke file, lalu di-map read-only oleh
+# semua worker (np.memmap) → halaman file dibagi lewat page cache OS,
+# RAM O(corpus) bukan O(corpus x worker).
+#
+# Layout file:
+#   header (HEADER_SIZE byte, lihat _HEADER)
+#   ids     int64[n]             id chat_pairs per baris
+#   matrix  dtype[n, dim]        embedding unit-norm
+#   coarse  float32[n, cdim]     prefix unit-norm untuk two-stage search (opsional)
+#
+# Generasi baru ditulis ke file .tmp lalu os.replace → atomik. Worker yang
+# masih memegang map generasi lama tetap valid sampai ia reload.
+
+MAGIC = b"PPJMTRX\0"
+FORMAT_VERSION = 1
+HEADER_SIZE = 4096
+ALIGN = 64
+
+# magic, format, generation, n, dim, coarse_dim, dtype_code,
+# max_id, source_count, ids_offset, matrix_offset, coarse_offset, published_at
+_HEADER = struct.Struct("<8sIQQIIIqqQQQd")
+_DTYPES = {0: np.float32, 1: np.float16}
+_DTYPE_CODES = {np.dtype(v): k for k, v in _DTYPES.items()}
+
+_LIVE_FILTER = "canonical_id IS NULL AND embedding IS NOT NULL"
+
+
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+@contextmanager
+def _locked(path):
+    """Lock antar proses supaya hanya 1 worker yang publish."""
+    if fcntl is None:
+        yield
+        return
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+# =========================================================
+# READ
+# =========================================================
+
+def read_header(path=SHARED_MATRIX_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        raw = f.read(_HEADER.size)
+    if len(raw) < _HEADER.size:
+        return None
+    (magic, fmt, generation, n, dim, coarse_dim, dtype_code, max_id, source_count,
+     ids_offset, matrix_offset, coarse_offset, published_at) = _HEADER.unpack(raw)
+    if magic != MAGIC or fmt != FORMAT_VERSION or dtype_code not in _DTYPES:
+        return None
+    return {
+        "generation": generation,
+        "n": n,
+        "dim": dim,
+        "coarse_dim": coarse_dim,
+        "dtype": np.dtype(_DTYPES[dtype_code]),
+        "max_id": max_id,
+        "source_count": source_count,
+        "ids_offset": ids_offset,
+        "matrix_offset": matrix_offset,
+        "coarse_offset": coarse_offset,
+        "published_at": published_at,
+    }
+
+
+class SharedMatrix:
+    def __init__(self, path, header):
+        self.path = path
+        self.header = header
+        n, dim = header["n"], header["dim"]
+        self.ids = np.memmap(path, dtype=np.int64, mode="r", offset=header["ids_offset"], shape=(n,))
+        self.matrix = np.memmap(
+            path, dtype=header["dtype"], mode="r", offset=header["matrix_offset"], shape=(n, dim)
+        )
+        self.coarse = None
+        if header["coarse_dim"]:
+            self.coarse = np.memmap(
+                path, dtype=np.float32, mode="r",
+                offset=header["coarse_offset"], shape=(n, header["coarse_dim"]),
+            )
+
+    @property
+    def generation(self):
+        return self.header["generation"]
+
+    @property
+    def max_id(self):
+        return self.header["max_id"]
+
+
+def open_shared_matrix(path=SHARED_MATRIX_PATH):
+    header = read_header(path)
+    if header is None or not header["n"]:
+        return None
+    return SharedMatrix(path, header)
+
+# =========================================================
+# WRITE (PUBLISH GENERASI BARU)
+# =========================================================
+
+def _live_stats(cur, upto_id=None):
+    if upto_id is None:
+        return cur.execute(f"SELECT COALESCE(MAX(id), 0), COUNT(*) FROM chat_pairs WHERE {_LIVE_FILTER}").fetchone()
+    return cur.execute(
+        f"SELECT COALESCE(MAX(id), 0), COUNT(*) FROM chat_pairs WHERE {_LIVE_FILTER} AND id <= ?",
+        (upto_id,),
+    ).fetchone()
+
+
+def _unit_rows(block):
+    return block / (np.linalg.norm(block, axis=1, keepdims=True) + 1e-12)
+
+
+def publish_from_db(
+    db_path=DB_PATH,
+    path=SHARED_MATRIX_PATH,
+    dtype=np.float32,
+    coarse_dim=0,
+    embedding_dim=None,
+    batch_size=2000,
+):
+    """
+    Tulis seluruh embedding live chat_pairs ke generasi baru (streaming,
+    tanpa menampung corpus sebagai list Python). Return header baru, atau
+    None jika belum ada embedding.
+    """
+    t0 = time.perf_counter()
+    dtype = np.dtype(dtype)
+    previous = read_header(path)
+    generation = (previous["generation"] if previous else 0) + 1
+
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    max_id, source_count = _live_stats(cur)
+    cur.execute(
+        f"SELECT id, embedding FROM chat_pairs WHERE {_LIVE_FILTER} AND id <= ? ORDER BY id",
+        (max_id,),
+    )
+
+    tmp = path + ".tmp"
+    dim = None
+    n = 0
+    ids = matrix = coarse = None
+    layout = None
+
+    while True:
+        batch = cur.fetchmany(batch_size)
+        if not batch:
+            break
+        block_ids, vectors = [], []
+        for row_id, emb_json in batch:
+            emb = json.loads(emb_json) if emb_json else []
+            if embedding_dim and len(emb) > embedding_dim:
+                emb = emb[:embedding_dim]
+            if not emb:
+                continue
+            if dim is None:
+                dim = len(emb)
+            if len(emb) != dim:
+                continue
+            block_ids.append(row_id)
+            vectors.append(emb)
+        if not vectors:
+            continue
+
+        if layout is None:
+            cdim = coarse_dim if coarse_dim and dim >= 2 * coarse_dim else 0
+            ids_offset = HEADER_SIZE
+            matrix_offset = _align(ids_offset + 8 * source_count)
+            coarse_offset = _align(matrix_offset + dtype.itemsize * dim * source_count)
+            size = coarse_offset + 4 * cdim * source_count
+            layout = (cdim, ids_offset, matrix_offset, coarse_offset)
+
+            folder = os.path.dirname(path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.truncate(max(size, HEADER_SIZE))
+            ids = np.memmap(tmp, dtype=np.int64, mode="r+", offset=ids_offset, shape=(source_count,))
+            matrix = np.memmap(tmp, dtype=dtype, mode="r+", offset=matrix_offset, shape=(source_count, dim))
+            if cdim:
+                coarse = np.memmap(tmp, dtype=np.float32, mode="r+", offset=coarse_offset, shape=(source_count, cdim))
+
+        block = _unit_rows(np.asarray(vectors, dtype=np.float32))
+        end = n + len(block)
+        ids[n:end] = block_ids
+        matrix[n:end] = block
+        if coarse is not None:
+            coarse[n:end] = _unit_rows(block[:, :layout[0]])
+        n = end
+
+    conn.close()
+    if layout is None:
+        return None
+
+    for arr in (ids, matrix, coarse):
+        if arr is not None:
+            arr.flush()
+    del ids, matrix, coarse
+
+    cdim, ids_offset, matrix_offset, coarse_offset = layout
+    with open(tmp, "r+b") as f:
+        f.write(_HEADER.pack(
+            MAGIC, FORMAT_VERSION, generation, n, dim, cdim, _DTYPE_CODES[dtype],
+            max_id, source_count, ids_offset, matrix_offset, coarse_offset, time.time(),
+        ))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+    print(
+        f"[SHARED MATRIX] published generation={generation} | rows={n} | dim={dim} | "
+        f"coarse_dim={cdim} | dtype={dtype.name} | {time.perf_counter() - t0:.1f}s"
+    )
+    return read_header(path)
+
+
+def is_stale(header, db_path=DB_PATH, dtype=np.float32, embedding_dim=None, max_tail=5000):
+    """
+    Generasi perlu dipublish ulang jika:
+      - format / dtype / dimensi berubah
+      - ada row lama yang hilang atau berubah status (compaction, dedup)
+      - row baru sejak publish lebih dari max_tail (ditampung di tail privat)
+    """
+    if header is None:
+        return True
+    if header["dtype"] != np.dtype(dtype):
+        return True
+    if embedding_dim and header["dim"] != embedding_dim:
+        return True
+
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    _, count_upto = _live_stats(cur, header["max_id"])
+    _, count_all = _live_stats(cur)
+    conn.close()
+
+    if count_upto != header["source_count"]:
+        return True
+    return count_all - count_upto > max_tail
+
+
+def ensure_published(
+    db_path=DB_PATH,
+    path=SHARED_MATRIX_PATH,
+    dtype=np.float32,
+    coarse_dim=0,
+    embedding_dim=None,
+    max_tail=5000,
+):
+    """Return header generasi terbaru, publish dulu jika sudah stale."""
+    with _locked(path):
+        header = read_header(path)
+        if not is_stale(header, db_path, dtype, embedding_dim, max_tail):
+            return header
+        return publish_from_db(db_path, path, dtype, coarse_dim, embedding_dim) or header
+
+
+if __name__ == "__main__":
+    from embedding_cache import EMBEDDING_DIM
+
+    parser = argparse.ArgumentParser(description="Publish shared embedding matrix")
+    parser.add_argument("--path", default=SHARED_MATRIX_PATH)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--coarse-dim", type=int, default=int(os.getenv("RETRIEVAL_COARSE_DIM", "256")))
+    parser.add_argument("--force", action="store_true", help="publish walaupun belum stale")
+    args = parser.parse_args()
+
+    if args.force:
+        with _locked(args.path):
+            publish_from_db(DB_PATH, args.path, args.dtype, args.coarse_dim, EMBEDDING_DIM)
+    else:
+        ensure_published(DB_PATH, args.path, args.dtype, args.coarse_dim, EMBEDDING_DIM)
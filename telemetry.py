@@ -0,0 +1,315 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# =========================================================
+# METRICS (PROMETHEUS TEXT FORMAT)
+# =========================================================
+#
+# Registry kecil in-process tanpa dependency tambahan; /metrics merender
+# format text exposition 0.0.4. Dengan gunicorn tiap worker punya
+# registry sendiri → scrape per worker, atau jalankan WEB_WORKERS=1.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# detik; stage LLM bisa puluhan detik, stage DB / retrieval milidetik
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_REGISTRY = []
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        with _REGISTRY_LOCK:
+            _REGISTRY.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: label harus {self.labelnames}, dapat {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Nilai sesaat; set_function untuk nilai yang dibaca saat scrape."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def dec(self, value=1, **labels):
+        self.inc(-value, **labels)
+
+    def set_function(self, fn, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = fn
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, fn in functions.items():
+            try:
+                values[key] = fn()
+            except Exception:
+                continue
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((k, (list(c), s, n)) for k, (c, s, n) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def render_metrics():
+    with _REGISTRY_LOCK:
+        metrics = list(_REGISTRY)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# =========================================================
+# METRIC /chat
+# =========================================================
+
+REQUESTS_TOTAL = Counter(
+    "ppj_chat_requests_total", "Request /chat per status akhir", ("status", "http_status")
+)
+REQUEST_SECONDS = Histogram(
+    "ppj_chat_request_seconds", "Durasi total request /chat (detik)", ("status",)
+)
+STAGE_SECONDS = Histogram(
+    "ppj_chat_stage_seconds", "Durasi per stage process_chat_request (detik)", ("stage",)
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "ppj_chat_queue_wait_seconds", "Waktu tunggu di CHAT_EXECUTOR sebelum diproses (detik)"
+)
+LLM_TOKENS_TOTAL = Counter(
+    "ppj_llm_tokens_total", "Token API per stage (input/output)", ("stage", "kind")
+)
+
+# =========================================================
+# REQUEST TRACE (SPAN PER STAGE)
+# =========================================================
+#
+#   trace = RequestTrace()                   # saat submit ke CHAT_EXECUTOR
+#   trace.mark_started()                     # di worker → queue wait
+#   with trace.span("retrieval"):
+#       ...
+#   EXECUTOR.submit(trace.run, "intent", classify_intent_gpt, ...)
+#   trace.finish(status, http_status)        # hanya panggilan pertama dihitung
+#
+# Span mencatat durasi (ms, akumulatif jika stage sama dipanggil lagi) dan
+# menjadikan trace + stage "aktif" di thread itu, sehingga record_tokens()
+# di handle_llm_claude / generate_embedding tahu token milik stage mana
+# tanpa argumen tambahan. Stage paralel (intent & embedding) bisa
+# overlap, jadi jumlah stage boleh > duration_ms.
+
+_local = threading.local()
+
+# thread ident → stage, hanya untuk trace dengan profiled=True (lihat
+# profiler.py); sampler membaca dict ini dari thread lain
+PROFILED_THREADS = {}
+
+
+class RequestTrace:
+    def __init__(self, cancel_token=None):
+        self.created_at = time.perf_counter()
+        # CancelToken request ini (lihat cancellation.py), ikut aktif di span
+        self.cancel_token = cancel_token
+        self.queue_wait_ms = None
+        self.status = None
+        self.stages = {}
+        self.tokens = {}
+        # diset profiler.profile_request() untuk request yang di-sample
+        self.profiled = False
+        self._lock = threading.Lock()
+
+    def mark_started(self):
+        wait = time.perf_counter() - self.created_at
+        self.queue_wait_ms = int(wait * 1000)
+        QUEUE_WAIT_SECONDS.observe(wait)
+
+    def finish(self, status, http_status):
+        """
+        Catat request ke metric. Return False jika sudah pernah di-finish
+        (mis. worker selesai setelah chat() lebih dulu membalas 504).
+        """
+        with self._lock:
+            if self.status is not None:
+                return False
+            self.status = status
+        REQUESTS_TOTAL.inc(status=status, http_status=http_status)
+        REQUEST_SECONDS.observe(time.perf_counter() - self.created_at, status=status)
+        return True
+
+    @contextmanager
+    def span(self, stage):
+        previous = (getattr(_local, "trace", None), getattr(_local, "stage", None))
+        _local.trace, _local.stage = self, stage
+        profiled = self.profiled
+        if profiled:
+            ident = threading.get_ident()
+            previous_profiled = PROFILED_THREADS.get(ident)
+            PROFILED_THREADS[ident] = stage
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - t0
+            _local.trace, _local.stage = previous
+            if profiled:
+                if previous_profiled is None:
+                    PROFILED_THREADS.pop(ident, None)
+                else:
+                    PROFILED_THREADS[ident] = previous_profiled
+            STAGE_SECONDS.observe(elapsed, stage=stage)
+            with self._lock:
+                self.stages[stage] = self.stages.get(stage, 0) + int(elapsed * 1000)
+
+    def run(self, stage, fn, *args, **kwargs):
+        """Untuk executor: jalankan fn di dalam span stage di thread worker."""
+        with self.span(stage):
+            return fn(*args, **kwargs)
+
+    def add_tokens(self, stage, input_tokens=0, output_tokens=0):
+        with self._lock:
+            usage = self.tokens.setdefault(stage, {"input": 0, "output": 0})
+            usage["input"] += input_tokens
+            usage["output"] += output_tokens
+
+    @property
+    def input_tokens(self):
+        with self._lock:
+            return sum(u["input"] for u in self.tokens.values())
+
+    @property
+    def output_tokens(self):
+        with self._lock:
+            return sum(u["output"] for u in self.tokens.values())
+
+    def log_fields(self):
+        """Kolom chat_logs untuk finalize_request_log(**trace.log_fields())."""
+        with self._lock:
+            stages = dict(self.stages)
+            tokens = {k: dict(v) for k, v in self.tokens.items()}
+        return {
+            "queue_wait_ms": self.queue_wait_ms,
+            "stage_timings": stages,
+            "input_tokens": sum(u["input"] for u in tokens.values()),
+            "output_tokens": sum(u["output"] for u in tokens.values()),
+            "token_usage": tokens,
+        }
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+def record_tokens(input_tokens=0, output_tokens=0):
+    """Catat token API ke metric + trace/stage yang sedang aktif (jika ada)."""
+    input_tokens = int(input_tokens or 0)
+    output_tokens = int(output_tokens or 0)
+    stage = getattr(_local, "stage", None) or "other"
+    if input_tokens:
+        LLM_TOKENS_TOTAL.inc(input_tokens, stage=stage, kind="input")
+    if output_tokens:
+        LLM_TOKENS_TOTAL.inc(output_tokens, stage=stage, kind="output")
+    trace = current_trace()
+    if trace is not None:
+        trace.add_tokens(stage, input_tokens, output_tokens)
@@ -0,0 +1,66 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import compaction  # noqa: E402
+import db  # noqa: E402
+import db_init  # noqa: E402
+import dedup  # noqa: E402
+import migrate_json_to_sqlite  # noqa: E402
+
+# =========================================================
+# FIXTURE DB SEMENTARA
+# =========================================================
+#
+# Modul repo memakai DB_PATH global relatif ("chatbot.db"); test
+# mengarahkannya ke tmp_path supaya chatbot.db asli tidak tersentuh.
+
+DB_MODULES = (db_init, db, dedup, compaction, migrate_json_to_sqlite)
+
+
+@pytest.fixture
+def chatbot_db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / "chatbot.db")
+    for module in DB_MODULES:
+        monkeypatch.setattr(module, "DB_PATH", path)
+    monkeypatch.setattr(compaction, "ARCHIVE_DB_PATH", str(tmp_path / "archive.db"))
+    db_init.init_db()
+    return path
+
+
+def insert_pair(path, **values):
+    """Insert 1 row chat_pairs dengan nilai default yang cukup untuk test."""
+    row = {
+        "conversation_id": 1,
+        "session_id": None,
+        "turn_index": 0,
+        "user_message": "halo",
+        "admin_response": "halo kak",
+        "priority_score": 50,
+        "reward_count": 0,
+        "punish_count": 0,
+    }
+    row.update(values)
+    cols = ", ".join(row)
+    conn = sqlite3.connect(path)
+    cur = conn.execute(
+        f"INSERT INTO chat_pairs ({cols}) VALUES ({', '.join('?' for _ in row)})",
+        list(row.values()),
+    )
+    conn.commit()
+    row_id = cur.lastrowid
+    conn.close()
+    return row_id
+
+
+def query(path, sql, params=()):
+    conn = sqlite3.connect(path)
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+    return rows
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from admission import (
+    PRIORITY_DEFAULT,
+    PRIORITY_PAYMENT,
+    AdaptiveLimiter,
+    LimiterRejected,
+    request_priority,
+)
+
+
+def test_request_priority():
+    assert request_priority("sudah transfer kak") == PRIORITY_PAYMENT
+    assert request_priority("Ini bukti bayarnya") == PRIORITY_PAYMENT
+    assert request_priority("kapan masa aktif habis?") == PRIORITY_DEFAULT
+    assert request_priority("oke", last_intent_child="kirim_bukti_bayar") == PRIORITY_PAYMENT
+    assert request_priority(None) == PRIORITY_DEFAULT
+
+
+def _start_waiter(limiter, priority, outcome, name, timeout=5.0):
+    def run():
+        try:
+            limiter.acquire(priority, timeout=timeout)
+            outcome.append((name, "admitted"))
+        except LimiterRejected as e:
+            outcome.append((name, e.reason))
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_would_wait():
+    limiter = AdaptiveLimiter("t", min_limit=1, max_limit=1, initial_limit=1)
+    assert not limiter.would_wait()
+    limiter.acquire()
+    assert limiter.would_wait()
+    limiter.release(0.1)
+    assert not limiter.would_wait()
+
+
+def test_payment_is_admitted_before_default():
+    limiter = AdaptiveLimiter("t", min_limit=1, max_limit=1, initial_limit=1)
+    limiter.acquire()
+    outcome = []
+    threads = [_start_waiter(limiter, PRIORITY_DEFAULT, outcome, "default")]
+    _wait_for(lambda: len(limiter._waiters) == 1)
+    threads.append(_start_waiter(limiter, PRIORITY_PAYMENT, outcome, "payment"))
+    _wait_for(lambda: len(limiter._waiters) == 2)
+
+    limiter.release(0.1)
+    _wait_for(lambda: len(outcome) == 1)
+    assert outcome == [("payment", "admitted")]
+    limiter.release(0.1)
+    for thread in threads:
+        thread.join()
+    assert outcome == [("payment", "admitted"), ("default", "admitted")]
+
+
+def test_full_queue_sheds_lowest_priority_first():
+    limiter = AdaptiveLimiter("t", min_limit=1, max_limit=1, initial_limit=1, max_waiting=2)
+    limiter.acquire()
+    outcome = []
+    threads = []
+    for name in ("default-1", "default-2"):
+        threads.append(_start_waiter(limiter, PRIORITY_DEFAULT, outcome, name))
+        _wait_for(lambda: len(limiter._waiters) == len(threads))
+
+    # antrean penuh: payment masuk, default terbaru yang dibuang
+    threads.append(_start_waiter(limiter, PRIORITY_PAYMENT, outcome, "payment"))
+    _wait_for(lambda: ("default-2", "shed") in outcome)
+
+    # default baru ditolak langsung karena antrean penuh oleh prioritas >= dirinya
+    with pytest.raises(LimiterRejected) as e:
+        limiter.acquire(PRIORITY_DEFAULT, timeout=1)
+    assert e.value.reason == "queue_full"
+
+    limiter.release(0.1)
+    _wait_for(lambda: ("payment", "admitted") in outcome)
+    assert ("default-1", "admitted") not in outcome
+    limiter.release(0.1)
+    for thread in threads:
+        thread.join()
+    assert outcome[-1] == ("default-1", "admitted")
+
+
+def test_wait_timeout_rejects():
+    limiter = AdaptiveLimiter("t", min_limit=1, max_limit=1, initial_limit=1)
+    limiter.acquire()
+    with pytest.raises(LimiterRejected) as e:
+        limiter.acquire(PRIORITY_PAYMENT, timeout=0.05)
+    assert e.value.reason == "timeout"
+    assert not limiter._waiters
+
+
+def test_aimd_limit():
+    limiter = AdaptiveLimiter("t", min_limit=2, max_limit=8, initial_limit=4, latency_target=1.0, backoff=0.5)
+    limiter.acquire()
+    limiter.release(0.1)
+    assert limiter.limit == pytest.approx(4.25)
+
+    limiter.acquire()
+    limiter.release(0.1, overloaded=True)
+    assert limiter.limit == pytest.approx(2.125)
+    # penurunan maks 1x per cooldown (latency_target)
+    limiter.acquire()
+    limiter.release(5.0)
+    assert limiter.limit == pytest.approx(2.125)
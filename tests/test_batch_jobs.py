@@ -0,0 +1,139 @@
+import json
+import os
+
+from batch_jobs import (
+    LocalBatchBackend,
+    finish_batch,
+    make_request,
+    parse_output_lines,
+    run_batch,
+    write_batch_files,
+)
+
+ENDPOINT = "/v1/chat/completions"
+
+
+def _requests(n):
+    return [make_request(f"row-{i}", ENDPOINT, {"n": i}) for i in range(n)]
+
+
+def _echo(url, body):
+    if body["n"] == 3:
+        raise ValueError("bad row")
+    return {"echo": body["n"]}
+
+
+def test_write_batch_files_splits_per_max(tmp_path):
+    paths = write_batch_files(_requests(5), str(tmp_path), "job", max_per_file=2)
+    assert [os.path.basename(p) for p in paths] == ["job_000.jsonl", "job_001.jsonl", "job_002.jsonl"]
+    with open(paths[-1], encoding="utf-8") as f:
+        assert [json.loads(line)["custom_id"] for line in f] == ["row-4"]
+
+
+def test_parse_output_lines_splits_results_and_errors():
+    lines = [
+        json.dumps({"custom_id": "a", "response": {"status_code": 200, "body": {"x": 1}}, "error": None}),
+        json.dumps({"custom_id": "b", "response": {"status_code": 500, "body": {"err": 1}}, "error": None}),
+        json.dumps({"custom_id": "c", "response": None, "error": {"message": "boom"}}),
+        "",
+    ]
+    results, errors = parse_output_lines(lines)
+    assert results == {"a": {"x": 1}}
+    assert errors == {"b": {"err": 1}, "c": {"message": "boom"}}
+
+
+def test_run_batch_merges_results_by_custom_id(tmp_path, monkeypatch):
+    monkeypatch.setattr(write_batch_files, "__defaults__", (2,))
+    workdir = str(tmp_path)
+    backend = LocalBatchBackend(_echo, workdir=str(tmp_path / "local"))
+
+    results, errors = run_batch(backend, _requests(5), workdir, "job", ENDPOINT, poll_interval=0)
+
+    with open(tmp_path / "job.state.json", encoding="utf-8") as f:
+        assert len(json.load(f)["batches"]) == 3
+    # hasil dari 3 file batch digabung per custom_id, bukan per urutan
+    assert results == {f"row-{i}": {"echo": i} for i in (0, 1, 2, 4)}
+    assert set(errors) == {"row-3"}
+
+    state_path = os.path.join(workdir, "job.state.json")
+    assert os.path.exists(state_path)
+    assert finish_batch(workdir, "job") is True
+    assert not os.path.exists(state_path)
+
+
+def test_failed_batch_keeps_state_and_resubmits(tmp_path):
+    workdir = str(tmp_path)
+    backend = LocalBatchBackend(lambda url, body: {"ok": body["n"]}, workdir=str(tmp_path / "local"))
+
+    class LosingBackend(LocalBatchBackend):
+        def submit(self, path, endpoint):
+            batch_id = super().submit(path, endpoint)
+            os.remove(self._output_path(batch_id))  # output hilang → status failed
+            return batch_id
+
+    losing = LosingBackend(backend.handler, workdir=backend.workdir)
+    results, errors = run_batch(losing, _requests(3), workdir, "job", ENDPOINT, poll_interval=0)
+    assert results == {}
+    assert set(errors) == {"row-0", "row-1", "row-2"}
+    assert finish_batch(workdir, "job") is False
+
+    # run berikutnya submit ulang file yang sama
+    results, errors = run_batch(backend, _requests(3), workdir, "job", ENDPOINT, poll_interval=0)
+    assert results == {f"row-{i}": {"ok": i} for i in range(3)}
+    assert errors == {}
+    assert finish_batch(workdir, "job") is True
+
+
+def test_resume_does_not_resubmit_submitted_batches(tmp_path):
+    workdir = str(tmp_path)
+    submitted = []
+
+    class CountingBackend(LocalBatchBackend):
+        def submit(self, path, endpoint):
+            submitted.append(path)
+            return super().submit(path, endpoint)
+
+    backend = CountingBackend(lambda url, body: body, workdir=str(tmp_path / "local"))
+    run_batch(backend, _requests(2), workdir, "job", ENDPOINT, poll_interval=0)
+    # state belum di-finish (mis. proses mati sebelum hasil disimpan)
+    results, _ = run_batch(backend, [], workdir, "job", ENDPOINT, poll_interval=0)
+    assert len(submitted) == 1
+    assert set(results) == {"row-0", "row-1"}
+
+
+def test_resume_adds_new_requests_instead_of_dropping_them(tmp_path):
+    workdir = str(tmp_path)
+
+    class FailingOnce(LocalBatchBackend):
+        fail = True
+
+        def submit(self, path, endpoint):
+            batch_id = super().submit(path, endpoint)
+            if self.fail:
+                os.remove(self._output_path(batch_id))
+            return batch_id
+
+    backend = FailingOnce(lambda url, body: {"ok": body["n"]}, workdir=str(tmp_path / "local"))
+    run_batch(backend, _requests(2), workdir, "job", ENDPOINT, poll_interval=0)
+    assert finish_batch(workdir, "job") is False
+
+    # run berikutnya: 2 row lama masih gagal + 2 row baru
+    backend.fail = False
+    results, errors = run_batch(backend, _requests(4), workdir, "job", ENDPOINT, poll_interval=0)
+    assert results == {f"row-{i}": {"ok": i} for i in range(4)}
+    assert errors == {}
+    assert finish_batch(workdir, "job") is True
+
+
+def test_resume_drops_failed_files_no_longer_needed(tmp_path):
+    workdir = str(tmp_path)
+    backend = LocalBatchBackend(lambda url, body: {"ok": body["n"]}, workdir=str(tmp_path / "local"))
+    paths = write_batch_files(_requests(2), workdir, "job")
+    state = {"endpoint": ENDPOINT, "batches": {paths[0]: None}}
+    with open(tmp_path / "job.state.json", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+    # row-0 & row-1 sudah selesai di checkpoint, yang tersisa hanya row-5
+    requests = [make_request("row-5", ENDPOINT, {"n": 5})]
+    results, _ = run_batch(backend, requests, workdir, "job", ENDPOINT, poll_interval=0)
+    assert results == {"row-5": {"ok": 5}}
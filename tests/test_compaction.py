@@ -0,0 +1,98 @@
+import sqlite3
+
+import compaction
+from conftest import insert_pair, query
+
+OLD = "2000-01-01 00:00:00"
+
+# semua policy kecuali yang diuji dimatikan (0)
+NO_POLICY = {
+    "max_age_days": 0,
+    "unrewarded_days": 0,
+    "punished_below": 0,
+    "conversation_cap": 0,
+}
+
+
+def _conversation(path, conversation_id, turns, **values):
+    return [
+        insert_pair(
+            path,
+            conversation_id=conversation_id,
+            turn_index=t,
+            session_id=f"s-{conversation_id}-{t}",
+            created_at=OLD,
+            **values,
+        )
+        for t in range(turns)
+    ]
+
+
+def _archived(tmp_path):
+    conn = sqlite3.connect(tmp_path / "archive.db")
+    rows = conn.execute(
+        "SELECT id, archive_reason FROM chat_pairs_archive ORDER BY id"
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def test_newest_turns_are_never_archived(chatbot_db, tmp_path):
+    ids = _conversation(chatbot_db, 1, 10)
+
+    counts = compaction.compact(**{**NO_POLICY, "unrewarded_days": 30})
+
+    keep = compaction.MIN_CONVERSATION_CAP
+    assert counts == {"never_rewarded": 10 - keep}
+    assert [r[0] for r in _archived(tmp_path)] == ids[:10 - keep]
+    assert query(chatbot_db, "SELECT turn_index FROM chat_pairs ORDER BY turn_index") == [
+        (t,) for t in range(10 - keep, 10)
+    ]
+
+
+def test_canonical_and_imported_rows_are_kept(chatbot_db, tmp_path):
+    ids = _conversation(chatbot_db, 1, 10)
+    imported = [
+        insert_pair(chatbot_db, conversation_id=2, turn_index=t, created_at=OLD)
+        for t in range(10)
+    ]
+    # ids[0] jadi kanonik sebuah duplikat → tidak boleh dipindah
+    insert_pair(chatbot_db, conversation_id=3, turn_index=0, canonical_id=ids[0])
+
+    compaction.compact(**{**NO_POLICY, "max_age_days": 30})
+
+    archived = [r[0] for r in _archived(tmp_path)]
+    assert ids[0] not in archived
+    assert archived == ids[1:4]
+    assert not set(imported) & set(archived)
+
+
+def test_recent_rows_are_kept(chatbot_db):
+    for t in range(10):
+        insert_pair(chatbot_db, conversation_id=1, turn_index=t, session_id=f"s-{t}")
+    counts = compaction.compact(**{**NO_POLICY, "unrewarded_days": 30, "conversation_cap": 6})
+    assert sum(counts.values()) == 0
+
+
+def test_policies_tag_reason(chatbot_db, tmp_path):
+    ids = _conversation(chatbot_db, 1, 8, reward_count=1)
+    conn = sqlite3.connect(chatbot_db)
+    conn.execute("UPDATE chat_pairs SET punish_count = 1, priority_score = 5 WHERE id = ?", (ids[0],))
+    conn.commit()
+    conn.close()
+
+    counts = compaction.compact(**{**NO_POLICY, "punished_below": 20, "conversation_cap": 6})
+
+    assert counts == {"punished_low_score": 1, "conversation_cap": 1}
+    assert _archived(tmp_path) == [(ids[0], "punished_low_score"), (ids[1], "conversation_cap")]
+
+
+def test_dry_run_moves_nothing(chatbot_db, tmp_path):
+    _conversation(chatbot_db, 1, 10)
+    before = query(chatbot_db, "SELECT * FROM chat_pairs ORDER BY id")
+
+    counts = compaction.compact(**{**NO_POLICY, "unrewarded_days": 30}, dry_run=True)
+
+    assert counts == {"never_rewarded": 4}
+    assert query(chatbot_db, "SELECT * FROM chat_pairs ORDER BY id") == before
+    assert _archived(tmp_path) == []
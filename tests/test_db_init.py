@@ -0,0 +1,31 @@
+import sqlite3
+
+import db_init
+from conftest import insert_pair, query
+
+
+def test_init_db_is_noop_when_schema_is_current(chatbot_db):
+    assert query(chatbot_db, "PRAGMA user_version") == [(db_init.SCHEMA_VERSION,)]
+    assert db_init.init_db() is False
+
+
+def test_duplicate_imports_are_removed_before_unique_index(chatbot_db):
+    conn = sqlite3.connect(chatbot_db)
+    conn.execute("DROP INDEX ux_import_turn")
+    conn.execute("PRAGMA user_version = 0")
+    conn.commit()
+    conn.close()
+
+    first = insert_pair(chatbot_db, conversation_id=1, turn_index=0, admin_response="v1")
+    dup_ref = insert_pair(chatbot_db, conversation_id=2, turn_index=0, canonical_id=first)
+    latest = insert_pair(chatbot_db, conversation_id=1, turn_index=0, admin_response="v2")
+    live = insert_pair(chatbot_db, conversation_id=1, turn_index=0, session_id="s-1")
+
+    db_init.init_db()
+
+    assert query(chatbot_db, "SELECT id, canonical_id FROM chat_pairs ORDER BY id") == [
+        (dup_ref, latest),
+        (latest, None),
+        (live, None),
+    ]
+    assert query(chatbot_db, "SELECT name FROM sqlite_master WHERE name = 'ux_import_turn'") == [("ux_import_turn",)]
@@ -0,0 +1,70 @@
+import json
+
+import dedup
+from conftest import insert_pair, query
+
+EMB = json.dumps([1.0, 0.0, 0.0])
+
+
+def test_normalized_response_key():
+    assert dedup.response_key("Halo  Kak!!") == dedup.response_key("halo kak")
+    assert dedup.response_key("halo kak") != dedup.response_key("halo bos")
+
+
+def test_offline_merge_replays_feedback(chatbot_db):
+    keep = insert_pair(chatbot_db, turn_index=0, embedding=EMB, reward_count=1)
+    dup = insert_pair(chatbot_db, turn_index=1, session_id="s-1", embedding=EMB, reward_count=2, punish_count=1)
+    other = insert_pair(chatbot_db, turn_index=2, admin_response="lain", embedding=EMB)
+
+    report = dedup.dedup_corpus(measure_latency=False)
+
+    assert report["duplicates"] == 1
+    assert query(
+        chatbot_db, "SELECT id, canonical_id, reward_count, punish_count, priority_score FROM chat_pairs ORDER BY id"
+    ) == [
+        (keep, None, 3, 1, 50),  # 50 + 2*5 - 10
+        (dup, keep, 0, 0, 50),  # counter sudah pindah ke kanonik
+        (other, None, 0, 0, 50),
+    ]
+
+
+def test_merged_canonical_hands_over_its_duplicates(chatbot_db):
+    old = insert_pair(chatbot_db, turn_index=0, session_id="s-1", embedding=EMB, reward_count=3)
+    old_dup = insert_pair(chatbot_db, turn_index=1, session_id="s-2", embedding=EMB, canonical_id=old)
+    # data historis (session_id NULL) diutamakan sebagai kanonik baru
+    new = insert_pair(chatbot_db, conversation_id=2, turn_index=0, embedding=EMB)
+
+    report = dedup.dedup_corpus(measure_latency=False)
+
+    assert report["repointed"] == 1
+    assert query(chatbot_db, "SELECT id, canonical_id, reward_count FROM chat_pairs ORDER BY id") == [
+        (old, new, 0),
+        (old_dup, new, 0),
+        (new, None, 3),
+    ]
+
+
+def test_dry_run_changes_nothing(chatbot_db):
+    insert_pair(chatbot_db, turn_index=0, embedding=EMB)
+    insert_pair(chatbot_db, turn_index=1, session_id="s-1", embedding=EMB)
+    before = query(chatbot_db, "SELECT id, canonical_id, priority_score FROM chat_pairs")
+
+    assert dedup.dedup_corpus(dry_run=True, measure_latency=False)["duplicates"] == 1
+    assert query(chatbot_db, "SELECT id, canonical_id, priority_score FROM chat_pairs") == before
+
+
+def test_second_run_does_not_double_count(chatbot_db):
+    keep = insert_pair(chatbot_db, turn_index=0, session_id="s-1", embedding=EMB, reward_count=3)
+    dup = insert_pair(chatbot_db, turn_index=1, session_id="s-2", embedding=EMB, reward_count=2)
+    dedup.dedup_corpus(measure_latency=False)
+    assert query(chatbot_db, "SELECT SUM(reward_count) FROM chat_pairs") == [(5,)]
+
+    # data historis masuk → kanonik lama + duplikatnya dialihkan ke sana
+    new = insert_pair(chatbot_db, conversation_id=2, turn_index=0, embedding=EMB)
+    dedup.dedup_corpus(measure_latency=False)
+
+    assert query(chatbot_db, "SELECT id, canonical_id, reward_count FROM chat_pairs ORDER BY id") == [
+        (keep, new, 0),
+        (dup, new, 0),
+        (new, None, 5),
+    ]
@@ -0,0 +1,112 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import db
+import feedback_queue
+from conftest import insert_pair, query
+from feedback_queue import FeedbackQueue
+
+
+class Recorder:
+    def __init__(self, fail_times=0):
+        self.batches = []
+        self.fail_times = fail_times
+        self.applied = threading.Event()
+
+    def __call__(self, ratings):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("db locked")
+        self.batches.append({session_id: tuple(counts) for session_id, counts in ratings.items()})
+        self.applied.set()
+
+
+def test_ratings_for_same_session_are_accumulated():
+    apply = Recorder()
+    queue = FeedbackQueue(apply, flush_interval=60)
+    queue.submit("s-1", 1)
+    queue.submit("s-2", 1)
+    queue.submit("s-1", -1)
+    queue.submit("s-1", -1)
+    assert queue.stats()["pending"] == 2
+
+    assert queue.flush() == 2
+    assert apply.batches == [{"s-1": (1, 2), "s-2": (1, 0)}]
+    assert queue.flush() == 0
+    queue.shutdown()
+
+
+def test_invalid_rating_is_rejected():
+    queue = FeedbackQueue(Recorder(), flush_interval=60)
+    with pytest.raises(ValueError):
+        queue.submit("s-1", 0)
+    assert queue.stats()["pending"] == 0
+    queue.shutdown()
+
+
+def test_max_batch_triggers_flush():
+    apply = Recorder()
+    queue = FeedbackQueue(apply, flush_interval=60, max_batch=3)
+    for i in range(3):
+        queue.submit(f"s-{i}", 1)
+    assert apply.applied.wait(2)
+    assert apply.batches == [{"s-0": (1, 0), "s-1": (1, 0), "s-2": (1, 0)}]
+    queue.shutdown()
+
+
+def test_failed_batch_is_requeued_and_added_to_newer_ratings(monkeypatch):
+    # jeda setelah batch gagal dilewati; thread flush tidak ikut jalan (interval 60s)
+    fake_time = SimpleNamespace(sleep=lambda seconds: None, perf_counter=time.perf_counter)
+    monkeypatch.setattr(feedback_queue, "time", fake_time)
+    apply = Recorder(fail_times=1)
+    queue = FeedbackQueue(apply, flush_interval=60)
+    queue.submit("s-1", 1)
+    queue.submit("s-2", 1)
+    assert queue.flush() == 0
+
+    queue.submit("s-1", -1)
+    queue.flush()
+    assert apply.batches == [{"s-1": (1, 1), "s-2": (1, 0)}]
+    queue.shutdown()
+
+
+def test_shutdown_flushes_pending_and_rejects_new():
+    apply = Recorder()
+    queue = FeedbackQueue(apply, flush_interval=60)
+    queue.submit("s-1", 1)
+    queue.shutdown()
+    assert apply.batches == [{"s-1": (1, 0)}]
+    with pytest.raises(RuntimeError):
+        queue.submit("s-2", 1)
+
+
+def test_apply_feedback_batch_targets_canonical(chatbot_db):
+    canonical = insert_pair(chatbot_db, session_id="s-1", priority_score=50)
+    duplicate = insert_pair(chatbot_db, session_id="s-2", turn_index=1, canonical_id=canonical)
+    other = insert_pair(chatbot_db, session_id="s-3", turn_index=2, priority_score=5)
+
+    priorities = db.apply_feedback_batch(
+        {"s-1": (1, 0), "s-2": (1, 0), "s-3": (0, 1), "missing": (1, 0), "s-4": (0, 0)}
+    )
+
+    assert priorities == {canonical: 60, other: 0}
+    assert query(
+        chatbot_db, "SELECT id, reward_count, punish_count FROM chat_pairs ORDER BY id"
+    ) == [(canonical, 2, 0), (duplicate, 0, 0), (other, 0, 1)]
+    assert db.apply_feedback_batch({"s-1": (0, 0)}) == {}
+
+
+def test_apply_feedback_batch_matches_one_by_one(chatbot_db):
+    batched = insert_pair(chatbot_db, session_id="s-1", priority_score=95)
+    single = insert_pair(chatbot_db, session_id="s-2", turn_index=1, priority_score=95)
+
+    db.apply_feedback_batch({"s-1": (2, 1)})
+    for rating in (1, 1, -1):
+        db.apply_feedback_db("s-2", rating)
+
+    assert query(
+        chatbot_db, "SELECT id, priority_score, reward_count, punish_count FROM chat_pairs ORDER BY id"
+    ) == [(batched, 90, 2, 1), (single, 90, 2, 1)]
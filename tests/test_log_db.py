@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+import log_db
+from conftest import query
+
+
+@pytest.fixture
+def log_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "log.db")
+    monkeypatch.setattr(log_db, "LOG_DB_PARTITION", "none")
+    monkeypatch.setattr(log_db, "LOG_DB_PATH", path)
+    monkeypatch.setattr(log_db, "LOG_DB_ASYNC", True)
+    yield path
+    log_db.stop_request_log_writer()
+
+
+def test_writes_happen_on_writer_thread_in_order(log_path, monkeypatch):
+    threads = set()
+    write_start = log_db._write_start
+
+    def record(cur, *args):
+        threads.add(threading.current_thread().name)
+        write_start(cur, *args)
+
+    monkeypatch.setattr(log_db, "_write_start", record)
+    for i in range(20):
+        log_db.start_request_log(f"r{i}", payload={"query": i}, user_query=f"q{i}")
+        log_db.finalize_request_log(f"r{i}", status="ok", http_status=200, duration_ms=120, intent_parent="perpanjang")
+    assert log_db.flush_request_logs(timeout=5)
+
+    assert threads == {"log-db-writer"}
+    assert query(log_path, "SELECT COUNT(*) FROM chat_logs WHERE status = 'ok' AND ended_at IS NOT NULL") == [(20,)]
+    assert query(log_path, "SELECT payload_json FROM chat_log_texts WHERE request_id = 'r3'") == [('{"query": 3}',)]
+    assert query(log_path, "SELECT SUM(requests) FROM chat_log_rollup_hourly") == [(20,)]
+
+
+def test_failed_operation_does_not_drop_the_batch(log_path, monkeypatch):
+    log_db.init_log_db(path=log_path)
+    batch = [
+        (log_db._write_start, "a", log_path, ("2025-01-01T00:00:00Z", None, "q", None, "{}")),
+        (log_db._write_update, "a", log_path, (["no_such_col = ?"], [1], [], [])),
+        (log_db._write_start, "b", log_path, ("2025-01-01T00:00:00Z", None, "q", None, "{}")),
+    ]
+    log_db._apply_batch(batch)
+    assert query(log_path, "SELECT request_id FROM chat_logs ORDER BY id") == [("a",), ("b",)]
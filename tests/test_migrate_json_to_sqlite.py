@@ -0,0 +1,138 @@
+import json
+import sqlite3
+
+import migrate_json_to_sqlite
+from conftest import insert_pair, query
+
+
+def _write_rows(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def _rows(n, response="halo kak"):
+    return [
+        {
+            "conversation_id": 10 + i // 2,
+            "turn_index": i % 2,
+            "user_message": f"pesan {i}",
+            "admin_response": response,
+            "context": [],
+            "intent_parent": "perpanjang",
+            "intent_child": "tanya_tagihan",
+            "priority_score": 60,
+            "embedding": [float(i), 1.0, 0.0],
+        }
+        for i in range(n)
+    ]
+
+
+def test_rerun_is_idempotent(chatbot_db, tmp_path):
+    src = tmp_path / "pairs.jsonl"
+    _write_rows(src, _rows(4))
+
+    assert migrate_json_to_sqlite.migrate(path=str(src)) == {"upserted": 4, "unchanged": 0}
+    before = query(chatbot_db, "SELECT * FROM chat_pairs ORDER BY id")
+
+    assert migrate_json_to_sqlite.migrate(path=str(src)) == {"upserted": 0, "unchanged": 4}
+    assert query(chatbot_db, "SELECT * FROM chat_pairs ORDER BY id") == before
+
+
+def test_changed_row_is_updated_in_place(chatbot_db, tmp_path):
+    src = tmp_path / "pairs.jsonl"
+    rows = _rows(4)
+    _write_rows(src, rows)
+    migrate_json_to_sqlite.migrate(path=str(src))
+    ids = query(chatbot_db, "SELECT id FROM chat_pairs ORDER BY id")
+
+    rows[1]["admin_response"] = "jawaban baru"
+    _write_rows(src, rows)
+    assert migrate_json_to_sqlite.migrate(path=str(src)) == {"upserted": 1, "unchanged": 3}
+
+    assert query(chatbot_db, "SELECT id FROM chat_pairs ORDER BY id") == ids
+    assert query(
+        chatbot_db,
+        "SELECT admin_response FROM chat_pairs WHERE conversation_id = 10 AND turn_index = 1",
+    ) == [("jawaban baru",)]
+
+
+def test_changed_row_drops_stale_duplicate_mark(chatbot_db, tmp_path):
+    src = tmp_path / "pairs.jsonl"
+    rows = _rows(2)
+    _write_rows(src, rows)
+    migrate_json_to_sqlite.migrate(path=str(src))
+    keep, dup = [r[0] for r in query(chatbot_db, "SELECT id FROM chat_pairs ORDER BY id")]
+    conn = sqlite3.connect(chatbot_db)
+    conn.execute("UPDATE chat_pairs SET canonical_id = ? WHERE id = ?", (keep, dup))
+    conn.commit()
+    conn.close()
+
+    rows[1]["admin_response"] = "jawaban baru"
+    _write_rows(src, rows)
+    migrate_json_to_sqlite.migrate(path=str(src))
+
+    assert query(chatbot_db, "SELECT canonical_id, response_key FROM chat_pairs WHERE id = ?", (dup,)) == [
+        (None, migrate_json_to_sqlite.response_key("jawaban baru"))
+    ]
+
+
+def test_upsert_keeps_feedback(chatbot_db, tmp_path):
+    src = tmp_path / "pairs.jsonl"
+    rows = _rows(2)
+    _write_rows(src, rows)
+    migrate_json_to_sqlite.migrate(path=str(src))
+
+    # skor yang sudah berubah lewat /feedback
+    conn = sqlite3.connect(chatbot_db)
+    conn.execute(
+        "UPDATE chat_pairs SET reward_count = 2, priority_score = 70 "
+        "WHERE conversation_id = 10 AND turn_index = 0"
+    )
+    conn.commit()
+    conn.close()
+
+    for row in rows:
+        row["priority_score"] = 40
+        row["user_message"] += " (revisi)"
+    _write_rows(src, rows)
+    migrate_json_to_sqlite.migrate(path=str(src))
+
+    assert query(
+        chatbot_db,
+        "SELECT turn_index, priority_score, reward_count FROM chat_pairs ORDER BY turn_index",
+    ) == [(0, 70, 2), (1, 40, 0)]
+
+
+def test_live_rows_are_not_touched(chatbot_db, tmp_path):
+    live_id = insert_pair(chatbot_db, conversation_id=10, turn_index=0, session_id="s-1")
+    src = tmp_path / "pairs.jsonl"
+    _write_rows(src, _rows(2))
+    migrate_json_to_sqlite.migrate(path=str(src))
+
+    assert query(chatbot_db, "SELECT COUNT(*) FROM chat_pairs") == [(3,)]
+    assert query(chatbot_db, "SELECT user_message FROM chat_pairs WHERE id = ?", (live_id,)) == [("halo",)]
+
+
+def test_overwrite_reloads_everything(chatbot_db, tmp_path):
+    src = tmp_path / "pairs.jsonl"
+    _write_rows(src, _rows(4))
+    migrate_json_to_sqlite.migrate(path=str(src))
+    _write_rows(src, _rows(2))
+    assert migrate_json_to_sqlite.migrate(overwrite=True, path=str(src)) == {"upserted": 2, "unchanged": 0}
+    assert query(chatbot_db, "SELECT COUNT(*) FROM chat_pairs") == [(2,)]
+
+
+def test_overwrite_keeps_live_rows_and_their_feedback(chatbot_db, tmp_path):
+    src = tmp_path / "pairs.jsonl"
+    _write_rows(src, _rows(2))
+    migrate_json_to_sqlite.migrate(path=str(src))
+    imported = query(chatbot_db, "SELECT id FROM chat_pairs ORDER BY id")[0][0]
+    live = insert_pair(
+        chatbot_db, conversation_id=99, turn_index=0, session_id="s-1", reward_count=3, canonical_id=imported
+    )
+
+    migrate_json_to_sqlite.migrate(overwrite=True, path=str(src))
+
+    assert query(chatbot_db, "SELECT COUNT(*) FROM chat_pairs WHERE session_id IS NULL") == [(2,)]
+    assert query(chatbot_db, "SELECT reward_count, canonical_id FROM chat_pairs WHERE id = ?", (live,)) == [(3, None)]
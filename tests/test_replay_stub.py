@@ -0,0 +1,88 @@
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from replay_load import INTENT_CHOICES, FakeLLM, start_fake_llm  # noqa: E402
+
+NO_LATENCY = {kind: (0.001, 0.002) for kind in ("embedding", "intent", "generation", "guard")}
+
+
+@pytest.fixture
+def stub():
+    fake = FakeLLM(dim=16, latency=NO_LATENCY)
+    server = start_fake_llm(fake)
+    yield fake, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _post(url, body):
+    req = urllib.request.Request(
+        url, data=json.dumps(body).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        return resp.status, resp.headers.get("Content-Type"), resp.read().decode("utf-8")
+
+
+def test_embeddings_are_deterministic_unit_vectors(stub):
+    fake, base = stub
+    status, _, raw = _post(f"{base}/v1/embeddings", {"model": "m", "input": ["halo", "bayar"]})
+    assert status == 200
+    data = json.loads(raw)["data"]
+    assert [d["index"] for d in data] == [0, 1]
+
+    vec = np.asarray(data[0]["embedding"], dtype=np.float32)
+    assert vec.shape == (16,)
+    assert np.linalg.norm(vec) == pytest.approx(1.0, abs=1e-5)
+    np.testing.assert_allclose(vec, fake.embedding("halo"), atol=1e-6)
+
+    _, _, again = _post(f"{base}/v1/embeddings", {"model": "m", "input": "halo"})
+    np.testing.assert_allclose(json.loads(again)["data"][0]["embedding"], vec, atol=1e-6)
+    assert fake.calls["embedding"] == 2
+
+
+def test_intent_message_uses_taxonomy(stub):
+    fake, base = stub
+    body = {"model": "m", "messages": [{"role": "user", "content": "inferred_parent / inferred_child?"}]}
+    status, _, raw = _post(f"{base}/v1/messages", body)
+    assert status == 200
+    text = json.loads(raw)["content"][0]["text"]
+    parent = text.split("inferred_parent: ")[1].split("\n")[0]
+    child = text.split("inferred_child: ")[1]
+    assert (parent, child) in INTENT_CHOICES
+    assert fake.calls == {"intent": 1}
+
+
+def test_generation_stream_events(stub):
+    fake, base = stub
+    body = {"model": "m", "system": "kamu CS", "stream": True, "messages": [{"role": "user", "content": "halo"}]}
+    status, content_type, raw = _post(f"{base}/v1/messages", body)
+    assert status == 200
+    assert content_type == "text/event-stream"
+
+    events = [line[len("event: "):] for line in raw.splitlines() if line.startswith("event: ")]
+    assert events[0] == "message_start"
+    assert events[-1] == "message_stop"
+    text = "".join(
+        json.loads(line[len("data: "):])["delta"]["text"]
+        for line in raw.splitlines()
+        if line.startswith("data: ") and '"text_delta"' in line
+    )
+    assert text == fake.completion("generation", "")
+    assert fake.calls == {"generation": 1}
+
+
+def test_error_rate_returns_overloaded(stub):
+    fake, base = stub
+    fake.error_rate = 1.0
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _post(f"{base}/v1/messages", {"model": "m", "messages": []})
+    assert e.value.code == 529
+    assert json.loads(e.value.read())["error"]["type"] == "overloaded_error"
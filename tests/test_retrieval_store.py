@@ -0,0 +1,165 @@
+import json
+import sqlite3
+
+import numpy as np
+import pytest
+
+import retrieval_store
+from conftest import insert_pair
+from retrieval_store import RetrievalIndex, rank_candidates, retrieve_top_k
+
+
+def _unit_rows(n, dim, seed=0):
+    x = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def test_rank_candidates_exact():
+    sims = np.array([0.2, 0.9, 0.5, 0.1], dtype=np.float32)
+    priorities = np.array([50, 50, 100, 50], dtype=np.float32)
+    order, _, sim_norm, final = rank_candidates(sims, priorities, k=3)
+
+    assert sim_norm[1] == pytest.approx(1.0, abs=1e-5)
+    assert sim_norm[3] == pytest.approx(0.0)
+    # final = sim_norm*70 + priority*0.3
+    assert final.tolist() == [24, 85, 65, 15]
+    assert order.tolist() == [1, 2, 0]
+
+
+def test_rank_candidates_rescores_approximate_sims():
+    exact = np.array([0.9, 0.8, 0.3, 0.1], dtype=np.float32)
+    approx = np.array([0.7, 0.85, 0.35, 0.1], dtype=np.float32)
+    priorities = np.full(4, 50, dtype=np.float32)
+    calls = []
+
+    def exact_sims(positions):
+        calls.append(sorted(positions.tolist()))
+        return exact[positions]
+
+    order, sims, _, _ = rank_candidates(approx, priorities, k=2, rerank=2, exact_sims=exact_sims)
+
+    assert order.tolist() == [0, 1]
+    assert sims[0] == pytest.approx(0.9)
+    assert calls[0] == [0, 1, 2, 3]
+
+
+def test_rank_candidates_keeps_approx_when_exact_missing():
+    approx = np.array([0.5, 0.4], dtype=np.float32)
+    order, sims, _, _ = rank_candidates(
+        approx, np.zeros(2, dtype=np.float32), k=2, rerank=2,
+        exact_sims=lambda positions: np.full(len(positions), np.nan, dtype=np.float32),
+    )
+    assert order.tolist() == [0, 1]
+    assert sims.tolist() == pytest.approx([0.5, 0.4])
+
+
+def test_retrieve_top_k_matches_brute_force():
+    matrix = _unit_rows(50, 16)
+    query = matrix[7] + 0.01
+    order, sims, _, _ = retrieve_top_k(query, matrix, np.zeros(50, dtype=np.float32), k=1)
+    assert order.tolist() == [7]
+    assert sims[7] == pytest.approx(float(matrix[7] @ (query / np.linalg.norm(query))), abs=1e-5)
+
+
+def _fill_corpus(path, vectors, first_conversation=100):
+    ids = []
+    for i, vec in enumerate(vectors):
+        parent = "perpanjang" if i % 2 else "tanya_status"
+        ids.append(insert_pair(
+            path,
+            conversation_id=first_conversation + i,
+            turn_index=0,
+            admin_response=f"jawaban {i}",
+            intent_parent=parent,
+            intent_child="a" if i % 4 < 2 else "b",
+            embedding=json.dumps(vec.tolist()),
+        ))
+    return ids
+
+
+@pytest.mark.parametrize("storage", ["float32", "float16"])
+def test_index_search_returns_nearest_row(chatbot_db, monkeypatch, storage):
+    monkeypatch.setattr(retrieval_store, "RETRIEVAL_COARSE_DIM", 0)
+    monkeypatch.setattr(retrieval_store, "EMBEDDING_DIM", 0)
+    vectors = _unit_rows(40, 32)
+    ids = _fill_corpus(chatbot_db, vectors)
+
+    index = RetrievalIndex(db_path=chatbot_db, storage=storage, shared=False)
+    index.load()
+    assert (index._rerank is not None) == (storage != "float32")
+
+    matches, info = index.search(vectors[5], intent_parent="perpanjang", k=2, min_similarity=0.9)
+    assert matches[0]["id"] == ids[5]
+    assert matches[0]["similarity"] == pytest.approx(1.0, abs=1e-4)
+    assert info["level"] == "parent"
+
+    # row baru masuk lewat refresh (append ke tail)
+    new_vec = _unit_rows(1, 32, seed=9)[0]
+    new_id = _fill_corpus(chatbot_db, [new_vec], first_conversation=500)[0]
+    index.refresh()
+    matches, _ = index.search(new_vec, k=1)
+    assert matches[0]["id"] == new_id
+
+
+def test_coarse_tier_is_not_built_without_shared_matrix(chatbot_db, monkeypatch):
+    monkeypatch.setattr(retrieval_store, "RETRIEVAL_COARSE_DIM", 8)
+    monkeypatch.setattr(retrieval_store, "EMBEDDING_DIM", 0)
+    _fill_corpus(chatbot_db, _unit_rows(4, 32))
+    index = RetrievalIndex(db_path=chatbot_db, storage="float32", shared=False)
+    index.load()
+    assert index._coarse is None
+
+
+def test_coarse_pass_does_not_decide_fallback(chatbot_db, monkeypatch, tmp_path):
+    monkeypatch.setattr(retrieval_store, "RETRIEVAL_COARSE_DIM", 8)
+    monkeypatch.setattr(retrieval_store, "EMBEDDING_DIM", 0)
+    monkeypatch.setattr(retrieval_store, "SHARED_MATRIX_PATH", str(tmp_path / "matrix.bin"))
+    vectors = _unit_rows(40, 32)
+    query = vectors[0]  # partisi "tanya_status"
+    # row "perpanjang" dengan prefix 8 dimensi sama persis, sisanya berbeda:
+    # cosine kasar 1.0, cosine penuh rendah
+    decoy = np.concatenate([query[:8], -query[8:]])
+    vectors[1] = decoy / np.linalg.norm(decoy)
+    ids = _fill_corpus(chatbot_db, vectors)
+
+    index = RetrievalIndex(db_path=chatbot_db, storage="float32", shared=True)
+    index.load()
+    assert index._coarse is not None and index._coarse.shared_nbytes
+
+    matches, info = index.search(query, intent_parent="perpanjang", k=1, min_similarity=0.95)
+    assert info["level"] == "global"
+    assert matches[0]["id"] == ids[0]
+    assert info["best_similarity"] == pytest.approx(1.0, abs=1e-4)
+
+
+def test_update_priorities_in_place(chatbot_db, monkeypatch):
+    monkeypatch.setattr(retrieval_store, "EMBEDDING_DIM", 0)
+    ids = _fill_corpus(chatbot_db, _unit_rows(4, 8))
+    index = RetrievalIndex(db_path=chatbot_db, storage="float32", shared=False)
+    index.load()
+    assert index.update_priorities({ids[1]: 90, 999: 10}) == 1
+    assert index.rows[1]["priority_score"] == 90
+    assert index._priority[1] == 90
+
+
+def test_stale_refresh_reloads_in_background(chatbot_db, monkeypatch):
+    monkeypatch.setattr(retrieval_store, "EMBEDDING_DIM", 0)
+    ids = _fill_corpus(chatbot_db, _unit_rows(4, 8))
+    index = RetrievalIndex(db_path=chatbot_db, storage="float32", shared=False)
+    index.load()
+    old_rows = index.rows
+
+    # priority berubah di DB tanpa update_priorities → hanya reload penuh yang menangkap
+    conn = sqlite3.connect(chatbot_db)
+    conn.execute("UPDATE chat_pairs SET priority_score = 90 WHERE id = ?", (ids[2],))
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(retrieval_store, "RETRIEVAL_RELOAD_SECONDS", -1)
+
+    index.refresh()
+    index._reloader.join(timeout=5)
+
+    assert index.rows is not old_rows
+    assert index.rows[2]["priority_score"] == 90
+    assert index._priority[2] == 90
+    assert len(index) == 4
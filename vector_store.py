@@ -0,0 +1,248 @@
+import os
+import tempfile
+
+import numpy as np
+
+# jumlah row yang di-cast ke float32 per langkah scoring,
+# supaya scan global tidak membuat salinan matrix penuh
+SCORE_CHUNK_ROWS = 8192
+
+# =========================================================
+# DENSE STORE (FLOAT32 / FLOAT16)
+# =========================================================
+#
+# Semua store menyimpan vektor unit-norm, jadi dot product = cosine.
+# Interface yang dipakai RetrievalIndex:
+#   append(block)      → tambah vektor float32 (n, dim)
+#   scores(idx, q)     → similarity untuk posisi idx (idx=None → semua)
+#   exact              → False jika similarity hanya aproksimasi
+#   nbytes             → memori yang dipakai vektor
+
+
+def _chunked_scores(data, idx, total, q):
+    out = np.empty(total, dtype=np.float32)
+    for start in range(0, total, SCORE_CHUNK_ROWS):
+        end = min(start + SCORE_CHUNK_ROWS, total)
+        rows = data[start:end] if idx is None else data[idx[start:end]]
+        out[start:end] = rows.astype(np.float32, copy=False) @ q
+    return out
+
+
+def _grow(buf, needed, n):
+    if needed <= len(buf):
+        return buf
+    capacity = max(needed, 2 * len(buf), 1024)
+    out = np.zeros((capacity,) + buf.shape[1:], dtype=buf.dtype)
+    if n:
+        out[:n] = buf[:n]
+    return out
+
+
+class DenseStore:
+    def __init__(self, dim, dtype=np.float32):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.exact = self.dtype == np.float32
+        self._data = np.zeros((0, dim), dtype=self.dtype)
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def nbytes(self):
+        return self.n * self.dim * self.dtype.itemsize
+
+    def append(self, block):
+        needed = self.n + len(block)
+        self._data = _grow(self._data, needed, self.n)
+        self._data[self.n:needed] = block
+        self.n = needed
+
+    def scores(self, idx, q):
+        return _chunked_scores(self._data, idx, self.n if idx is None else len(idx), q)
+
+
+class MappedStore:
+    """
+    Vektor read-only dari file memmap (dibagi antar worker lewat page cache,
+    lihat shared_matrix.py) + tail privat untuk row baru sejak publish.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.dim = base.shape[1]
+        self.dtype = base.dtype
+        self.exact = self.dtype == np.float32
+        self._tail = DenseStore(self.dim, self.dtype)
+
+    def __len__(self):
+        return len(self.base) + self._tail.n
+
+    @property
+    def n(self):
+        return len(self)
+
+    @property
+    def nbytes(self):
+        # hanya memori privat; base dihitung sekali untuk semua worker
+        return self._tail.nbytes
+
+    @property
+    def shared_nbytes(self):
+        return self.base.nbytes
+
+    def append(self, block):
+        self._tail.append(block)
+
+    def scores(self, idx, q):
+        n_base = len(self.base)
+        if idx is None:
+            base = _chunked_scores(self.base, None, n_base, q)
+            return np.concatenate([base, self._tail.scores(None, q)])
+        out = np.empty(len(idx), dtype=np.float32)
+        in_base = idx < n_base
+        out[in_base] = _chunked_scores(self.base, idx[in_base], int(in_base.sum()), q)
+        if not in_base.all():
+            out[~in_base] = self._tail.scores(idx[~in_base] - n_base, q)
+        return out
+
+
+def spill_rows(block, dtype=np.float32, folder=None):
+    """
+    Salin block ke file sementara (langsung di-unlink) lalu map read-only.
+    Dipakai untuk salinan full-precision rerank di samping store terkompresi:
+    halaman file ada di page cache (bisa di-evict, ikut ter-fork tanpa
+    salinan), bukan di heap worker.
+    """
+    if not len(block):
+        return np.zeros((0, block.shape[1]), dtype=dtype)
+    with tempfile.TemporaryFile(dir=folder) as f:
+        out = np.memmap(f, dtype=dtype, mode="w+", shape=block.shape)
+        out[:] = block
+        out.flush()
+        del out
+        return np.memmap(f, dtype=dtype, mode="r", shape=block.shape)
+
+# =========================================================
+# PRODUCT QUANTIZATION
+# =========================================================
+#
+# Vektor dipecah jadi m sub-vektor, tiap sub-vektor diganti id centroid
+# (1 byte, ks=256). 3072 dim float32 (12KB) → m=96 byte per row.
+# Similarity dihitung asimetris (ADC): query tetap float32, dibandingkan
+# dengan centroid lewat lookup table (m, ks).
+
+def pick_subspaces(dim, m):
+    """m terbesar <= m yang membagi habis dim."""
+    m = max(1, min(m, dim))
+    while dim % m:
+        m -= 1
+    return m
+
+
+def _kmeans(x, k, iters, rng):
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iters):
+        dist = (
+            (x * x).sum(axis=1, keepdims=True)
+            - 2 * x @ centroids.T
+            + (centroids * centroids).sum(axis=1)
+        )
+        assign = dist.argmin(axis=1)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.stack(
+            [np.bincount(assign, weights=x[:, d], minlength=k) for d in range(x.shape[1])],
+            axis=1,
+        )
+        nonempty = counts > 0
+        # cluster kosong mempertahankan centroid lama
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+    return centroids
+
+
+class ProductQuantizer:
+    def __init__(self, dim, m, ks=256):
+        if dim % m:
+            raise ValueError(f"dim {dim} tidak habis dibagi m={m}")
+        self.dim = dim
+        self.m = m
+        self.ks = ks
+        self.sub = dim // m
+        self.codebooks = None  # (m, ks, sub)
+
+    def fit(self, x, iters=15, sample=20000, seed=0):
+        x = np.asarray(x, dtype=np.float32)
+        if len(x) < self.ks:
+            raise ValueError(f"butuh minimal {self.ks} vektor untuk training PQ, ada {len(x)}")
+        rng = np.random.default_rng(seed)
+        if len(x) > sample:
+            x = x[rng.choice(len(x), size=sample, replace=False)]
+        self.codebooks = np.stack([
+            _kmeans(x[:, j * self.sub:(j + 1) * self.sub], self.ks, iters, rng)
+            for j in range(self.m)
+        ])
+        return self
+
+    def encode(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        codes = np.empty((len(x), self.m), dtype=np.uint8)
+        for start in range(0, len(x), SCORE_CHUNK_ROWS):
+            chunk = x[start:start + SCORE_CHUNK_ROWS]
+            for j in range(self.m):
+                sub = chunk[:, j * self.sub:(j + 1) * self.sub]
+                cb = self.codebooks[j]
+                dist = (cb * cb).sum(axis=1) - 2 * sub @ cb.T
+                codes[start:start + len(chunk), j] = dist.argmin(axis=1)
+        return codes
+
+    def lookup_table(self, q):
+        q = np.asarray(q, dtype=np.float32).reshape(self.m, self.sub)
+        return np.einsum("mkd,md->mk", self.codebooks, q)
+
+    def save(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, codebooks=self.codebooks, dim=self.dim, m=self.m, ks=self.ks)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        pq = cls(int(data["dim"]), int(data["m"]), int(data["ks"]))
+        pq.codebooks = data["codebooks"].astype(np.float32)
+        return pq
+
+
+class PQStore:
+    exact = False
+
+    def __init__(self, pq):
+        self.pq = pq
+        self.dim = pq.dim
+        self._codes = np.zeros((0, pq.m), dtype=np.uint8)
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def nbytes(self):
+        return self.n * self.pq.m + self.pq.codebooks.nbytes
+
+    def append(self, block):
+        codes = self.pq.encode(block)
+        needed = self.n + len(codes)
+        self._codes = _grow(self._codes, needed, self.n)
+        self._codes[self.n:needed] = codes
+        self.n = needed
+
+    def scores(self, idx, q):
+        table = self.pq.lookup_table(q)
+        codes = self._codes[:self.n] if idx is None else self._codes[idx]
+        out = np.zeros(len(codes), dtype=np.float32)
+        for j in range(self.pq.m):
+            out += table[j, codes[:, j]]
+        return out
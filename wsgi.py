@@ -0,0 +1,91 @@
+import importlib
+import logging
+import os
+import signal
+import time
+
+# =========================================================
+# PRODUCTION ENTRY POINT
+# =========================================================
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Master (preload_app): import modul app, init schema, load retrieval index
+# → worker hasil fork berbagi memori itu (copy-on-write / memmap).
+# Worker: warmup() sendiri setelah fork (koneksi HTTP tidak boleh dibagi
+# antar proses), lalu shutdown() saat SIGTERM untuk drain executor & log.
+
+APP_MODULE = os.getenv("APP_MODULE", "main_flask_claude")
+# executor yang di-drain saat shutdown, urut: request dulu, lalu sub-task,
+# lalu feedback yang belum diterapkan
+EXECUTOR_NAMES = ("CHAT_EXECUTOR", "EXECUTOR", "FEEDBACK_QUEUE")
+
+logger = logging.getLogger("perpanjangan-chatbot")
+
+_module = None
+
+
+def create_app(module_name=APP_MODULE, preload_index=True):
+    global _module
+    _module = importlib.import_module(module_name)
+
+    if preload_index:
+        from retrieval_store import get_retrieval_index
+        t0 = time.perf_counter()
+        index = get_retrieval_index()
+        logger.info(f"[PRELOAD] retrieval index rows={len(index)} in {time.perf_counter() - t0:.2f}s")
+
+    return _module.app
+
+
+def warmup(background=False):
+    """
+    background=True: worker langsung menerima request, client & koneksi
+    disiapkan di thread terpisah (request pertama menunggu lock client).
+    """
+    if _module is None:
+        return False
+    if background and hasattr(_module, "start_background_warmup"):
+        _module.start_background_warmup()
+        return True
+    if hasattr(_module, "warmup"):
+        return _module.warmup()
+    return False
+
+
+def shutdown(wait=True):
+    """
+    Tunggu request yang sedang diproses selesai (executor tidak menerima
+    task baru), lalu kosongkan queue log DB (chat_logs) & queue logging.
+    """
+    if _module is None:
+        return
+    t0 = time.perf_counter()
+    for name in EXECUTOR_NAMES:
+        executor = getattr(_module, name, None)
+        if executor is not None:
+            executor.shutdown(wait=wait)
+    logger.info(f"[SHUTDOWN] executors drained in {time.perf_counter() - t0:.2f}s")
+    from log_db import stop_request_log_writer
+    stop_request_log_writer()
+    from logging_setup import stop_logging
+    stop_logging()
+    logging.shutdown()
+
+
+def install_signal_handlers():
+    """Untuk server tanpa hook worker_exit (mis. dijalankan langsung)."""
+    def _handle(signum, frame):
+        shutdown()
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, _handle)
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    install_signal_handlers()
+    warmup()
+    app.run(host=os.getenv("HOST", "127.0.0.1"), port=int(os.getenv("PORT", "8080")), threaded=True)